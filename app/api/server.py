@@ -0,0 +1,484 @@
+"""
+server.py
+---------
+API HTTP sin Streamlit para clientes móviles, LMS y otros servicios.
+
+Usa el mismo evaluador que las páginas (`get_evaluator()`): misma caché de
+evaluaciones, mismo planificador de cuota (peticiones simultáneas, por
+segundo, reintentos) y mismo historial (`get_history_store()`). En un proceso
+aparte comparte con la interfaz la caché y el historial si están en SQLite o
+Redis; los límites de cuota son por proceso.
+
+El audio se envía como cuerpo de la petición (WAV PCM, `Content-Type: audio/wav`)
+o como campo `audio` de un formulario multipart. El cuerpo se recibe por
+partes: en cuanto supera API_MAX_UPLOAD_BYTES se responde 413 y el resto se
+descarta sin guardarlo en memoria. Los parámetros van en la URL o en el formulario.
+
+Rutas:
+
+    POST   /v1/validate                          -> formato y duración del audio
+    POST   /v1/evaluate?phrase=..&language=..    -> evaluación (con user_id se guarda en el historial)
+    GET    /v1/history/<user_id>                 -> historial (language, since, until, limit, offset)
+    GET    /v1/history/<user_id>/<id>            -> una evaluación
+    GET    /v1/history/<user_id>/<id>/audio      -> su grabación en WAV
+    DELETE /v1/history/<user_id>                 -> borra el historial
+    GET    /health                               -> configuración, caché y recursos de Speech
+    GET    /metrics                              -> métricas Prometheus
+
+Las respuestas son JSON con "success" y "error", como los resultados del
+evaluador.
+
+Autenticación: con API_TOKEN definida todas las rutas salvo /health exigen
+`Authorization: Bearer <token>`, donde el token es:
+
+- API_TOKEN: acceso a todo (un LMS o servicio que actúa por sus usuarios).
+- Un token de usuario (`user_token`, o `--issue-token <user_id>`): solo puede
+  leer y borrar el historial de ese usuario y guardar evaluaciones en él.
+
+Sin API_TOKEN no hay autenticación, así que el servidor solo acepta escuchar
+en una dirección local (127.0.0.1 por defecto).
+
+Uso (desde la raíz del repositorio, o en la imagen Docker):
+
+    python -m app.api.server --port 8080
+    API_TOKEN=... python -m app.api.server --address 0.0.0.0
+    API_TOKEN=... python -m app.api.server --issue-token alumno01
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import time
+
+import tornado.httputil
+import tornado.web
+
+from app.services.audio_store import get_audio_store
+from app.services.history import get_history_store
+from app.services.metrics import Counter, Histogram, register, render_metrics, span
+from app.services.scheduler import PRIORITY_INTERACTIVE
+from app.services.speech import get_evaluator
+from app.utils.languages_phrases import LANGUAGE_OPTIONS
+from app.utils.validation import MAX_AUDIO_SIZE, validate_audio_bytes
+
+DEFAULT_PORT = 8080
+DEFAULT_ADDRESS = "127.0.0.1"
+DEFAULT_MAX_UPLOAD = 20 * 1024 * 1024
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Errores del planificador que indican falta de cuota: el cliente puede reintentar
+RETRYABLE_CODES = ("CircuitOpen", "QueueTimeout", "TooManyRequests")
+RETRY_AFTER = 5
+
+# Principal del token API_TOKEN (o de cualquier petición si no hay autenticación)
+ADMIN = object()
+
+API_REQUESTS = register(Counter(
+    "pronunciation_api_requests_total", "Peticiones a la API por ruta y código HTTP", ("route", "status")
+))
+API_SECONDS = register(Histogram(
+    "pronunciation_api_request_seconds", "Duración de las peticiones a la API por ruta", ("route",)
+))
+
+
+def serialize_entry(entry):
+    """Entrada del historial en JSON (la evaluación con el esquema de Azure)"""
+    assessment = entry["assessment"]
+    return {
+        "id": entry["id"],
+        "created": entry["created"],
+        "timestamp": entry["timestamp"],
+        "phrase": entry["phrase"],
+        "language": entry["language"],
+        "scores": _scores(assessment),
+        "assessment": assessment.to_json(),
+        "has_audio": bool(entry["audio_ref"]),
+    }
+
+
+def _scores(assessment):
+    return {
+        "pron_score": assessment.pron_score,
+        "accuracy_score": assessment.accuracy_score,
+        "fluency_score": assessment.fluency_score,
+        "completeness_score": assessment.completeness_score,
+        "prosody_score": assessment.prosody_score,
+    }
+
+
+def user_token(api_token, user_id):
+    """Token que solo da acceso a los datos de `user_id` (firmado con API_TOKEN)"""
+    signature = hmac.new(api_token.encode(), user_id.encode(), hashlib.sha256).hexdigest()
+    return f"{user_id}.{signature}"
+
+
+def token_principal(api_token, supplied):
+    """
+    A quién pertenece el token: ADMIN para API_TOKEN, el user_id para un token
+    de usuario válido o None si no es válido.
+    """
+    if hmac.compare_digest(supplied.encode(), api_token.encode()):
+        return ADMIN
+    user_id, _, _ = supplied.rpartition(".")
+    if user_id and hmac.compare_digest(supplied.encode(), user_token(api_token, user_id).encode()):
+        return user_id
+    return None
+
+
+def is_loopback(address):
+    if address == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(address).is_loopback
+    except ValueError:
+        return False
+
+
+def save_evaluation(history, user_id, phrase, language, assessment, audio_bytes):
+    """Guarda la evaluación en `history` (y su audio); se ejecuta fuera del event loop"""
+    audio_ref = get_audio_store().put(audio_bytes)
+    return history.add(user_id, phrase, language, assessment, audio_ref)
+
+
+def _parse_form(content_type, body):
+    arguments, files = {}, {}
+    tornado.httputil.parse_body_arguments(content_type, bytes(body), arguments, files)
+    return arguments, files
+
+
+def _run_blocking(fn, *args):
+    """SQLite, Redis y la compresión del audio bloquean: se llevan a un hilo"""
+    return asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+class ApiHandler(tornado.web.RequestHandler):
+
+    def initialize(self, route):
+        self.route = route
+        self._start = time.perf_counter()
+
+    @property
+    def evaluator(self):
+        return self.settings["evaluator"]
+
+    @property
+    def history(self):
+        return self.settings["history"]
+
+    def prepare(self):
+        token = self.settings.get("api_token")
+        self.principal = ADMIN
+        if token and self.route != "health":
+            scheme, _, supplied = self.request.headers.get("Authorization", "").partition(" ")
+            self.principal = token_principal(token, supplied) if scheme == "Bearer" else None
+            if self.principal is None:
+                self.send_json(401, {"success": False, "error": "Token de acceso no válido"})
+
+    def can_access(self, user_id):
+        """El token da acceso a los datos de `user_id`; si no, responde 403"""
+        if self.principal is ADMIN or self.principal == user_id:
+            return True
+        self.fail(403, "El token no da acceso a los datos de este usuario")
+        return False
+
+    def send_json(self, status, payload):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps(payload, ensure_ascii=False, default=str))
+
+    def fail(self, status, error, **extra):
+        self.send_json(status, {"success": False, "error": error, **extra})
+
+    def write_error(self, status_code, **kwargs):
+        # Errores de Tornado (404, 405, 413...) y excepciones no controladas, también en JSON
+        exception = kwargs.get("exc_info", (None, None))[1]
+        if isinstance(exception, tornado.web.HTTPError) and exception.log_message:
+            error = exception.log_message
+        elif status_code >= 500:
+            error = "Error interno del servidor"
+        else:
+            error = self._reason
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps({"success": False, "error": error}, ensure_ascii=False))
+
+    def on_finish(self):
+        API_REQUESTS.inc(route=self.route, status=self.get_status())
+        API_SECONDS.observe(time.perf_counter() - self._start, route=self.route)
+
+    def param(self, name, default=None):
+        value = self.get_argument(name, None)
+        if value is None:
+            value = self.fields.get(name) if hasattr(self, "fields") else None
+        return value if value not in (None, "") else default
+
+    def number_param(self, name, default=None, cast=float):
+        value = self.param(name)
+        if value is None:
+            return default
+        try:
+            return cast(value)
+        except ValueError:
+            raise tornado.web.HTTPError(400, f"Parámetro no válido: {name}") from None
+
+
+@tornado.web.stream_request_body
+class UploadHandler(ApiHandler):
+    """Recibe el audio por partes con un tamaño máximo"""
+
+    def prepare(self):
+        super().prepare()
+        if self._finished:
+            return
+        self.max_upload = self.settings["max_upload_bytes"]
+        length = self.request.headers.get("Content-Length")
+        if length is not None and length.isdigit() and int(length) > self.max_upload:
+            self.fail(413, f"Archivo demasiado grande (máximo {self.max_upload} bytes)")
+            return
+        # Sin Content-Length (chunked) el límite lo aplica data_received: Tornado
+        # solo corta en MAX_AUDIO_SIZE, y sin respuesta
+        self.request.connection.set_max_body_size(MAX_AUDIO_SIZE)
+        self.body = bytearray()
+        self.fields = {}
+
+    def data_received(self, chunk):
+        if self._finished:
+            # Ya se ha respondido (401, 413): el resto del cuerpo se descarta
+            return
+        if len(self.body) + len(chunk) > self.max_upload:
+            self.body = None
+            self.fail(413, f"Archivo demasiado grande (máximo {self.max_upload} bytes)")
+            return
+        self.body.extend(chunk)
+
+    async def audio(self):
+        """
+        Audio de la petición: el cuerpo tal cual o el campo `audio` del formulario.
+        None si ya se ha respondido con un error mientras se recibía.
+        """
+        if self._finished:
+            return None
+        content_type = self.request.headers.get("Content-Type", "")
+        if not content_type.startswith("multipart/form-data"):
+            return self.body
+        # Copiar y trocear un formulario de varios MB bloquea: se hace en un hilo
+        arguments, files = await _run_blocking(_parse_form, content_type, self.body)
+        self.fields = {name: values[-1].decode("utf-8", "replace") for name, values in arguments.items()}
+        uploads = files.get("audio")
+        return uploads[0]["body"] if uploads else b""
+
+
+class ValidateHandler(UploadHandler):
+
+    async def post(self):
+        audio_bytes = await self.audio()
+        if audio_bytes is None:
+            return
+        with span("validate"):
+            validation = validate_audio_bytes(audio_bytes)
+        self.send_json(200 if validation["valid"] else 422, {"success": validation["valid"], **validation})
+
+
+class EvaluateHandler(UploadHandler):
+
+    async def post(self):
+        audio_bytes = await self.audio()
+        if audio_bytes is None:
+            return
+        phrase = (self.param("phrase") or "").strip()
+        language = self.param("language", "en-US")
+        # Con un token de usuario las evaluaciones se guardan en su historial
+        user_id = self.param("user_id", None if self.principal is ADMIN else self.principal)
+        if user_id and not self.can_access(user_id):
+            return
+        if not phrase:
+            return self.fail(400, "Falta la frase de referencia (phrase)")
+        if language not in LANGUAGE_OPTIONS.values():
+            return self.fail(400, f"Idioma no soportado: {language}")
+        if not self.evaluator.is_configured:
+            return self.fail(503, self.evaluator.get_configuration_status()["message"])
+
+        with span("validate"):
+            validation = validate_audio_bytes(audio_bytes)
+        if not validation["valid"]:
+            return self.fail(422, validation["error"], validation=validation)
+
+        # El cliente espera la respuesta: por delante de los lotes y la cola de trabajos sin prioridad
+        result = await self.evaluator.evaluate_pronunciation_async(
+            bytes(audio_bytes), phrase, language, priority=PRIORITY_INTERACTIVE
+        )
+        if not result["success"]:
+            if result.get("error_code") in RETRYABLE_CODES:
+                self.set_header("Retry-After", str(RETRY_AFTER))
+                return self.fail(503, result["error"], error_code=result["error_code"])
+            return self.fail(502, result["error"], error_code=result.get("error_code"))
+
+        assessment = result["assessment"]
+        payload = {
+            "success": True,
+            "error": None,
+            "phrase": phrase,
+            "language": language,
+            "duration": validation["duration"],
+            "scores": _scores(assessment),
+            "assessment": result["json_result"],
+            "cached": bool(result.get("cached")),
+            "preprocessing": result.get("preprocessing"),
+            "timings": result.get("timings"),
+            "history_id": None,
+        }
+        if user_id and self.param("save", "1") not in ("0", "false", "no"):
+            try:
+                entry = await _run_blocking(
+                    save_evaluation, self.history, user_id, phrase, language, assessment, bytes(audio_bytes)
+                )
+                payload["history_id"] = entry["id"]
+            except Exception as e:
+                # La evaluación ya está hecha: se devuelve aunque no se haya podido guardar
+                payload["error"] = f"Error al guardar en historial: {str(e)}"
+        self.send_json(200, payload)
+
+
+class HistoryHandler(ApiHandler):
+
+    async def get(self, user_id):
+        if not self.can_access(user_id):
+            return
+        language = self.param("language")
+        since = self.number_param("since")
+        until = self.number_param("until")
+        limit = self.number_param("limit", DEFAULT_PAGE_SIZE, int)
+        offset = self.number_param("offset", 0, int)
+        # SQLite trata LIMIT -1 como "sin límite": los negativos se rechazan
+        if limit < 1:
+            return self.fail(400, "Parámetro no válido: limit (debe ser >= 1)")
+        if offset < 0:
+            return self.fail(400, "Parámetro no válido: offset (debe ser >= 0)")
+        limit = min(limit, MAX_PAGE_SIZE)
+
+        def query():
+            return (
+                self.history.count(user_id, language, since, until),
+                self.history.list(user_id, language, since, until, limit=limit, offset=offset),
+            )
+
+        total, entries = await _run_blocking(query)
+        self.send_json(200, {
+            "success": True,
+            "error": None,
+            "total": total,
+            "offset": offset,
+            "entries": [serialize_entry(e) for e in entries],
+        })
+
+    async def delete(self, user_id):
+        if not self.can_access(user_id):
+            return
+        await _run_blocking(self.history.clear, user_id)
+        self.send_json(200, {"success": True, "error": None})
+
+
+class HistoryEntryHandler(ApiHandler):
+
+    async def get(self, user_id, entry_id, audio=None):
+        if not self.can_access(user_id):
+            return
+        entry = await _run_blocking(self.history.get, user_id, int(entry_id))
+        if entry is None:
+            return self.fail(404, "Evaluación no encontrada")
+        if not audio:
+            return self.send_json(200, {"success": True, "error": None, **serialize_entry(entry)})
+
+        wav = await _run_blocking(get_audio_store().get_wav, entry["audio_ref"]) if entry["audio_ref"] else None
+        if wav is None:
+            return self.fail(404, "Grabación no disponible")
+        self.set_header("Content-Type", "audio/wav")
+        self.finish(wav)
+
+
+class HealthHandler(ApiHandler):
+
+    def get(self):
+        status = self.evaluator.get_configuration_status()
+        self.send_json(200 if self.evaluator.is_configured else 503, {
+            "success": self.evaluator.is_configured,
+            "error": None if self.evaluator.is_configured else status["message"],
+            "backend": self.evaluator.backend.name,
+            "message": status["message"],
+            "cache": self.evaluator.get_cache_stats(),
+            "inflight": self.evaluator.get_inflight_stats(),
+            "endpoints": self.evaluator.get_backend_stats(),
+        })
+
+
+class NotFoundHandler(ApiHandler):
+
+    def prepare(self):
+        raise tornado.web.HTTPError(404, "Ruta no encontrada")
+
+
+class MetricsHandler(ApiHandler):
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(render_metrics())
+
+
+def make_app(evaluator=None, history=None, max_upload_bytes=None, api_token=None):
+    """Aplicación Tornado; sin argumentos usa el evaluador e historial compartidos y las variables API_*"""
+    if max_upload_bytes is None:
+        max_upload_bytes = int(os.getenv("API_MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD))
+    return tornado.web.Application(
+        [
+            (r"/v1/validate", ValidateHandler, {"route": "validate"}),
+            (r"/v1/evaluate", EvaluateHandler, {"route": "evaluate"}),
+            (r"/v1/history/([^/]+)", HistoryHandler, {"route": "history"}),
+            (r"/v1/history/([^/]+)/(\d+)(/audio)?", HistoryEntryHandler, {"route": "history_entry"}),
+            (r"/health", HealthHandler, {"route": "health"}),
+            (r"/metrics", MetricsHandler, {"route": "metrics"}),
+        ],
+        default_handler_class=NotFoundHandler,
+        default_handler_args={"route": "not_found"},
+        evaluator=evaluator or get_evaluator(),
+        history=history or get_history_store(),
+        # Nunca por encima del máximo que acepta la validación
+        max_upload_bytes=min(max_upload_bytes, MAX_AUDIO_SIZE),
+        api_token=api_token if api_token is not None else os.getenv("API_TOKEN"),
+    )
+
+
+async def serve(port, address):
+    app = make_app()
+    app.listen(port, address, max_body_size=MAX_AUDIO_SIZE, xheaders=True)
+    print(f"API de evaluación escuchando en http://{address}:{port}")
+    await asyncio.Event().wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API HTTP de evaluación de pronunciación")
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", DEFAULT_PORT)))
+    parser.add_argument("--address", default=os.getenv("API_ADDR", DEFAULT_ADDRESS))
+    parser.add_argument("--issue-token", metavar="USER_ID", help="Muestra el token de un usuario y termina")
+    args = parser.parse_args(argv)
+
+    api_token = os.getenv("API_TOKEN")
+    if args.issue_token:
+        if not api_token:
+            parser.error("--issue-token requiere API_TOKEN")
+        print(user_token(api_token, args.issue_token))
+        return
+    if not api_token and not is_loopback(args.address):
+        # Sin token cualquiera en la red podría leer y borrar el historial
+        parser.error(f"sin API_TOKEN solo se puede escuchar en una dirección local (no {args.address})")
+    try:
+        asyncio.run(serve(args.port, args.address))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
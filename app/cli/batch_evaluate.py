@@ -0,0 +1,364 @@
+"""
+batch_evaluate.py
+-----------------
+Evaluación por lotes de grabaciones (p. ej. los deberes de una clase entera).
+
+El manifiesto es un CSV (con cabecera) o un JSONL con una grabación por fila:
+
+    path,phrase,language[,id]
+    alumno01/ej3.wav,The quick brown fox jumps over the lazy dog,en-US
+
+`path` es relativo al directorio del manifiesto (también se aceptan las
+columnas `audio`/`reference_text`). Sin `id` se usa `path|language|phrase`.
+
+Cada grabación se valida y se evalúa con `PronunciationEvaluator` en un pool
+de hilos (--workers, que también es la concurrencia del evaluador). Los
+resultados se escriben a medida que terminan:
+
+- JSONL (por defecto): una línea por grabación, volcada al momento.
+- Parquet (--format parquet o un destino terminado en `/`, requiere `pyarrow`):
+  el destino es un directorio y cada --batch-size resultados se escribe un
+  `part-*.parquet`.
+
+Si el proceso se interrumpe, al relanzarlo con la misma salida se saltan las
+grabaciones ya evaluadas con éxito; las fallidas se vuelven a intentar y su
+nueva fila sustituye a la anterior (la última fila de cada id es la válida).
+
+Uso (desde la raíz del repositorio):
+
+    python -m app.cli.batch_evaluate deberes.csv -o resultados.jsonl --workers 16
+    python -m app.cli.batch_evaluate deberes.jsonl -o resultados/ --workers 16
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+ROW_FIELDS = (
+    "id", "path", "phrase", "language", "success", "error",
+    "pron_score", "accuracy_score", "fluency_score", "completeness_score", "prosody_score",
+    "recognized_text", "duration", "cached", "seconds", "evaluated_at",
+)
+
+DEFAULT_WORKERS = 8
+DEFAULT_BATCH_SIZE = 500
+
+# Cada cuántos segundos se imprime el progreso
+PROGRESS_INTERVAL = 2.0
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def _first(row, *names):
+    for name in names:
+        value = row.get(name)
+        if value not in (None, ""):
+            return str(value).strip()
+    return None
+
+
+def read_manifest(path):
+    """Lista de clips {id, path, audio_path, phrase, language} del CSV o JSONL"""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson", ".json")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    clips = []
+    seen = set()
+    for number, row in enumerate(rows, start=1):
+        clip_path = _first(row, "path", "audio", "file")
+        phrase = _first(row, "phrase", "reference_text", "text")
+        language = _first(row, "language", "lang")
+        if not clip_path or not phrase or not language:
+            raise ManifestError(f"fila {number}: faltan path, phrase o language")
+        clip_id = _first(row, "id") or f"{clip_path}|{language}|{phrase}"
+        if clip_id in seen:
+            raise ManifestError(f"fila {number}: id repetido ({clip_id})")
+        seen.add(clip_id)
+        clips.append({
+            "id": clip_id,
+            "path": clip_path,
+            "audio_path": clip_path if os.path.isabs(clip_path) else os.path.join(base, clip_path),
+            "phrase": phrase,
+            "language": language,
+        })
+    return clips
+
+
+class JsonlWriter:
+
+    def __init__(self, path):
+        self.path = path
+
+    def completed_ids(self):
+        """Ids ya evaluados con éxito en la salida (la última fila de cada id manda)"""
+        status = {}
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # Última línea a medio escribir si el proceso murió
+                    continue
+                status[row.get("id")] = bool(row.get("success"))
+        return {clip_id for clip_id, success in status.items() if success}
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        return self
+
+    def write(self, row):
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        return False
+
+
+class ParquetWriter:
+    """Escribe los resultados en `part-*.parquet` dentro de un directorio"""
+
+    def __init__(self, directory, batch_size=DEFAULT_BATCH_SIZE, include_json=False):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("La salida Parquet requiere el paquete `pyarrow` (pip install pyarrow)")
+        self.directory = directory
+        self.batch_size = batch_size
+        self.fields = ROW_FIELDS + (("json_result",) if include_json else ())
+        self._rows = []
+
+    def _parts(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(n for n in os.listdir(self.directory) if n.startswith("part-") and n.endswith(".parquet"))
+
+    def completed_ids(self):
+        import pyarrow.parquet as pq
+
+        status = {}
+        for name in self._parts():
+            table = pq.read_table(os.path.join(self.directory, name), columns=["id", "success"])
+            for clip_id, success in zip(table.column("id").to_pylist(), table.column("success").to_pylist()):
+                status[clip_id] = bool(success)
+        return {clip_id for clip_id, success in status.items() if success}
+
+    def __enter__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return self
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Esquema fijo: una parte con todo fallido no debe quedar con columnas de tipo null
+        types = {"success": pa.bool_(), "cached": pa.bool_()}
+        for field in ("pron_score", "accuracy_score", "fluency_score", "completeness_score",
+                      "prosody_score", "duration", "seconds"):
+            types[field] = pa.float64()
+        schema = pa.schema([(f, types.get(f, pa.string())) for f in self.fields])
+        table = pa.Table.from_pylist([{f: row.get(f) for f in self.fields} for row in self._rows], schema=schema)
+        # Nombre ordenable y único entre ejecuciones (se reanuda sin pisar partes anteriores)
+        name = f"part-{time.strftime('%Y%m%d%H%M%S')}-{len(self._parts()):05d}.parquet"
+        tmp = os.path.join(self.directory, f".{name}.tmp")
+        pq.write_table(table, tmp)
+        os.replace(tmp, os.path.join(self.directory, name))
+        self._rows = []
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+
+def evaluate_clip(evaluator, clip, include_json=False):
+    """Valida y evalúa una grabación; devuelve la fila de resultados"""
+    from app.services.metrics import span
+    from app.utils.validation import validate_audio_bytes
+
+    start = time.perf_counter()
+    row = {"id": clip["id"], "path": clip["path"], "phrase": clip["phrase"], "language": clip["language"]}
+    try:
+        with open(clip["audio_path"], "rb") as f:
+            audio_bytes = f.read()
+    except OSError as e:
+        return _finish_row(row, start, error=f"No se pudo leer el archivo de audio: {e}")
+
+    with span("validate"):
+        validation = validate_audio_bytes(audio_bytes)
+    if not validation["valid"]:
+        return _finish_row(row, start, error=validation["error"])
+    row["duration"] = validation["duration"]
+
+    result = evaluator.evaluate_pronunciation_bytes(audio_bytes, clip["phrase"], clip["language"])
+    if not result["success"]:
+        return _finish_row(row, start, error=result.get("error"))
+
+    assessment = result["assessment"]
+    row.update({
+        "pron_score": assessment.pron_score,
+        "accuracy_score": assessment.accuracy_score,
+        "fluency_score": assessment.fluency_score,
+        "completeness_score": assessment.completeness_score,
+        "prosody_score": assessment.prosody_score,
+        "recognized_text": assessment.text,
+        "cached": bool(result.get("cached")),
+    })
+    if include_json:
+        row["json_result"] = json.dumps(result["json_result"], ensure_ascii=False)
+    return _finish_row(row, start)
+
+
+def _finish_row(row, start, error=None):
+    row["success"] = error is None
+    row["error"] = error
+    row["seconds"] = round(time.perf_counter() - start, 4)
+    row["evaluated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    return row
+
+
+class Progress:
+    """Throughput y ETA de la ejecución"""
+
+    def __init__(self, total, stream=sys.stderr):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.stream = stream
+        self.start = time.monotonic()
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, row):
+        with self._lock:
+            self.done += 1
+            if not row["success"]:
+                self.failed += 1
+            now = time.monotonic()
+            if now - self._last >= PROGRESS_INTERVAL or self.done == self.total:
+                self._last = now
+                self.stream.write(self.line(now) + "\n")
+                self.stream.flush()
+
+    def line(self, now=None):
+        elapsed = (now or time.monotonic()) - self.start
+        rate = self.done / elapsed if elapsed else 0.0
+        remaining = self.total - self.done
+        eta = remaining / rate if rate else float("inf")
+        return (
+            f"{self.done}/{self.total} ({self.done / max(1, self.total):.0%})  "
+            f"{rate:.1f} clips/s  {self.failed} fallidas  "
+            f"transcurrido {_format_seconds(elapsed)}  ETA {_format_seconds(eta)}"
+        )
+
+
+def _format_seconds(seconds):
+    if seconds == float("inf"):
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60:02d}:{rest % 60:02d}"
+
+
+def run(clips, evaluator, writer, workers, include_json=False, progress=None):
+    """Evalúa `clips` con `workers` hilos; escribe cada fila en cuanto termina"""
+    pending = iter(clips)
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+        # Ventana acotada: con miles de clips no se encolan todos a la vez
+        for clip in pending:
+            in_flight.add(pool.submit(evaluate_clip, evaluator, clip, include_json))
+            if len(in_flight) >= workers * 2:
+                break
+        while in_flight:
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                row = future.result()
+                writer.write(row)
+                if progress is not None:
+                    progress.update(row)
+                clip = next(pending, None)
+                if clip is not None:
+                    in_flight.add(pool.submit(evaluate_clip, evaluator, clip, include_json))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evalúa por lotes las grabaciones de un manifiesto CSV/JSONL")
+    parser.add_argument("manifest", help="CSV (path,phrase,language[,id]) o JSONL con los mismos campos")
+    parser.add_argument("-o", "--output", required=True, help="Archivo JSONL o directorio Parquet de resultados")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default=None,
+                        help="Formato de salida (por defecto jsonl; parquet si --output es un directorio)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Evaluaciones simultáneas")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Filas por archivo Parquet")
+    parser.add_argument("--include-json", action="store_true", help="Guardar también el JSON completo de Azure")
+    parser.add_argument("--no-resume", action="store_true", help="Evaluar también las grabaciones ya evaluadas")
+    args = parser.parse_args(argv)
+
+    from app.services.speech import PronunciationEvaluator
+    from app.utils.languages_phrases import LANGUAGE_OPTIONS
+
+    try:
+        clips = read_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        parser.error(f"manifiesto no válido: {e}")
+    unknown = sorted({c["language"] for c in clips} - set(LANGUAGE_OPTIONS.values()))
+    if unknown:
+        parser.error(f"idiomas no soportados: {', '.join(unknown)}")
+
+    output_format = args.format
+    if output_format is None:
+        is_directory = args.output.endswith(("/", os.sep)) or os.path.isdir(args.output)
+        output_format = "parquet" if is_directory or args.output.lower().endswith(".parquet") else "jsonl"
+    if output_format == "parquet":
+        writer = ParquetWriter(args.output, args.batch_size, args.include_json)
+    else:
+        writer = JsonlWriter(args.output)
+
+    if not args.no_resume:
+        done = writer.completed_ids()
+        if done:
+            clips = [c for c in clips if c["id"] not in done]
+            print(f"Reanudando: {len(done)} grabaciones ya evaluadas", file=sys.stderr)
+    if not clips:
+        print("Nada que evaluar", file=sys.stderr)
+        return 0
+
+    evaluator = PronunciationEvaluator(max_concurrency=args.workers)
+    status = evaluator.get_configuration_status()
+    if status["status"] == "error":
+        print(status["message"], file=sys.stderr)
+        return 2
+    evaluator.warm_up(sorted({c["language"] for c in clips}))
+
+    progress = Progress(len(clips))
+    try:
+        with writer:
+            run(clips, evaluator, writer, args.workers, args.include_json, progress)
+    except KeyboardInterrupt:
+        print(f"\nInterrumpido: {progress.line()}. Relanza el mismo comando para continuar.", file=sys.stderr)
+        return 130
+    return 1 if progress.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+assessment.py
+-------------
+Modelo compacto del resultado de Azure Pronunciation Assessment.
+
+El JSON de Azure (NBest/PronunciationAssessment/Words/Phonemes...) se recorre
+una sola vez en `PronunciationEvaluator` y las páginas trabajan con estos
+objetos en lugar de volver a navegar el dict en cada rerun.
+
+- Todas las clases usan `__slots__` para ocupar poco en `st.session_state`.
+- El detalle de fonemas y sílabas de cada palabra se decodifica la primera
+  vez que se consulta; hasta entonces solo se guarda la lista original.
+"""
+
+
+def _score(data, key):
+    return float(data.get(key, 0) or 0)
+
+
+class PhonemeResult:
+    __slots__ = ("phoneme", "accuracy_score", "offset", "duration")
+
+    def __init__(self, phoneme, accuracy_score, offset=0, duration=0):
+        self.phoneme = phoneme
+        self.accuracy_score = accuracy_score
+        self.offset = offset
+        self.duration = duration
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            data.get("Phoneme", ""),
+            _score(data.get("PronunciationAssessment", {}), "AccuracyScore"),
+            data.get("Offset", 0),
+            data.get("Duration", 0)
+        )
+
+    def to_json(self):
+        return {
+            "Phoneme": self.phoneme,
+            "PronunciationAssessment": {"AccuracyScore": self.accuracy_score},
+            "Offset": self.offset,
+            "Duration": self.duration
+        }
+
+    def __repr__(self):
+        return f"PhonemeResult({self.phoneme!r}, {self.accuracy_score:.1f})"
+
+
+class SyllableResult:
+    __slots__ = ("syllable", "grapheme", "accuracy_score", "offset", "duration")
+
+    def __init__(self, syllable, grapheme, accuracy_score, offset=0, duration=0):
+        self.syllable = syllable
+        self.grapheme = grapheme
+        self.accuracy_score = accuracy_score
+        self.offset = offset
+        self.duration = duration
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            data.get("Syllable", ""),
+            data.get("Grapheme", ""),
+            _score(data.get("PronunciationAssessment", {}), "AccuracyScore"),
+            data.get("Offset", 0),
+            data.get("Duration", 0)
+        )
+
+    def to_json(self):
+        return {
+            "Syllable": self.syllable,
+            "Grapheme": self.grapheme,
+            "PronunciationAssessment": {"AccuracyScore": self.accuracy_score},
+            "Offset": self.offset,
+            "Duration": self.duration
+        }
+
+    def __repr__(self):
+        return f"SyllableResult({self.syllable!r}, {self.accuracy_score:.1f})"
+
+
+class WordResult:
+    __slots__ = ("word", "accuracy_score", "error_type", "offset", "duration", "_phonemes", "_syllables")
+
+    def __init__(self, word, accuracy_score, error_type="None", offset=0, duration=0, phonemes=(), syllables=()):
+        self.word = word
+        self.accuracy_score = accuracy_score
+        self.error_type = error_type
+        self.offset = offset
+        self.duration = duration
+        # Listas del JSON original (o tuplas ya decodificadas)
+        self._phonemes = phonemes
+        self._syllables = syllables
+
+    @classmethod
+    def from_json(cls, data):
+        assessment = data.get("PronunciationAssessment", {})
+        return cls(
+            data.get("Word", ""),
+            _score(assessment, "AccuracyScore"),
+            assessment.get("ErrorType", "None") or "None",
+            data.get("Offset", 0),
+            data.get("Duration", 0),
+            data.get("Phonemes") or (),
+            data.get("Syllables") or ()
+        )
+
+    @property
+    def phonemes(self):
+        """Fonemas de la palabra (se decodifican en el primer acceso)"""
+        if not isinstance(self._phonemes, tuple):
+            self._phonemes = tuple(PhonemeResult.from_json(p) for p in self._phonemes)
+        return self._phonemes
+
+    @property
+    def syllables(self):
+        """Sílabas de la palabra (se decodifican en el primer acceso)"""
+        if not isinstance(self._syllables, tuple):
+            self._syllables = tuple(SyllableResult.from_json(s) for s in self._syllables)
+        return self._syllables
+
+    def to_json(self):
+        data = {
+            "Word": self.word,
+            "Offset": self.offset,
+            "Duration": self.duration,
+            "PronunciationAssessment": {"AccuracyScore": self.accuracy_score, "ErrorType": self.error_type}
+        }
+        # Si aún no se han decodificado se reutilizan las listas originales
+        if self._phonemes:
+            data["Phonemes"] = [p.to_json() for p in self._phonemes] if isinstance(self._phonemes, tuple) else self._phonemes
+        if self._syllables:
+            data["Syllables"] = [s.to_json() for s in self._syllables] if isinstance(self._syllables, tuple) else self._syllables
+        return data
+
+    def __repr__(self):
+        return f"WordResult({self.word!r}, {self.accuracy_score:.1f}, {self.error_type!r})"
+
+
+class AssessmentResult:
+    __slots__ = (
+        "text", "pron_score", "accuracy_score", "fluency_score",
+        "completeness_score", "prosody_score", "offset", "duration", "words"
+    )
+
+    def __init__(self, text, pron_score, accuracy_score, fluency_score, completeness_score,
+                 prosody_score=None, offset=0, duration=0, words=()):
+        self.text = text
+        self.pron_score = pron_score
+        self.accuracy_score = accuracy_score
+        self.fluency_score = fluency_score
+        self.completeness_score = completeness_score
+        self.prosody_score = prosody_score
+        self.offset = offset
+        self.duration = duration
+        self.words = words
+
+    @classmethod
+    def from_json(cls, json_result):
+        """Construye el modelo a partir del JSON de Azure (NBest[0])"""
+        json_result = json_result or {}
+        nbest = (json_result.get("NBest") or [{}])[0]
+        pronunciation = nbest.get("PronunciationAssessment", {})
+        prosody = pronunciation.get("ProsodyScore")
+
+        return cls(
+            nbest.get("Display") or json_result.get("DisplayText", ""),
+            _score(pronunciation, "PronScore"),
+            _score(pronunciation, "AccuracyScore"),
+            _score(pronunciation, "FluencyScore"),
+            _score(pronunciation, "CompletenessScore"),
+            float(prosody) if prosody is not None else None,
+            json_result.get("Offset", 0),
+            json_result.get("Duration", 0),
+            tuple(WordResult.from_json(w) for w in nbest.get("Words", []))
+        )
+
+    def to_json(self):
+        """JSON con el esquema de Azure; `from_json(to_json())` reconstruye el mismo modelo"""
+        pronunciation = {
+            "PronScore": self.pron_score,
+            "AccuracyScore": self.accuracy_score,
+            "FluencyScore": self.fluency_score,
+            "CompletenessScore": self.completeness_score
+        }
+        if self.prosody_score is not None:
+            pronunciation["ProsodyScore"] = self.prosody_score
+
+        return {
+            "DisplayText": self.text,
+            "Offset": self.offset,
+            "Duration": self.duration,
+            "NBest": [{
+                "Display": self.text,
+                "PronunciationAssessment": pronunciation,
+                "Words": [w.to_json() for w in self.words]
+            }]
+        }
+
+    def scores(self):
+        """(General, Precisión, Fluidez, Completitud) en el orden de los gráficos"""
+        return self.pron_score, self.accuracy_score, self.fluency_score, self.completeness_score
+
+    def __repr__(self):
+        return (
+            f"AssessmentResult(pron={self.pron_score:.1f}, accuracy={self.accuracy_score:.1f}, "
+            f"fluency={self.fluency_score:.1f}, completeness={self.completeness_score:.1f}, "
+            f"words={len(self.words)})"
+        )
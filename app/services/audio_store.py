@@ -0,0 +1,238 @@
+"""
+audio_store.py
+--------------
+Almacén de audio del historial direccionado por contenido.
+
+- Cada grabación se guarda una sola vez por su SHA-256, aunque aparezca en
+  varias entradas del historial o en varias sesiones.
+- Se comprime sin pérdida (FLAC) o, opcionalmente, con pérdida (Opus).
+- Se entrega comprimida al reproductor `st.audio` (el navegador decodifica
+  FLAC y Ogg/Opus), así que no se reconstruye el WAV salvo que se pida.
+
+Backends: en memoria (LRU acotado por tamaño) o directorio en disco
+repartido en subcarpetas (AUDIO_STORE_PATH).
+"""
+
+import hashlib
+import io
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+CODEC_MIME = {
+    "flac": "audio/flac",
+    "opus": "audio/ogg",
+    "wav": "audio/wav",
+}
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Frecuencias que admite el codificador Opus de libsndfile
+_OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+# Profundidades PCM del WAV que FLAC conserva sin pérdida
+_FLAC_SUBTYPES = {"PCM_U8": "PCM_S8", "PCM_S8": "PCM_S8", "PCM_16": "PCM_16", "PCM_24": "PCM_24"}
+
+
+def audio_ref(audio_bytes):
+    """Referencia (hash de contenido) de una grabación"""
+    return hashlib.sha256(audio_bytes).hexdigest()
+
+
+def encode_audio(audio_bytes, codec="flac"):
+    """
+    Comprime un WAV. Devuelve (datos, codec_usado); si no se puede comprimir
+    (sin soundfile o formato no soportado) se devuelve el WAV original.
+    """
+    if codec == "wav":
+        return bytes(audio_bytes), "wav"
+    try:
+        import soundfile as sf
+
+        subtype = sf.info(io.BytesIO(audio_bytes)).subtype
+        if codec == "flac" and subtype not in _FLAC_SUBTYPES:
+            # FLAC no admite muestras en coma flotante: se guarda tal cual
+            return bytes(audio_bytes), "wav"
+
+        data, sample_rate = sf.read(io.BytesIO(audio_bytes), dtype="int32")
+        if codec == "opus" and sample_rate not in _OPUS_RATES:
+            codec = "flac"
+            if subtype not in _FLAC_SUBTYPES:
+                return bytes(audio_bytes), "wav"
+
+        out = io.BytesIO()
+        if codec == "opus":
+            sf.write(out, data, sample_rate, format="OGG", subtype="OPUS")
+        else:
+            sf.write(out, data, sample_rate, format="FLAC", subtype=_FLAC_SUBTYPES[subtype])
+            codec = "flac"
+        return out.getvalue(), codec
+    except Exception:
+        return bytes(audio_bytes), "wav"
+
+
+def decode_audio(data, codec):
+    """Reconstruye un WAV PCM a partir de los datos guardados"""
+    if codec == "wav":
+        return data
+    import soundfile as sf
+
+    info = sf.info(io.BytesIO(data))
+    subtype = info.subtype if info.subtype in ("PCM_S8", "PCM_16", "PCM_24") else "PCM_16"
+    if subtype == "PCM_S8":
+        subtype = "PCM_U8"
+    samples, sample_rate = sf.read(io.BytesIO(data), dtype="int32")
+    out = io.BytesIO()
+    sf.write(out, samples, sample_rate, format="WAV", subtype=subtype)
+    return out.getvalue()
+
+
+class AudioStore(ABC):
+    """Interfaz común: put/get por referencia de contenido"""
+
+    def __init__(self, codec="flac"):
+        self.codec = codec
+
+    def put(self, audio_bytes):
+        """Guarda la grabación (si no estaba ya) y devuelve su referencia"""
+        ref = audio_ref(audio_bytes)
+        if not self._contains(ref):
+            data, codec = encode_audio(audio_bytes, self.codec)
+            self._write(ref, codec, data)
+        return ref
+
+    def get(self, ref):
+        """Devuelve (datos, mime) listos para `st.audio`, o (None, None) si no existe"""
+        stored = self._read(ref)
+        if stored is None:
+            return None, None
+        codec, data = stored
+        return data, CODEC_MIME[codec]
+
+    def get_wav(self, ref):
+        """Devuelve el audio decodificado a WAV, o None si no existe"""
+        stored = self._read(ref)
+        if stored is None:
+            return None
+        codec, data = stored
+        return decode_audio(data, codec)
+
+    def delete(self, ref):
+        """Borra la grabación (si existe)"""
+        self._delete(ref)
+
+    @abstractmethod
+    def _contains(self, ref):
+        """True si la grabación ya está guardada"""
+
+    @abstractmethod
+    def _delete(self, ref):
+        """Borra la grabación si existe"""
+
+    @abstractmethod
+    def _write(self, ref, codec, data):
+        """Guarda los datos ya comprimidos con `codec`"""
+
+    @abstractmethod
+    def _read(self, ref):
+        """(codec, datos) de la grabación, o None si no existe"""
+
+
+class MemoryAudioStore(AudioStore):
+
+    def __init__(self, codec="flac", max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(codec)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _contains(self, ref):
+        with self._lock:
+            return ref in self._items
+
+    def _write(self, ref, codec, data):
+        with self._lock:
+            if ref in self._items:
+                return
+            self._items[ref] = (codec, data)
+            self.size += len(data)
+            # Expulsar las menos usadas recientemente
+            while self.size > self.max_bytes and len(self._items) > 1:
+                _, (_, old) = self._items.popitem(last=False)
+                self.size -= len(old)
+
+    def _read(self, ref):
+        with self._lock:
+            stored = self._items.get(ref)
+            if stored is not None:
+                self._items.move_to_end(ref)
+            return stored
+
+    def _delete(self, ref):
+        with self._lock:
+            stored = self._items.pop(ref, None)
+            if stored is not None:
+                self.size -= len(stored[1])
+
+
+class DirectoryAudioStore(AudioStore):
+    """Un archivo por grabación en <path>/<ab>/<hash>.<codec>"""
+
+    def __init__(self, path, codec="flac"):
+        super().__init__(codec)
+        self.path = path
+
+    def _files(self, ref):
+        directory = os.path.join(self.path, ref[:2])
+        return [(codec, os.path.join(directory, f"{ref}.{codec}")) for codec in CODEC_MIME]
+
+    def _contains(self, ref):
+        return any(os.path.exists(path) for _, path in self._files(ref))
+
+    def _write(self, ref, codec, data):
+        path = os.path.join(self.path, ref[:2], f"{ref}.{codec}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escritura atómica: otros procesos nunca ven un archivo a medias
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _read(self, ref):
+        for codec, path in self._files(ref):
+            try:
+                with open(path, "rb") as f:
+                    return codec, f.read()
+            except FileNotFoundError:
+                continue
+        return None
+
+    def _delete(self, ref):
+        for _, path in self._files(ref):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_audio_store():
+    """Almacén de audio compartido por todo el proceso (según AUDIO_STORE_*)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            codec = os.getenv("AUDIO_STORE_CODEC", "flac").lower()
+            path = os.getenv("AUDIO_STORE_PATH")
+            if path:
+                _store = DirectoryAudioStore(path, codec=codec)
+            else:
+                _store = MemoryAudioStore(
+                    codec=codec,
+                    max_bytes=int(os.getenv("AUDIO_STORE_MAX_BYTES", DEFAULT_MAX_BYTES))
+                )
+        return _store
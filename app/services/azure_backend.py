@@ -0,0 +1,211 @@
+"""
+azure_backend.py
+----------------
+Backend de evaluación sobre Azure Speech SDK.
+
+- Reconocedores precalentados por idioma y formato (`RecognizerFactory`).
+- Audio entregado desde memoria, en PCM o comprimido según `TransportPolicy`.
+- `recognize_once` para frases cortas y reconocimiento continuo para audios largos.
+"""
+
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import azure.cognitiveservices.speech as speechsdk
+
+from app.services.backends import SpeechBackend, azure_credentials_configured, error_result, success_result
+from app.services.continuous import ContinuousAssessment
+from app.services.metrics import span
+from app.services.recognizers import RecognizerFactory, stream_format_key
+from app.services.transport import TransportPolicy, encode_for_transport
+from app.utils.wav import pcm_view
+
+# Margen (s) sobre la duración del audio antes de abandonar el reconocimiento continuo
+CONTINUOUS_TIMEOUT_MARGIN = 30
+
+
+class AzureSpeechBackend(SpeechBackend):
+
+    name = "azure"
+
+    def __init__(self, speech_key, service_region, max_workers=None, transport=None):
+        self.speech_key = speech_key
+        self.service_region = service_region
+        self.recognizers = RecognizerFactory(speech_key, service_region)
+
+        # Cuándo enviar el audio comprimido (OGG/Opus o FLAC) en lugar de PCM
+        self.transport = transport if transport is not None else TransportPolicy.from_env()
+
+        # Hilos que esperan los futures del SDK sin bloquear el event loop
+        self._waiters = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speech-result")
+
+    def is_configured(self):
+        """Valida que las credenciales estén configuradas"""
+        return azure_credentials_configured(self.speech_key, self.service_region)
+
+    def warm_up(self, language):
+        self.recognizers.warm_up(language)
+
+    def assess(self, audio_bytes, info, reference_text, language, continuous=False, pcm=False):
+        speech_recognizer, transport = self._prepare_recognizer(
+            audio_bytes, info, reference_text, language, continuous, pcm
+        )
+        try:
+            if continuous:
+                result = self._recognize_continuous(speech_recognizer, reference_text, info["duration"])
+            else:
+                result = self._build_result(speech_recognizer.recognize_once())
+        except RuntimeError as e:
+            if transport["codec"] is None:
+                raise
+            result = error_result(f"Error durante el reconocimiento: {str(e)}", reason="Error", code="RuntimeError")
+        if self.transport.fallback(result, transport["codec"]):
+            # Un único reintento de esta petición en PCM
+            return self.assess(audio_bytes, info, reference_text, language, continuous, pcm=True)
+        result["transport"] = transport
+        return result
+
+    async def assess_async(self, audio_bytes, info, reference_text, language, continuous=False, pcm=False):
+        """
+        Basado en `recognize_once_async`: no bloquea el event loop mientras Azure
+        responde. La compresión del audio y la creación del reconocedor también
+        bloquean, así que se hacen en un hilo.
+        """
+        loop = asyncio.get_running_loop()
+        speech_recognizer, transport = await loop.run_in_executor(
+            None, self._prepare_recognizer, audio_bytes, info, reference_text, language, continuous, pcm
+        )
+        try:
+            if continuous:
+                result = await loop.run_in_executor(
+                    self._waiters, self._recognize_continuous, speech_recognizer, reference_text, info["duration"]
+                )
+            else:
+                sdk_future = speech_recognizer.recognize_once_async()
+                result = self._build_result(await loop.run_in_executor(self._waiters, sdk_future.get))
+        except RuntimeError as e:
+            if transport["codec"] is None:
+                raise
+            result = error_result(f"Error durante el reconocimiento: {str(e)}", reason="Error", code="RuntimeError")
+        if self.transport.fallback(result, transport["codec"]):
+            return await self.assess_async(audio_bytes, info, reference_text, language, continuous, pcm=True)
+        result["transport"] = transport
+        return result
+
+    def _prepare_recognizer(self, audio_bytes, info, reference_text, language, continuous=False, pcm=False):
+        """
+        Crea el reconocedor con el audio en memoria y la evaluación de pronunciación aplicada.
+        Devuelve (reconocedor, {"codec", "bytes"}) con lo que se va a enviar; con `pcm`
+        no se comprime aunque la política lo indique.
+        """
+
+        # Configuración de evaluación de pronunciación
+        pronunciation_config = speechsdk.PronunciationAssessmentConfig(
+            reference_text=reference_text,
+            grading_system=speechsdk.PronunciationAssessmentGradingSystem.HundredMark,
+            granularity=speechsdk.PronunciationAssessmentGranularity.Phoneme,
+            enable_miscue=True
+        )
+
+        # Comprimir el audio si la política lo indica y compensa; si no, PCM sin copiar
+        codec = None if pcm else self.transport.choose(info)
+        payload = encode_for_transport(audio_bytes, codec) if codec else None
+        if payload is not None:
+            stream_format, audio_view = codec, memoryview(payload)
+        else:
+            codec = None
+            stream_format, audio_view = stream_format_key(info), pcm_view(audio_bytes, info)
+
+        # Obtener reconocedor (precalentado si lo hay) y asignarle el audio en memoria
+        try:
+            speech_recognizer, audio_callback = self.recognizers.acquire(
+                language, stream_format, continuous=continuous
+            )
+        except RuntimeError as e:
+            if codec is None:
+                raise
+            # Sin GStreamer el SDK no admite audio comprimido: se vuelve a PCM para siempre
+            self.transport.disable(str(e))
+            return self._prepare_recognizer(audio_bytes, info, reference_text, language, continuous)
+        audio_callback.attach(audio_view)
+
+        # Aplicar configuración de pronunciación
+        pronunciation_config.apply_to(speech_recognizer)
+        return speech_recognizer, {"codec": codec, "bytes": audio_view.nbytes}
+
+    def _recognize_continuous(self, speech_recognizer, reference_text, duration):
+        """
+        Reconocimiento continuo: recoge la evaluación de cada segmento (evento `recognized`)
+        y devuelve un único resultado combinado.
+        """
+        merged = ContinuousAssessment(reference_text)
+        done = threading.Event()
+        state = {"error": None, "reason": None, "code": None}
+
+        def on_recognized(evt):
+            if evt.result.reason != speechsdk.ResultReason.RecognizedSpeech:
+                return
+            json_result = evt.result.properties.get(speechsdk.PropertyId.SpeechServiceResponse_JsonResult)
+            if json_result:
+                try:
+                    merged.add(json.loads(json_result))
+                except (ValueError, TypeError, AttributeError) as e:
+                    state["error"] = f"Resultado de segmento no válido: {str(e)}"
+
+        def on_canceled(evt):
+            cancellation_details = evt.cancellation_details
+            # EndOfStream es el final normal del audio en memoria
+            if cancellation_details.reason == speechsdk.CancellationReason.Error:
+                state["error"] = (
+                    f"No se pudo reconocer el habla. Cancelado: {cancellation_details.reason}"
+                    f" - Error: {cancellation_details.error_details}"
+                )
+                state["reason"] = cancellation_details.reason.name
+                state["code"] = cancellation_details.code.name
+            done.set()
+
+        speech_recognizer.recognized.connect(on_recognized)
+        speech_recognizer.canceled.connect(on_canceled)
+        speech_recognizer.session_stopped.connect(lambda evt: done.set())
+
+        speech_recognizer.start_continuous_recognition()
+        finished = done.wait(timeout=CONTINUOUS_TIMEOUT_MARGIN + 2 * duration)
+        speech_recognizer.stop_continuous_recognition()
+
+        if state["error"]:
+            return error_result(state["error"], reason=state["reason"], code=state["code"])
+        if not finished:
+            return error_result("Tiempo de espera agotado durante el reconocimiento continuo")
+        if merged.segments == 0:
+            return error_result("No se pudo reconocer el habla. El audio no tiene sentido.", reason="NoMatch")
+
+        return success_result(merged.to_json())
+
+    def _build_result(self, result):
+        """Convierte el resultado del SDK en el dict que usa la aplicación"""
+
+        # Verificar resultado
+        if result.reason != speechsdk.ResultReason.RecognizedSpeech:
+            error_msg = "No se pudo reconocer el habla. "
+            reason, code = result.reason.name, None
+            if result.reason == speechsdk.ResultReason.NoMatch:
+                error_msg += "El audio no tiene sentido."
+            elif result.reason == speechsdk.ResultReason.Canceled:
+                cancellation_details = result.cancellation_details
+                reason = cancellation_details.reason.name
+                error_msg += f"Cancelado: {cancellation_details.reason}"
+                if cancellation_details.reason == speechsdk.CancellationReason.Error:
+                    error_msg += f" - Error: {cancellation_details.error_details}"
+                    code = cancellation_details.code.name
+            return error_result(error_msg, reason=reason, code=code)
+
+        # Resultados como JSON
+        json_result = result.properties.get(speechsdk.PropertyId.SpeechServiceResponse_JsonResult)
+
+        if json_result:
+            with span("parse"):
+                return success_result(json.loads(json_result), sdk_result=result)
+        else:
+            return error_result("No se obtuvieron resultados JSON", sdk_result=result)
@@ -0,0 +1,364 @@
+"""
+backends.py
+-----------
+Backends de reconocimiento y evaluación de pronunciación.
+
+`PronunciationEvaluator` se encarga de la caché, la deduplicación, la
+concurrencia y el preprocesado; el paso de reconocer/evaluar el audio lo
+delega en un `SpeechBackend`:
+
+- "azure": Azure Speech SDK (`app.services.azure_backend`). El SDK tarda en
+  importarse, así que el backend real se crea la primera vez que se usa
+  (`LazySpeechBackend`), normalmente en el precalentamiento en segundo plano.
+- "fake": backend local determinista, sin red ni cuota. Devuelve JSON con el
+  mismo esquema que Azure (NBest/Words/Phonemes/Syllables) y permite simular
+  latencia, jitter, errores y throttling para pruebas de carga y benchmarks.
+
+El backend se elige con SPEECH_BACKEND.
+"""
+
+import asyncio
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+from app.services.assessment import AssessmentResult
+
+# Unidades de Offset/Duration en el JSON de Azure (100 ns)
+TICKS_PER_SECOND = 10_000_000
+
+
+def success_result(json_result, sdk_result=None):
+    return {
+        "success": True,
+        "error": None,
+        "sdk_result": sdk_result,
+        "json_result": json_result,
+        "assessment": AssessmentResult.from_json(json_result)
+    }
+
+
+def error_result(error, sdk_result=None, reason=None, code=None):
+    """
+    `reason` es el nombre del `CancellationReason` o "NoMatch" y `code` el del
+    `CancellationErrorCode` (p. ej. "TooManyRequests"), si el servicio los da.
+    """
+    result = {
+        "success": False,
+        "error": error,
+        "sdk_result": sdk_result,
+        "json_result": None,
+        "assessment": None
+    }
+    if reason is not None:
+        result["cancellation_reason"] = reason
+        result["error_code"] = code
+    return result
+
+
+class SpeechBackend(ABC):
+    """
+    Interfaz de los backends. `assess` recibe el WAV ya preparado y su cabecera
+    (`parse_wav_header`) y devuelve el dict de resultado del evaluador
+    (success/error/sdk_result/json_result/assessment, más "transport").
+    """
+
+    name = None
+
+    def is_configured(self):
+        return True
+
+    def warm_up(self, language):
+        """Prepara conexiones para el idioma (opcional)"""
+
+    @abstractmethod
+    def assess(self, audio_bytes, info, reference_text, language, continuous=False):
+        """Evalúa el audio y devuelve el dict de resultado"""
+
+    async def assess_async(self, audio_bytes, info, reference_text, language, continuous=False):
+        """Por defecto ejecuta `assess` en un hilo para no bloquear el event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self.assess, audio_bytes, info, reference_text, language, continuous
+        )
+
+
+class LazySpeechBackend(SpeechBackend):
+    """Crea el backend con `factory` la primera vez que hace falta"""
+
+    def __init__(self, name, factory, configured=True):
+        self.name = name
+        self._factory = factory
+        self._configured = configured
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        with self._lock:
+            if self._backend is None:
+                self._backend = self._factory()
+            return self._backend
+
+    def is_configured(self):
+        return self._configured
+
+    def warm_up(self, language):
+        self.backend.warm_up(language)
+
+    def assess(self, audio_bytes, info, reference_text, language, continuous=False):
+        return self.backend.assess(audio_bytes, info, reference_text, language, continuous)
+
+    async def assess_async(self, audio_bytes, info, reference_text, language, continuous=False):
+        backend = self._backend
+        if backend is None:
+            # Importar el SDK y crear el backend tarda segundos: fuera del event loop
+            backend = await asyncio.get_running_loop().run_in_executor(None, lambda: self.backend)
+        return await backend.assess_async(audio_bytes, info, reference_text, language, continuous)
+
+
+class FakeSpeechBackend(SpeechBackend):
+    """
+    Backend local sin red. El resultado depende solo de (audio, frase, idioma),
+    así que es reproducible; la latencia y los fallos inyectados dependen de `seed`.
+
+    Con `transport` (una `TransportPolicy`) comprime el audio como el backend de
+    Azure y, con `codec_error`, simula que el servicio rechaza los envíos
+    comprimidos con ese mensaje y `codec_error_code` (para probar la vuelta a PCM).
+    """
+
+    name = "fake"
+
+    def __init__(self, latency=0.2, jitter=0.05, error_rate=0.0, throttle_rate=0.0, seed=None,
+                 transport=None, codec_error=None, codec_error_code="BadRequest"):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.transport = transport
+        self.codec_error = codec_error
+        self.codec_error_code = codec_error_code
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        seed = os.getenv("SPEECH_FAKE_SEED")
+        return cls(
+            latency=float(os.getenv("SPEECH_FAKE_LATENCY", 0.2)),
+            jitter=float(os.getenv("SPEECH_FAKE_JITTER", 0.05)),
+            error_rate=float(os.getenv("SPEECH_FAKE_ERROR_RATE", 0)),
+            throttle_rate=float(os.getenv("SPEECH_FAKE_THROTTLE_RATE", 0)),
+            seed=int(seed) if seed is not None else None
+        )
+
+    def _draw(self):
+        """(segundos de espera, fallo inyectado o None) para la siguiente llamada"""
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self.jitter * self._rng.uniform(-1, 1))
+            roll = self._rng.random()
+        if roll < self.throttle_rate:
+            return delay, (
+                "No se pudo reconocer el habla. Cancelado: CancellationReason.Error"
+                " - Error: Status(429): Too many requests (simulado)",
+                "TooManyRequests"
+            )
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, (
+                "No se pudo reconocer el habla. Cancelado: CancellationReason.Error"
+                " - Error: Connection was closed by the remote host (simulado)",
+                "ConnectionFailure"
+            )
+        return delay, None
+
+    def assess(self, audio_bytes, info, reference_text, language, continuous=False, pcm=False):
+        transport = self._transport(audio_bytes, info, pcm)
+        delay, failure = self._draw()
+        time.sleep(delay)
+        result = self._result(audio_bytes, info, reference_text, language, failure, transport)
+        if self.transport is not None and self.transport.fallback(result, transport["codec"]):
+            return self.assess(audio_bytes, info, reference_text, language, continuous, pcm=True)
+        return result
+
+    async def assess_async(self, audio_bytes, info, reference_text, language, continuous=False, pcm=False):
+        transport = self._transport(audio_bytes, info, pcm)
+        delay, failure = self._draw()
+        await asyncio.sleep(delay)
+        result = self._result(audio_bytes, info, reference_text, language, failure, transport)
+        if self.transport is not None and self.transport.fallback(result, transport["codec"]):
+            return await self.assess_async(audio_bytes, info, reference_text, language, continuous, pcm=True)
+        return result
+
+    def _transport(self, audio_bytes, info, pcm):
+        """{"codec", "bytes"} de lo que se enviaría, como `AzureSpeechBackend`"""
+        codec = None if pcm or self.transport is None else self.transport.choose(info)
+        if codec is not None:
+            from app.services.transport import encode_for_transport
+
+            payload = encode_for_transport(audio_bytes, codec)
+            if payload is not None:
+                return {"codec": codec, "bytes": len(payload)}
+        return {"codec": None, "bytes": info["data_size"]}
+
+    def _result(self, audio_bytes, info, reference_text, language, failure, transport):
+        if transport["codec"] is not None and self.codec_error:
+            result = error_result(self.codec_error, reason="Error", code=self.codec_error_code)
+        elif failure:
+            message, code = failure
+            result = error_result(message, reason="Error", code=code)
+        else:
+            result = success_result(fake_assessment_json(audio_bytes, info, reference_text, language))
+        result["transport"] = transport
+        return result
+
+
+def _word_scores(rng):
+    accuracy = round(min(100.0, max(0.0, rng.gauss(82, 14))), 1)
+    if rng.random() < 0.03:
+        return 0.0, "Omission"
+    if accuracy < 60:
+        return accuracy, "Mispronunciation"
+    return accuracy, "None"
+
+
+def fake_assessment_json(audio_bytes, info, reference_text, language):
+    """
+    JSON con el esquema de Azure Pronunciation Assessment (granularidad de fonema)
+    generado de forma determinista a partir del audio, la frase y el idioma.
+    """
+    digest = hashlib.sha256(bytes(memoryview(audio_bytes)[:65536]))
+    digest.update(f"\0{reference_text}\0{language}".encode("utf-8"))
+    rng = random.Random(digest.digest())
+
+    tokens = re.findall(r"[^\W_]+(?:['’][^\W_]+)*", reference_text) or ["..."]
+    duration_ticks = int(info["duration"] * TICKS_PER_SECOND)
+    start = min(duration_ticks // 10, 5_000_000)
+    slot = max(1, (duration_ticks - 2 * start) // len(tokens))
+
+    words = []
+    for i, token in enumerate(tokens):
+        accuracy, error_type = _word_scores(rng)
+        offset = start + i * slot
+        letters = [c for c in token.lower() if c.isalpha()] or [token.lower()]
+        phoneme_ticks = max(1, slot // len(letters))
+        word = {
+            "Word": token.lower(),
+            "Offset": offset,
+            "Duration": slot,
+            "PronunciationAssessment": {"AccuracyScore": accuracy, "ErrorType": error_type},
+            "Phonemes": [
+                {
+                    "Phoneme": letter,
+                    "PronunciationAssessment": {
+                        "AccuracyScore": round(min(100.0, max(0.0, rng.gauss(accuracy, 8))), 1) if accuracy else 0.0
+                    },
+                    "Offset": offset + j * phoneme_ticks,
+                    "Duration": phoneme_ticks
+                }
+                for j, letter in enumerate(letters)
+            ]
+        }
+        if language == "en-US":
+            # Azure solo devuelve sílabas en inglés (EE. UU.)
+            word["Syllables"] = [{
+                "Syllable": "".join(letters),
+                "Grapheme": token.lower(),
+                "PronunciationAssessment": {"AccuracyScore": accuracy},
+                "Offset": offset,
+                "Duration": slot
+            }]
+        words.append(word)
+
+    spoken = [w for w in words if w["PronunciationAssessment"]["ErrorType"] != "Omission"]
+    accuracy = round(sum(w["PronunciationAssessment"]["AccuracyScore"] for w in spoken) / max(1, len(spoken)), 1)
+    fluency = round(min(100.0, max(0.0, rng.gauss(85, 10))), 1)
+    completeness = round(100.0 * len(spoken) / len(words), 1)
+    pron = round(0.6 * accuracy + 0.2 * fluency + 0.2 * completeness, 1)
+
+    display = " ".join(w["Word"] for w in spoken).capitalize() + "."
+    return {
+        "Id": uuid.UUID(bytes=digest.digest()[:16]).hex,
+        "RecognitionStatus": "Success",
+        "Offset": start,
+        "Duration": duration_ticks - 2 * start,
+        "DisplayText": display,
+        "SNR": round(rng.uniform(20, 40), 2),
+        "NBest": [{
+            "Confidence": round(rng.uniform(0.7, 0.99), 4),
+            "Lexical": display.rstrip(".").lower(),
+            "ITN": display.rstrip(".").lower(),
+            "MaskedITN": display.rstrip(".").lower(),
+            "Display": display,
+            "PronunciationAssessment": {
+                "AccuracyScore": accuracy,
+                "FluencyScore": fluency,
+                "CompletenessScore": completeness,
+                "PronScore": pron
+            },
+            "Words": words
+        }]
+    }
+
+
+def azure_credentials_configured(speech_key, service_region):
+    """Valida que las credenciales de Azure estén configuradas (sin importar el SDK)"""
+    if not speech_key or not service_region:
+        return False
+    if "tu_clave_aqui" in speech_key or "tu_region_aqui" in service_region:
+        return False
+    return True
+
+
+def create_backend(speech_key="", service_region="", max_workers=None, transport=None, endpoints=None):
+    """
+    Crea el backend indicado por SPEECH_BACKEND (azure por defecto).
+
+    `endpoints`: lista de (región, clave) de AZURE_SPEECH_ENDPOINTS; con ella las
+    evaluaciones se reparten entre esos recursos (ver `app.services.router`).
+    Con SPEECH_BACKEND=fake, SPEECH_FAKE_ENDPOINTS hace lo mismo con backends locales.
+    """
+    backend = os.getenv("SPEECH_BACKEND", "azure").lower()
+    if backend == "fake":
+        fake_endpoints = os.getenv("SPEECH_FAKE_ENDPOINTS", "")
+        if not fake_endpoints.strip():
+            return FakeSpeechBackend.from_env()
+        from app.services.router import parse_fake_endpoints
+
+        base = FakeSpeechBackend.from_env()
+        return _router([
+            (f"fake-{i}", FakeSpeechBackend(latency, base.jitter, error_rate, base.throttle_rate))
+            for i, (latency, error_rate) in enumerate(parse_fake_endpoints(fake_endpoints))
+        ])
+    if backend != "azure":
+        raise ValueError(f"Backend de voz no soportado: {backend}")
+
+    def azure(key, region):
+        def factory():
+            from app.services.azure_backend import AzureSpeechBackend
+            return AzureSpeechBackend(key, region, max_workers=max_workers, transport=transport)
+
+        return LazySpeechBackend("azure", factory, azure_credentials_configured(key, region))
+
+    if not endpoints:
+        return azure(speech_key, service_region)
+    return _router([(f"{region}-{i}", azure(key, region)) for i, (region, key) in enumerate(endpoints)])
+
+
+def _router(backends):
+    """RouterBackend sobre [(nombre, backend)] configurado con AZURE_SPEECH_ROUTING y compañía"""
+    # Import diferido: router importa este módulo
+    from app.services.router import DEFAULT_COOLDOWN, DEFAULT_FAILURE_THRESHOLD, Endpoint, RouterBackend
+
+    return RouterBackend(
+        [Endpoint(name, backend) for name, backend in backends],
+        strategy=os.getenv("AZURE_SPEECH_ROUTING", "least_outstanding").lower(),
+        failure_threshold=int(os.getenv("AZURE_SPEECH_ENDPOINT_FAILURES", DEFAULT_FAILURE_THRESHOLD)),
+        cooldown=float(os.getenv("AZURE_SPEECH_ENDPOINT_COOLDOWN", DEFAULT_COOLDOWN)),
+    )
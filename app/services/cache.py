@@ -0,0 +1,197 @@
+"""
+cache.py
+--------
+Caché persistente de evaluaciones direccionada por contenido.
+
+La clave es el SHA-256 de audio + frase + idioma (y el modo de reconocimiento,
+si se fuerza), así que el mismo intento practicado otra vez (o enviado desde
+otra réplica) no vuelve a llamar a Azure.
+
+- Se guarda en SQLite (modo WAL), compartido entre procesos del mismo host
+  o de un volumen común.
+- Expulsión LRU por tamaño total y por antigüedad.
+- Contadores de aciertos/fallos y API de invalidación.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "evaluations.sqlite3")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+
+# Cada cuántas escrituras se comprueban los límites de tamaño y antigüedad
+EVICT_EVERY = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    key TEXT PRIMARY KEY,
+    language TEXT NOT NULL,
+    phrase TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_evaluations_accessed ON evaluations (accessed);
+CREATE INDEX IF NOT EXISTS idx_evaluations_language ON evaluations (language);
+"""
+
+
+def make_key(audio_bytes, phrase, language, continuous=None):
+    """
+    Hash de contenido que identifica una evaluación.
+    `continuous` forzado (True/False) da otra clave: un `recognize_once` de un
+    audio largo está truncado y no sirve a quien pide reconocimiento continuo.
+    Con None (modo según la duración) la clave no cambia.
+    """
+    h = hashlib.sha256()
+    h.update(audio_bytes)
+    h.update(b"\0")
+    h.update(phrase.encode("utf-8"))
+    h.update(b"\0")
+    h.update(language.encode("utf-8"))
+    if continuous is not None:
+        h.update(b"\0continuous" if continuous else b"\0once")
+    return h.hexdigest()
+
+
+class EvaluationCache:
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+        self.evict()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Crea la caché según las variables de entorno.
+        EVALUATION_CACHE=off la desactiva (devuelve None).
+        """
+        if os.getenv("EVALUATION_CACHE", "on").lower() in ("0", "off", "false", "no"):
+            return None
+        return cls(
+            path=os.getenv("EVALUATION_CACHE_PATH", DEFAULT_CACHE_PATH),
+            max_bytes=int(os.getenv("EVALUATION_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            max_age=float(os.getenv("EVALUATION_CACHE_MAX_AGE", DEFAULT_MAX_AGE)),
+        )
+
+    def _connection(self):
+        # sqlite3 no permite compartir conexiones entre hilos: una por hilo
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def get(self, key):
+        """Devuelve el json_result guardado o None"""
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, created FROM evaluations WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None or now - row[1] > self.max_age:
+            self._count("misses")
+            return None
+
+        conn.execute("UPDATE evaluations SET accessed = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, key, json_result, phrase="", language=""):
+        """Guarda un json_result (solo evaluaciones correctas)"""
+        value = zlib.compress(json.dumps(json_result, separators=(",", ":")).encode("utf-8"))
+        now = time.time()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO evaluations (key, language, phrase, value, size, created, accessed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, language, phrase, value, len(value), now, now)
+        )
+
+        with self._lock:
+            self._writes += 1
+            check = self._writes % EVICT_EVERY == 0
+        if check:
+            self.evict()
+
+    def invalidate(self, key=None, language=None, phrase=None):
+        """
+        Elimina entradas por clave, idioma y/o frase.
+        Sin argumentos vacía la caché. Devuelve cuántas se eliminaron.
+        """
+        conditions, params = [], []
+        for column, value in (("key", key), ("language", language), ("phrase", phrase)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+
+        query = "DELETE FROM evaluations"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return self._connection().execute(query, params).rowcount
+
+    def evict(self):
+        """Aplica los límites de antigüedad y tamaño (LRU). Devuelve cuántas se eliminaron."""
+        conn = self._connection()
+        removed = conn.execute(
+            "DELETE FROM evaluations WHERE created < ?", (time.time() - self.max_age,)
+        ).rowcount
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM evaluations").fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            freed = 0
+            keys = []
+            for key, size in conn.execute("SELECT key, size FROM evaluations ORDER BY accessed"):
+                keys.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany("DELETE FROM evaluations WHERE key = ?", keys)
+            removed += len(keys)
+
+        if removed:
+            with self._lock:
+                self.evictions += removed
+        return removed
+
+    def stats(self):
+        """Contadores de este proceso y ocupación actual de la caché"""
+        entries, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM evaluations"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
@@ -0,0 +1,139 @@
+"""
+continuous.py
+-------------
+Acumulador de resultados de reconocimiento continuo.
+
+En modo continuo Azure devuelve un resultado por segmento (evento `recognized`).
+`ContinuousAssessment` los combina en un único resultado con el mismo esquema
+que `recognize_once` (NBest/PronunciationAssessment/Words): precisión, fluidez y
+prosodia ponderadas por la duración de cada segmento, completitud respecto a
+toda la frase de referencia y PronScore recalculado a partir de las cuatro (ver
+`pron_score`), igual que el servicio para un único resultado.
+
+No se guardan los JSON de cada segmento: solo sumas parciales y las palabras
+(hasta `max_words`), así la memoria no crece con la duración del audio.
+"""
+
+import re
+
+SCORE_KEYS = ("AccuracyScore", "FluencyScore", "ProsodyScore", "PronScore")
+
+# Palabras que se conservan con su detalle; el resto solo cuenta para las puntuaciones
+MAX_WORDS = 5000
+
+# Tipos de error que indican que la palabra de referencia no se pronunció
+_MISSING_ERRORS = ("Omission", "Insertion")
+
+
+def _count_words(text):
+    return len(re.findall(r"\w+", text or ""))
+
+
+def pron_score(accuracy, fluency, completeness, prosody=None):
+    """
+    PronScore a partir de las puntuaciones agregadas, con la ponderación del
+    ejemplo de evaluación continua del Speech SDK: la peor puntuación pesa más
+    (0.4 con prosodia, 0.6 sin ella) y el resto 0.2 cada una.
+    """
+    if prosody is not None:
+        scores = sorted((accuracy, prosody, completeness, fluency))
+        return scores[0] * 0.4 + scores[1] * 0.2 + scores[2] * 0.2 + scores[3] * 0.2
+    scores = sorted((accuracy, completeness, fluency))
+    return scores[0] * 0.6 + scores[1] * 0.2 + scores[2] * 0.2
+
+
+class ContinuousAssessment:
+
+    def __init__(self, reference_text="", max_words=MAX_WORDS):
+        self.reference_words = _count_words(reference_text)
+        self.max_words = max_words
+        self.segments = 0
+        self.offset = None
+        self.end = 0
+        self.words = []
+        self.dropped_words = 0
+        self.spoken_words = 0
+        self._texts = []
+        self._lexical = []
+        self._weighted = dict.fromkeys(SCORE_KEYS, 0.0)
+        self._weights = dict.fromkeys(SCORE_KEYS, 0.0)
+        self._completeness = 0.0
+        self._completeness_weight = 0.0
+
+    def add(self, segment):
+        """Incorpora el JSON de un segmento reconocido"""
+        best = (segment.get("NBest") or [{}])[0]
+        pronunciation = best.get("PronunciationAssessment", {})
+
+        offset = segment.get("Offset", 0)
+        duration = segment.get("Duration", 0)
+        weight = duration if duration > 0 else 1
+
+        self.segments += 1
+        self.offset = offset if self.offset is None else min(self.offset, offset)
+        self.end = max(self.end, offset + duration)
+
+        for key in SCORE_KEYS:
+            if key in pronunciation:
+                self._weighted[key] += pronunciation[key] * weight
+                self._weights[key] += weight
+
+        if "CompletenessScore" in pronunciation:
+            self._completeness += pronunciation["CompletenessScore"] * weight
+            self._completeness_weight += weight
+
+        for word in best.get("Words", []):
+            error_type = word.get("PronunciationAssessment", {}).get("ErrorType", "None")
+            if error_type not in _MISSING_ERRORS:
+                self.spoken_words += 1
+            # Los Offset de cada palabra ya son absolutos respecto al inicio del stream
+            if len(self.words) < self.max_words:
+                self.words.append(word)
+            else:
+                self.dropped_words += 1
+
+        if len(self._texts) < self.max_words:
+            self._texts.append(best.get("Display") or segment.get("DisplayText", ""))
+            self._lexical.append(best.get("Lexical", ""))
+
+    def completeness(self):
+        """Palabras de la referencia pronunciadas en todo el audio (0-100)"""
+        if self.reference_words:
+            return min(100.0, 100.0 * self.spoken_words / self.reference_words)
+        if self._completeness_weight:
+            return self._completeness / self._completeness_weight
+        return 0.0
+
+    def to_json(self):
+        """Resultado combinado con el esquema de `recognize_once`"""
+        pronunciation = {
+            key: self._weighted[key] / self._weights[key]
+            for key in SCORE_KEYS
+            if self._weights[key]
+        }
+        pronunciation["CompletenessScore"] = self.completeness()
+        if "AccuracyScore" in pronunciation and "FluencyScore" in pronunciation:
+            # La media de los PronScore de cada segmento usa la completitud de cada
+            # segmento, no la de toda la frase: se recalcula con las agregadas
+            pronunciation["PronScore"] = pron_score(
+                pronunciation["AccuracyScore"], pronunciation["FluencyScore"],
+                pronunciation["CompletenessScore"], pronunciation.get("ProsodyScore")
+            )
+
+        display = " ".join(t for t in self._texts if t)
+        offset = self.offset or 0
+
+        return {
+            "RecognitionStatus": "Success",
+            "Offset": offset,
+            "Duration": self.end - offset,
+            "DisplayText": display,
+            "SegmentCount": self.segments,
+            "DroppedWords": self.dropped_words,
+            "NBest": [{
+                "Lexical": " ".join(t for t in self._lexical if t),
+                "Display": display,
+                "PronunciationAssessment": pronunciation,
+                "Words": self.words
+            }]
+        }
@@ -0,0 +1,486 @@
+"""
+history.py
+----------
+Almacenamiento del historial de evaluaciones fuera de `st.session_state`.
+
+Así el historial sobrevive a reinicios y cualquier réplica de Streamlit puede
+atender a cualquier usuario (sin sesiones "pegajosas" en el balanceador).
+
+Backends (variable HISTORY_BACKEND):
+- "memory": en memoria del proceso (por defecto). Guarda como mucho
+  HISTORY_MEMORY_MAX_TOTAL entradas entre todos los usuarios: al superarlo se
+  descarta el historial de los usuarios que llevan más tiempo sin usarlo.
+- "sqlite": archivo SQLite (HISTORY_DB_PATH), compartible en un volumen.
+- "kv": almacén clave-valor con la interfaz de Redis. Con HISTORY_REDIS_URL
+  se usa un servidor Redis real (paquete `redis`); sin ella, `LocalKeyValueStore`.
+
+Todas las consultas son por usuario y admiten filtro por idioma y rango de fechas.
+Cada entrada es un dict:
+{
+    "id": int,
+    "user_id": str,
+    "created": float,
+    "timestamp": "YYYY-mm-dd HH:MM:SS",
+    "phrase": str,
+    "language": str,
+    "assessment": AssessmentResult,
+    "audio_ref": str | None      (referencia en `audio_store`, el audio no se guarda aquí)
+}
+"""
+
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from app.services.assessment import AssessmentResult
+
+# Entradas que se conservan por usuario (0 o None: sin límite)
+MAX_HISTORY = 1000
+
+# Entradas que guarda en total el backend en memoria (0 o None: sin límite)
+MAX_MEMORY_ENTRIES = 10000
+
+DEFAULT_DB_PATH = os.path.join(".cache", "history.sqlite3")
+
+
+def _make_entry(entry_id, user_id, created, phrase, language, assessment, audio_ref):
+    return {
+        "id": entry_id,
+        "user_id": user_id,
+        "created": created,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created)),
+        "phrase": phrase,
+        "language": language,
+        "assessment": assessment,
+        "audio_ref": audio_ref
+    }
+
+
+class HistoryStore(ABC):
+    """
+    Interfaz común de los backends de historial.
+    Las listas se devuelven de la más reciente a la más antigua.
+    """
+
+    def __init__(self, max_entries=MAX_HISTORY):
+        self.max_entries = max_entries
+
+    @abstractmethod
+    def add(self, user_id, phrase, language, assessment, audio_ref=None):
+        """Guarda una evaluación y devuelve la entrada creada"""
+
+    @abstractmethod
+    def list(self, user_id, language=None, since=None, until=None, limit=None, offset=0):
+        """Entradas del usuario (filtradas y paginadas)"""
+
+    @abstractmethod
+    def get(self, user_id, entry_id):
+        """Una entrada del usuario, o None si no existe"""
+
+    @abstractmethod
+    def count(self, user_id, language=None, since=None, until=None):
+        """Número de entradas del usuario (con los mismos filtros que `list`)"""
+
+    @abstractmethod
+    def clear(self, user_id):
+        """Borra el historial del usuario"""
+
+    def latest(self, user_id):
+        entries = self.list(user_id, limit=1)
+        return entries[0] if entries else None
+
+
+class InMemoryHistoryStore(HistoryStore):
+    """
+    Historial en memoria del proceso. Los usuarios se guardan en orden de uso
+    (LRU): si el total de entradas supera `max_total` se descarta el historial
+    completo de los menos recientes, para que los ids anónimos (`?uid=`) no
+    hagan crecer la memoria sin límite.
+    """
+
+    def __init__(self, max_entries=MAX_HISTORY, max_total=MAX_MEMORY_ENTRIES):
+        super().__init__(max_entries)
+        self.max_total = max_total
+        self.total = 0
+        self._entries = OrderedDict()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def add(self, user_id, phrase, language, assessment, audio_ref=None):
+        with self._lock:
+            entry = _make_entry(self._next_id, user_id, time.time(), phrase, language, assessment, audio_ref)
+            self._next_id += 1
+            entries = self._entries.setdefault(user_id, [])
+            self._entries.move_to_end(user_id)
+            entries.insert(0, entry)
+            self.total += 1
+            if self.max_entries and len(entries) > self.max_entries:
+                self.total -= len(entries) - self.max_entries
+                del entries[self.max_entries:]
+            # Expulsar a los usuarios menos recientes (nunca al actual)
+            while self.max_total and self.total > self.max_total and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.total -= len(evicted)
+        return dict(entry)
+
+    def _user_entries(self, user_id):
+        """Entradas del usuario (la lista interna; llamar con el lock) y lo marca como usado"""
+        entries = self._entries.get(user_id)
+        if entries is None:
+            return ()
+        self._entries.move_to_end(user_id)
+        return entries
+
+    def _select(self, user_id, language, since, until):
+        with self._lock:
+            entries = list(self._user_entries(user_id))
+        return [
+            dict(e) for e in entries
+            if (language is None or e["language"] == language)
+            and (since is None or e["created"] >= since)
+            and (until is None or e["created"] <= until)
+        ]
+
+    def list(self, user_id, language=None, since=None, until=None, limit=None, offset=0):
+        end = None if limit is None else offset + limit
+        if language is None and since is None and until is None:
+            # Sin filtros se copia solo la página pedida
+            with self._lock:
+                return [dict(e) for e in self._user_entries(user_id)[offset:end]]
+        return self._select(user_id, language, since, until)[offset:end]
+
+    def get(self, user_id, entry_id):
+        with self._lock:
+            for entry in self._user_entries(user_id):
+                if entry["id"] == entry_id:
+                    return dict(entry)
+        return None
+
+    def count(self, user_id, language=None, since=None, until=None):
+        if language is None and since is None and until is None:
+            with self._lock:
+                return len(self._entries.get(user_id, ()))
+        return len(self._select(user_id, language, since, until))
+
+    def clear(self, user_id):
+        with self._lock:
+            self.total -= len(self._entries.pop(user_id, ()))
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    language TEXT NOT NULL,
+    created REAL NOT NULL,
+    phrase TEXT NOT NULL,
+    assessment TEXT NOT NULL,
+    audio_ref TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_history_user_created ON history (user_id, created);
+CREATE INDEX IF NOT EXISTS idx_history_user_language_created ON history (user_id, language, created);
+"""
+
+
+class SQLiteHistoryStore(HistoryStore):
+
+    def __init__(self, path=DEFAULT_DB_PATH, max_entries=MAX_HISTORY):
+        super().__init__(max_entries)
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        # sqlite3 no permite compartir conexiones entre hilos: una por hilo
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_entry(row):
+        entry_id, user_id, language, created, phrase, assessment, audio_ref = row
+        return _make_entry(
+            entry_id, user_id, created, phrase, language,
+            AssessmentResult.from_json(json.loads(assessment)),
+            audio_ref
+        )
+
+    def add(self, user_id, phrase, language, assessment, audio_ref=None):
+        created = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "INSERT INTO history (user_id, language, created, phrase, assessment, audio_ref) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, language, created, phrase, json.dumps(assessment.to_json()), audio_ref)
+            )
+            # Conservar solo las `max_entries` más recientes del usuario
+            if self.max_entries:
+                conn.execute(
+                    "DELETE FROM history WHERE user_id = ? AND id IN "
+                    "(SELECT id FROM history WHERE user_id = ? ORDER BY created DESC, id DESC LIMIT -1 OFFSET ?)",
+                    (user_id, user_id, self.max_entries)
+                )
+        return _make_entry(cursor.lastrowid, user_id, created, phrase, language, assessment, audio_ref)
+
+    @staticmethod
+    def _where(user_id, language, since, until):
+        conditions, params = ["user_id = ?"], [user_id]
+        if language is not None:
+            conditions.append("language = ?")
+            params.append(language)
+        if since is not None:
+            conditions.append("created >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("created <= ?")
+            params.append(until)
+        return " AND ".join(conditions), params
+
+    def list(self, user_id, language=None, since=None, until=None, limit=None, offset=0):
+        where, params = self._where(user_id, language, since, until)
+        rows = self._connection().execute(
+            "SELECT id, user_id, language, created, phrase, assessment, audio_ref FROM history "
+            f"WHERE {where} ORDER BY created DESC, id DESC LIMIT ? OFFSET ?",
+            (*params, -1 if limit is None else limit, offset)
+        ).fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def get(self, user_id, entry_id):
+        row = self._connection().execute(
+            "SELECT id, user_id, language, created, phrase, assessment, audio_ref FROM history "
+            "WHERE user_id = ? AND id = ?",
+            (user_id, entry_id)
+        ).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def count(self, user_id, language=None, since=None, until=None):
+        where, params = self._where(user_id, language, since, until)
+        return self._connection().execute(f"SELECT COUNT(*) FROM history WHERE {where}", params).fetchone()[0]
+
+    def clear(self, user_id):
+        self._connection().execute("DELETE FROM history WHERE user_id = ?", (user_id,))
+
+
+class LocalKeyValueStore:
+    """
+    Sustituto en proceso de un servidor Redis con el subconjunto de comandos
+    que usa `KeyValueHistoryStore` (mismas firmas que redis-py).
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._zsets = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            return self._data.get(name)
+
+    def mget(self, keys):
+        with self._lock:
+            return [self._data.get(k) for k in keys]
+
+    def set(self, name, value):
+        with self._lock:
+            self._data[name] = value
+        return True
+
+    def delete(self, *names):
+        removed = 0
+        with self._lock:
+            for name in names:
+                removed += (self._data.pop(name, None) is not None) + (self._zsets.pop(name, None) is not None)
+        return removed
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            value = int(self._data.get(name, 0)) + amount
+            self._data[name] = value
+            return value
+
+    def zadd(self, name, mapping):
+        with self._lock:
+            zset = self._zsets.setdefault(name, [])
+            for member, score in mapping.items():
+                zset[:] = [item for item in zset if item[1] != member]
+                bisect.insort(zset, (score, member))
+        return len(mapping)
+
+    def zrem(self, name, *values):
+        with self._lock:
+            zset = self._zsets.get(name, [])
+            before = len(zset)
+            zset[:] = [item for item in zset if item[1] not in values]
+            return before - len(zset)
+
+    def zcard(self, name):
+        with self._lock:
+            return len(self._zsets.get(name, ()))
+
+    def zcount(self, name, min, max):
+        return len(self._range(name, min, max))
+
+    def zrevrangebyscore(self, name, max, min, start=None, num=None):
+        members = [member for _, member in reversed(self._range(name, min, max))]
+        if start is not None and num is not None:
+            members = members[start:] if num < 0 else members[start:start + num]
+        return members
+
+    def zrevrange(self, name, start, end):
+        with self._lock:
+            members = [member for _, member in reversed(self._zsets.get(name, ()))]
+        return members[start:] if end == -1 else members[start:end + 1]
+
+    def _range(self, name, min, max):
+        low = float("-inf") if min == "-inf" else float(min)
+        high = float("inf") if max == "+inf" else float(max)
+        with self._lock:
+            return [item for item in self._zsets.get(name, ()) if low <= item[0] <= high]
+
+
+class KeyValueHistoryStore(HistoryStore):
+    """
+    Historial sobre un almacén clave-valor compatible con Redis.
+
+    - history:{user}:{id}        JSON de la entrada
+    - history:{user}             sorted set de ids por fecha (índice por usuario)
+    - history:{user}:lang:{code} sorted set de ids por fecha (índice por idioma)
+    """
+
+    def __init__(self, client=None, max_entries=MAX_HISTORY, prefix="history"):
+        super().__init__(max_entries)
+        self.client = client if client is not None else LocalKeyValueStore()
+        self.prefix = prefix
+
+    def _index(self, user_id, language=None):
+        if language is None:
+            return f"{self.prefix}:{user_id}"
+        return f"{self.prefix}:{user_id}:lang:{language}"
+
+    def _key(self, user_id, entry_id):
+        return f"{self.prefix}:{user_id}:{entry_id}"
+
+    def add(self, user_id, phrase, language, assessment, audio_ref=None):
+        created = time.time()
+        entry_id = int(self.client.incr(f"{self.prefix}:seq"))
+        key = self._key(user_id, entry_id)
+
+        self.client.set(key, json.dumps({
+            "created": created,
+            "phrase": phrase,
+            "language": language,
+            "assessment": assessment.to_json(),
+            "audio_ref": audio_ref
+        }))
+        self.client.zadd(self._index(user_id), {entry_id: created})
+        self.client.zadd(self._index(user_id, language), {entry_id: created})
+
+        self._trim(user_id)
+        return _make_entry(entry_id, user_id, created, phrase, language, assessment, audio_ref)
+
+    def _trim(self, user_id):
+        if not self.max_entries:
+            return
+        expired = self.client.zrevrange(self._index(user_id), self.max_entries, -1)
+        for entry_id in expired:
+            entry_id = int(entry_id)
+            data = self.client.get(self._key(user_id, entry_id))
+            if data is not None:
+                language = json.loads(data)["language"]
+                self.client.zrem(self._index(user_id, language), entry_id)
+            self.client.zrem(self._index(user_id), entry_id)
+            self.client.delete(self._key(user_id, entry_id))
+
+    def _load(self, user_id, entry_ids):
+        keys = [self._key(user_id, int(i)) for i in entry_ids]
+        if not keys:
+            return []
+        values = self.client.mget(keys)
+
+        entries = []
+        for entry_id, value in zip(entry_ids, values):
+            if value is None:
+                continue
+            data = json.loads(value)
+            entries.append(_make_entry(
+                int(entry_id), user_id, data["created"], data["phrase"], data["language"],
+                AssessmentResult.from_json(data["assessment"]), data.get("audio_ref")
+            ))
+        return entries
+
+    def list(self, user_id, language=None, since=None, until=None, limit=None, offset=0):
+        entry_ids = self.client.zrevrangebyscore(
+            self._index(user_id, language),
+            "+inf" if until is None else until,
+            "-inf" if since is None else since,
+            start=offset,
+            num=-1 if limit is None else limit
+        )
+        return self._load(user_id, entry_ids)
+
+    def get(self, user_id, entry_id):
+        entries = self._load(user_id, [entry_id])
+        return entries[0] if entries else None
+
+    def count(self, user_id, language=None, since=None, until=None):
+        return self.client.zcount(
+            self._index(user_id, language),
+            "-inf" if since is None else since,
+            "+inf" if until is None else until
+        )
+
+    def clear(self, user_id):
+        for entry_id in self.client.zrevrange(self._index(user_id), 0, -1):
+            entry = self._load(user_id, [entry_id])
+            if entry:
+                self.client.delete(self._index(user_id, entry[0]["language"]))
+            self.client.delete(self._key(user_id, int(entry_id)))
+        self.client.delete(self._index(user_id))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def create_history_store():
+    """Crea el backend indicado por HISTORY_BACKEND"""
+    backend = os.getenv("HISTORY_BACKEND", "memory").lower()
+    max_entries = int(os.getenv("HISTORY_MAX_ENTRIES", MAX_HISTORY))
+
+    if backend == "sqlite":
+        return SQLiteHistoryStore(os.getenv("HISTORY_DB_PATH", DEFAULT_DB_PATH), max_entries=max_entries)
+
+    if backend in ("kv", "redis"):
+        client = None
+        redis_url = os.getenv("HISTORY_REDIS_URL")
+        if redis_url:
+            import redis
+            client = redis.Redis.from_url(redis_url)
+        return KeyValueHistoryStore(client, max_entries=max_entries)
+
+    return InMemoryHistoryStore(
+        max_entries=max_entries, max_total=int(os.getenv("HISTORY_MEMORY_MAX_TOTAL", MAX_MEMORY_ENTRIES))
+    )
+
+
+def get_history_store():
+    """Backend de historial compartido por todo el proceso"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = create_history_store()
+        return _store
@@ -0,0 +1,412 @@
+"""
+jobs.py
+-------
+Cola de evaluaciones en segundo plano.
+
+La página entrega la evaluación (`submit`) y recibe un id de trabajo al
+momento; un pool de hilos la ejecuta con `PronunciationEvaluator` y la página
+consulta el estado (`get`) hasta que termina, sin bloquear el rerun.
+
+- La cola es una tabla SQLite (modo WAL): los trabajos pendientes sobreviven a
+  un reinicio y varios procesos del mismo host pueden compartirla.
+- Prioridades: se atiende primero la prioridad más alta y, a igualdad, el
+  trabajo más antiguo.
+- Timeouts: cada trabajo tiene un plazo desde que se entrega; si vence en la
+  cola o ejecutándose, queda en estado "timeout" y su resultado se descarta.
+- Trabajos de un proceso que murió a mitad de ejecución vuelven a la cola.
+- El audio no se escribe en la tabla: se guarda el WAV original, sin
+  recomprimir, en un directorio junto a la base de datos (almacén de audio
+  direccionado por contenido) y la tabla solo tiene su referencia. Así un
+  trabajo que vuelve a la cola tras un reinicio se evalúa con los mismos
+  bytes que se entregaron (misma clave de caché) y no hay que codificar nada
+  al encolar. El audio se borra cuando ningún trabajo pendiente lo usa.
+
+Los hilos llaman al evaluador compartido (con SPEECH_BACKEND=fake, al backend
+local), que ya limita las peticiones simultáneas al servicio.
+
+Estados: queued -> running -> done | failed | timeout
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from app.services.assessment import AssessmentResult
+from app.services.audio_store import DirectoryAudioStore, MemoryAudioStore
+from app.services.scheduler import PRIORITY_INTERACTIVE
+
+DEFAULT_JOBS_PATH = os.path.join(".cache", "jobs.sqlite3")
+DEFAULT_WORKERS = 4
+DEFAULT_TIMEOUT = 120.0
+# Los trabajos terminados se borran pasado este tiempo (s)
+DEFAULT_RETENTION = 24 * 3600
+
+# Espera máxima de un hilo sin trabajo antes de volver a mirar la cola (s)
+POLL_INTERVAL = 0.5
+
+FINISHED = ("done", "failed", "timeout")
+
+
+def default_audio_path(path):
+    """Directorio del audio de la cola: junto a la base de datos (.cache/jobs.sqlite3 -> .cache/jobs-audio)"""
+    return f"{os.path.splitext(path)[0]}-audio"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    user_id TEXT,
+    phrase TEXT NOT NULL,
+    language TEXT NOT NULL,
+    audio_ref TEXT,
+    created REAL NOT NULL,
+    deadline REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority DESC, created);
+"""
+
+
+# Distingue este proceso de uno anterior con el mismo host y PID (un contenedor
+# reiniciado vuelve a ser el PID 1 con el mismo hostname)
+_PROCESS_TOKEN = uuid.uuid4().hex[:12]
+
+
+def _worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{_PROCESS_TOKEN}"
+
+
+def _process_alive(worker):
+    """False si `worker` es un proceso de este host que ya no existe"""
+    host, _, rest = (worker or "").partition(":")
+    pid, _, token = rest.partition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        # Otro host: no se puede saber, se deja al plazo del trabajo
+        return True
+    if int(pid) == os.getpid():
+        # Mismo PID: solo sigue vivo si es este mismo proceso
+        return token == _PROCESS_TOKEN
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class JobQueue:
+
+    def __init__(self, path=DEFAULT_JOBS_PATH, default_timeout=DEFAULT_TIMEOUT, retention=DEFAULT_RETENTION,
+                 audio_store=None):
+        self.path = path
+        self.default_timeout = default_timeout
+        self.retention = retention
+        if audio_store is None:
+            audio_store = DirectoryAudioStore(default_audio_path(path), codec="wav")
+        elif isinstance(audio_store, MemoryAudioStore):
+            # Tras un reinicio los trabajos vuelven a la cola pero su audio ya no existiría
+            raise ValueError("La cola de trabajos necesita un almacén de audio persistente")
+        self.audio_store = audio_store
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "audio_ref" not in columns:
+            # Cola creada cuando el audio se guardaba en la propia tabla
+            conn.execute("ALTER TABLE jobs ADD COLUMN audio_ref TEXT")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv("JOBS_DB_PATH", DEFAULT_JOBS_PATH),
+            default_timeout=float(os.getenv("JOBS_TIMEOUT", DEFAULT_TIMEOUT)),
+            retention=float(os.getenv("JOBS_RETENTION", DEFAULT_RETENTION)),
+        )
+
+    def _connection(self):
+        # sqlite3 no permite compartir conexiones entre hilos: una por hilo
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def submit(self, audio_bytes, phrase, language, priority=0, timeout=None, user_id=None):
+        """Encola una evaluación y devuelve su id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        timeout = timeout if timeout is not None else self.default_timeout
+        conn = self._connection()
+        # Audio e inserción en la misma transacción: `_drop_audio` no puede borrar
+        # el archivo entre que se comprueba que existe y se registra el trabajo
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ref = self.audio_store.put(audio_bytes)
+            conn.execute(
+                "INSERT INTO jobs (id, status, priority, user_id, phrase, language, audio_ref, created, deadline) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, priority, user_id, phrase, language, ref, now, now + timeout)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def claim(self, worker=None):
+        """
+        Toma el siguiente trabajo (prioridad más alta, más antiguo primero) y lo
+        marca como "running". Devuelve un dict con la referencia del audio
+        (ver `audio`), o None si no hay.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "UPDATE jobs SET status = 'running', started = ?, worker = ?, attempts = attempts + 1 "
+                "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND deadline > ? "
+                "ORDER BY priority DESC, created LIMIT 1) "
+                "RETURNING id, priority, user_id, phrase, language, audio_ref, created, deadline",
+                (now, worker or _worker_name(), now)
+            ).fetchone()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return dict(row) if row is not None else None
+
+    def audio(self, job):
+        """WAV del trabajo (los mismos bytes que se entregaron), o None si ya no está disponible"""
+        if not job.get("audio_ref"):
+            return None
+        return self.audio_store.get_wav(job["audio_ref"])
+
+    def _drop_audio(self, conn, refs):
+        """Borra el audio que ya no usa ningún trabajo pendiente (dentro de una transacción)"""
+        for ref in set(refs):
+            if ref and conn.execute(
+                "SELECT 1 FROM jobs WHERE audio_ref = ? AND status IN ('queued', 'running') LIMIT 1", (ref,)
+            ).fetchone() is None:
+                self.audio_store.delete(ref)
+
+    def complete(self, job_id, result):
+        """
+        Guarda el resultado de `evaluate_pronunciation_bytes`. Si el trabajo ya no
+        está en ejecución (venció su plazo) no se guarda y devuelve False.
+        """
+        stored = {
+            "json_result": result.get("json_result"),
+            "preprocessing": result.get("preprocessing"),
+            "cached": bool(result.get("cached")),
+        }
+        status = "done" if result.get("success") else "failed"
+        return self._finish(job_id, status, json.dumps(stored), result.get("error"))
+
+    def fail(self, job_id, error):
+        return self._finish(job_id, "failed", None, error)
+
+    def _finish(self, job_id, status, result, error):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, result = ?, error = ? "
+                "WHERE id = ? AND status = 'running' RETURNING audio_ref",
+                (status, time.time(), result, error, job_id)
+            ).fetchone()
+            if row is not None:
+                self._drop_audio(conn, [row["audio_ref"]])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return row is not None
+
+    def get(self, job_id):
+        """
+        Estado del trabajo: dict con id, status, priority, created, started,
+        finished, error y, si terminó bien, "assessment" y "preprocessing".
+        None si no existe.
+        """
+        row = self._select(job_id)
+        if row is not None and row["status"] in ("queued", "running") and row["deadline"] <= time.time():
+            # Vencido aunque el reaper aún no haya pasado
+            self.expire()
+            row = self._select(job_id)
+        if row is None:
+            return None
+
+        job = dict(row)
+        raw = job.pop("result")
+        stored = json.loads(raw) if raw else {}
+        job["success"] = job["status"] == "done"
+        job["assessment"] = AssessmentResult.from_json(stored["json_result"]) if job["success"] else None
+        job["preprocessing"] = stored.get("preprocessing")
+        job["cached"] = stored.get("cached", False)
+        if job["status"] == "queued":
+            job["position"] = self._position(job)
+        return job
+
+    def _select(self, job_id):
+        return self._connection().execute(
+            "SELECT id, status, priority, user_id, phrase, language, created, deadline, started, finished, "
+            "attempts, result, error FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+
+    def _position(self, job):
+        """Trabajos que se atenderán antes que este"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+            "(priority > ? OR (priority = ? AND created < ?))",
+            (job["priority"], job["priority"], job["created"])
+        ).fetchone()[0]
+
+    def expire(self):
+        """
+        Marca como "timeout" los trabajos cuyo plazo ha vencido, devuelve a la cola
+        los de procesos que ya no existen y borra los terminados antiguos.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = conn.execute(
+                "UPDATE jobs SET status = 'timeout', finished = ?, "
+                "error = 'La evaluación ha superado el tiempo máximo' "
+                "WHERE status IN ('queued', 'running') AND deadline <= ? RETURNING audio_ref",
+                (now, now)
+            ).fetchall()
+            self._drop_audio(conn, [row["audio_ref"] for row in expired])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        orphans = [
+            row["id"] for row in conn.execute("SELECT id, worker FROM jobs WHERE status = 'running'")
+            if not _process_alive(row["worker"])
+        ]
+        for job_id in orphans:
+            conn.execute("UPDATE jobs SET status = 'queued', worker = NULL WHERE id = ? AND status = 'running'", (job_id,))
+
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed', 'timeout') AND finished < ?",
+            (now - self.retention,)
+        )
+        return len(expired)
+
+    def stats(self):
+        """Trabajos por estado"""
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def wait_for_work(self, timeout=POLL_INTERVAL):
+        """Espera a que se encole algo en este proceso (o a que pase `timeout`)"""
+        with self._wakeup:
+            self._wakeup.wait(timeout)
+
+    def wake_all(self):
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+
+class JobWorkerPool:
+    """Hilos que ejecutan los trabajos de la cola con el evaluador"""
+
+    def __init__(self, queue, evaluator, workers=DEFAULT_WORKERS):
+        self.queue = queue
+        self.evaluator = evaluator
+        self.workers = workers
+        self._stop = threading.Event()
+        self._threads = []
+        self._worker = _worker_name()
+
+    def start(self):
+        self.queue.expire()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._reap, name="job-reaper", daemon=True).start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self.queue.wake_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _reap(self):
+        while not self._stop.wait(max(1.0, POLL_INTERVAL)):
+            try:
+                self.queue.expire()
+            except sqlite3.Error:
+                pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim(self._worker)
+            except sqlite3.OperationalError:
+                # Base de datos ocupada por otro proceso: se reintenta
+                job = None
+            if job is None:
+                self.queue.wait_for_work()
+                continue
+            self.run_job(job)
+
+    def run_job(self, job):
+        try:
+            audio_bytes = self.queue.audio(job)
+            if audio_bytes is None:
+                self.queue.fail(job["id"], "La grabación ya no está disponible")
+                return
+            result = self.evaluator.evaluate_pronunciation_bytes(
+                audio_bytes, job["phrase"], job["language"], priority=job["priority"]
+            )
+            self.queue.complete(job["id"], result)
+        except Exception as e:
+            # Un trabajo que falla no debe tumbar el hilo
+            self.queue.fail(job["id"], f"Error durante la evaluación: {str(e)}")
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    Cola compartida por todo el proceso (JOBS_DB_PATH), con JOBS_WORKERS hilos
+    ejecutando trabajos con el evaluador compartido.
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            from app.services.speech import get_evaluator
+
+            queue = JobQueue.from_env()
+            JobWorkerPool(queue, get_evaluator(), int(os.getenv("JOBS_WORKERS", DEFAULT_WORKERS))).start()
+            _queue = queue
+        return _queue
@@ -0,0 +1,256 @@
+"""
+metrics.py
+----------
+Métricas de la aplicación en formato Prometheus y trazas OpenTelemetry opcionales.
+
+- `span(stage)`: mide una etapa (validación, caché, preprocesado, cola, llamada
+  al servicio, parseo, gráficos...) y la acumula en el histograma
+  `pronunciation_stage_seconds{stage=...}`. Si OpenTelemetry está instalado y
+  METRICS_OTEL=on, además abre un span anidado en la traza actual.
+- Contadores de evaluaciones, aciertos/fallos de caché y errores del servicio
+  por `CancellationReason` y código de error.
+- `start_metrics_server()`: expone `/metrics` en METRICS_PORT (sin definir, no
+  se abre ningún puerto). `render_metrics()` devuelve el mismo texto.
+
+No depende de `prometheus_client`: el formato de texto se genera aquí.
+"""
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [conteos por bucket..., suma, total]
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [le])} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [le])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "pronunciation_stage_seconds", "Duración de cada etapa de la evaluación", ("stage",)
+)
+EVALUATIONS = Counter(
+    "pronunciation_evaluations_total", "Evaluaciones por backend y resultado", ("backend", "outcome")
+)
+CACHE_LOOKUPS = Counter(
+    "pronunciation_cache_lookups_total", "Consultas a la caché de evaluaciones", ("result",)
+)
+SPEECH_ERRORS = Counter(
+    "pronunciation_speech_errors_total", "Errores del servicio de voz por CancellationReason y código",
+    ("reason", "code")
+)
+
+REGISTRY = [STAGE_SECONDS, EVALUATIONS, CACHE_LOOKUPS, SPEECH_ERRORS]
+
+
+def register(metric):
+    """Añade una métrica propia al registro que se exporta"""
+    REGISTRY.append(metric)
+    return metric
+
+
+def render_metrics():
+    """Todas las métricas en formato de texto de Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+_tracer = None
+_tracer_checked = False
+
+
+def _get_tracer():
+    """Tracer de OpenTelemetry si está instalado y METRICS_OTEL=on; si no, None"""
+    global _tracer, _tracer_checked
+    if not _tracer_checked:
+        _tracer_checked = True
+        if os.getenv("METRICS_OTEL", "off").lower() in ("1", "on", "true", "yes"):
+            try:
+                from opentelemetry import trace
+                _tracer = trace.get_tracer("pronunciation")
+            except ImportError:
+                _tracer = None
+    return _tracer
+
+
+class Span:
+    """Mide una etapa; `elapsed` queda disponible al salir del bloque"""
+
+    __slots__ = ("stage", "attributes", "start", "elapsed", "_otel")
+
+    def __init__(self, stage, attributes):
+        self.stage = stage
+        self.attributes = attributes
+        self.start = None
+        self.elapsed = 0.0
+        self._otel = None
+
+    def __enter__(self):
+        tracer = _get_tracer()
+        if tracer is not None:
+            self._otel = tracer.start_as_current_span(f"pronunciation.{self.stage}", attributes=self.attributes)
+            self._otel.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(self.elapsed, stage=self.stage)
+        if self._otel is not None:
+            self._otel.__exit__(exc_type, exc, tb)
+        return False
+
+
+def span(stage, **attributes):
+    return Span(stage, attributes)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, addr=None):
+    """
+    Sirve /metrics en un hilo en segundo plano (una sola vez por proceso).
+    Sin `port` usa METRICS_PORT; si no está definida no hace nada.
+    """
+    global _server
+    port = port if port is not None else os.getenv("METRICS_PORT")
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((addr or os.getenv("METRICS_ADDR", "127.0.0.1"), int(port)), _MetricsHandler)
+            except OSError:
+                # Puerto ocupado (p. ej. otro proceso ya exporta): se sigue sin servidor
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
@@ -0,0 +1,259 @@
+"""
+profiling.py
+------------
+Perfilado bajo demanda de los reruns de Streamlit y de las evaluaciones.
+
+Streamlit vuelve a ejecutar la página entera en cada interacción; para saber
+qué líneas de `pages/*.py` dominan ese tiempo con datos reales, cada página se
+ejecuta dentro de `profile_page(nombre)` y cada evaluación dentro de
+`profiled(nombre)`. Si el perfilado está apagado (por defecto) el coste es
+comprobar una variable.
+
+- PROFILE: `off` (por defecto), `on` (perfila una fracción de los reruns y de
+  las evaluaciones) o `query` (solo los reruns abiertos con `?profile=1`).
+  Con `on`, `?profile=1` también fuerza el perfilado de ese rerun.
+- PROFILE_ENGINE: `cprofile` (determinista, archivos `.pstats`) o `sample`
+  (muestreo de la pila cada PROFILE_INTERVAL segundos, archivos `.collapsed`
+  para flamegraph.pl o speedscope). El muestreo apenas frena la página.
+- PROFILE_SAMPLE_RATE: fracción de reruns/evaluaciones perfilados con `on`.
+- PROFILE_DIR / PROFILE_MAX_FILES: directorio de salida; al superar el máximo
+  se borran los perfiles más antiguos.
+
+Una evaluación lanzada desde una página ya perfilada queda dentro del perfil de
+la página (no se abre otro). Para ver los perfiles guardados:
+
+    python -m app.services.profiling --top 25
+    python -m app.services.profiling .cache/profiles/20250101-120000-123-historial-42.pstats
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_EXTENSIONS = (".pstats", ".collapsed")
+
+_local = threading.local()
+
+
+class ProfileSettings:
+    """Configuración del perfilado (ver el docstring del módulo)"""
+
+    def __init__(self, mode="off", engine="cprofile", sample_rate=0.1, interval=0.005,
+                 directory=".cache/profiles", max_files=200):
+        if engine not in ("cprofile", "sample"):
+            raise ValueError(f"Motor de perfilado no soportado: {engine}")
+        self.mode = mode
+        self.engine = engine
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.directory = directory
+        self.max_files = max_files
+        self._rng = random.Random()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.getenv("PROFILE", "off").lower(),
+            engine=os.getenv("PROFILE_ENGINE", "cprofile").lower(),
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 0.1)),
+            interval=float(os.getenv("PROFILE_INTERVAL", 0.005)),
+            directory=os.getenv("PROFILE_DIR", os.path.join(".cache", "profiles")),
+            max_files=int(os.getenv("PROFILE_MAX_FILES", 200))
+        )
+
+    @property
+    def enabled(self):
+        return self.mode in ("on", "query")
+
+    def sampled(self):
+        """Decide si se perfila la siguiente ejecución (solo en modo `on`)"""
+        return self.mode == "on" and self._rng.random() < self.sample_rate
+
+
+_settings = None
+
+
+def get_profile_settings():
+    global _settings
+    if _settings is None:
+        _settings = ProfileSettings.from_env()
+    return _settings
+
+
+class _CProfileEngine:
+
+    extension = ".pstats"
+
+    def __init__(self, settings):
+        import cProfile
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def dump(self, path):
+        self._profile.dump_stats(path)
+
+
+class _SamplingEngine:
+    """Muestrea la pila del hilo actual desde otro hilo (formato "collapsed")"""
+
+    extension = ".collapsed"
+
+    def __init__(self, settings):
+        self.interval = settings.interval
+        self.stacks = Counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._sampler.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+ENGINES = {"cprofile": _CProfileEngine, "sample": _SamplingEngine}
+
+
+class Profiled:
+    """
+    Perfila el bloque si `active`; si ya hay un perfil abierto en este hilo
+    no abre otro (lo anidado queda dentro del de fuera). `path` es el archivo
+    escrito, o None.
+    """
+
+    def __init__(self, name, active, settings=None):
+        self.name = name
+        self.active = active
+        self.settings = settings or get_profile_settings()
+        self.path = None
+        self._engine = None
+
+    def __enter__(self):
+        if self.active and not getattr(_local, "profiling", False):
+            _local.profiling = True
+            self._engine = ENGINES[self.settings.engine](self.settings)
+            self._start = time.perf_counter()
+            self._engine.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._engine is None:
+            return False
+        self._engine.stop()
+        _local.profiling = False
+        # st.stop()/st.switch_page() terminan la página con una excepción: el perfil se guarda igual
+        try:
+            self.path = write_profile(self._engine, self.name, time.perf_counter() - self._start, self.settings)
+        except OSError:
+            self.path = None
+        return False
+
+
+def profiled(name):
+    """Perfila una ejecución fuera de Streamlit (evaluaciones) según PROFILE y el muestreo"""
+    settings = get_profile_settings()
+    return Profiled(name, settings.sampled(), settings)
+
+
+def profile_page(name):
+    """Perfila un rerun de la página `name` (muestreo o `?profile=1`)"""
+    settings = get_profile_settings()
+    if not settings.enabled:
+        return Profiled(name, False, settings)
+
+    import streamlit as st
+    requested = st.query_params.get("profile", "").lower() in ("1", "on", "true", "yes")
+    return Profiled(name, requested or settings.sampled(), settings)
+
+
+def write_profile(engine, name, elapsed, settings):
+    """Guarda el perfil en el directorio rotatorio y devuelve su ruta"""
+    os.makedirs(settings.directory, exist_ok=True)
+    now = time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+    filename = f"{stamp}-{int(now * 1000) % 1000:03d}-{name}-{os.getpid()}-{elapsed * 1000:.0f}ms{engine.extension}"
+    path = os.path.join(settings.directory, filename)
+    engine.dump(path)
+    _rotate(settings.directory, settings.max_files)
+    return path
+
+
+def list_profiles(directory):
+    """Perfiles del directorio, del más antiguo al más reciente"""
+    try:
+        names = [n for n in os.listdir(directory) if n.endswith(PROFILE_EXTENSIONS)]
+    except FileNotFoundError:
+        return []
+    paths = [os.path.join(directory, n) for n in names]
+    return sorted(paths, key=lambda p: (os.path.getmtime(p), p))
+
+
+def _rotate(directory, max_files):
+    if not max_files:
+        return
+    paths = list_profiles(directory)
+    for path in paths[:max(0, len(paths) - max_files)]:
+        try:
+            os.remove(path)
+        except OSError:
+            # Otra réplica o proceso ya lo ha borrado
+            pass
+
+
+def main():
+    import argparse
+    import pstats
+
+    parser = argparse.ArgumentParser(description="Muestra los perfiles guardados")
+    parser.add_argument("profile", nargs="?", help="Archivo de perfil (por defecto, el más reciente)")
+    parser.add_argument("--dir", default=None, help="Directorio de perfiles (PROFILE_DIR)")
+    parser.add_argument("--top", type=int, default=20, help="Funciones o pilas a mostrar")
+    parser.add_argument("--sort", default="cumulative", help="Orden de pstats (cumulative, tottime...)")
+    args = parser.parse_args()
+
+    path = args.profile
+    if path is None:
+        profiles = list_profiles(args.dir or get_profile_settings().directory)
+        if not profiles:
+            parser.error("no hay perfiles guardados")
+        path = profiles[-1]
+
+    print(path)
+    if path.endswith(".collapsed"):
+        with open(path, encoding="utf-8") as f:
+            for line in f.readlines()[:args.top]:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                print(f"{count:>7}  {stack.split(';')[-1]}  <-  {' ; '.join(stack.split(';')[-4:-1])}")
+    else:
+        pstats.Stats(path).sort_stats(args.sort).print_stats(args.top)
+
+
+if __name__ == "__main__":
+    main()
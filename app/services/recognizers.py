@@ -0,0 +1,224 @@
+"""
+recognizers.py
+--------------
+Fábrica de reconocedores de Azure Speech reutilizable entre evaluaciones.
+
+- Cachea un `SpeechConfig` por idioma en lugar de construirlo en cada llamada.
+- Mantiene reconocedores "calientes": creados de antemano y con la conexión al
+  servicio ya abierta, listos para recibir el audio en cuanto llega.
+
+El audio se entrega mediante un pull stream (`MemoryAudioCallback`) al que se
+le asigna el memoryview con el PCM justo antes de reconocer.
+"""
+
+import threading
+import time
+
+import azure.cognitiveservices.speech as speechsdk
+
+from app.services.metrics import span
+
+# Formato por defecto de las grabaciones del navegador (audio_recorder a 16 kHz)
+DEFAULT_STREAM_FORMAT = (16000, 16, 1)
+
+# Pasado este tiempo una conexión precalentada se considera caducada y se renueva
+WARM_CONNECTION_TTL = 240
+
+# Reconocedores calientes que se mantienen por idioma y formato
+WARM_POOL_SIZE = 1
+
+# Contenedores comprimidos que acepta el SDK (en Linux necesitan GStreamer)
+COMPRESSED_STREAM_FORMATS = {
+    "opus": speechsdk.audio.AudioStreamContainerFormat.OGG_OPUS,
+    "flac": speechsdk.audio.AudioStreamContainerFormat.FLAC,
+}
+
+
+def stream_format_key(info):
+    """Clave (sample_rate, bits, canales) a partir de la cabecera WAV"""
+    return info["sample_rate"], info["bits_per_sample"], info["channels"]
+
+
+class MemoryAudioCallback(speechsdk.audio.PullAudioInputStreamCallback):
+    """
+    Fuente de audio para el SDK que lee directamente de un memoryview.
+    El memoryview puede asignarse más tarde con `attach` (reconocedores precalentados).
+    """
+
+    def __init__(self, view=None):
+        super().__init__()
+        self._view = view if view is not None else memoryview(b"")
+        self._pos = 0
+
+    def attach(self, view):
+        self._view = view
+        self._pos = 0
+
+    def read(self, buffer: memoryview) -> int:
+        size = min(buffer.nbytes, self._view.nbytes - self._pos)
+        if size <= 0:
+            return 0
+        buffer[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def close(self) -> None:
+        self._view = memoryview(b"")
+
+
+class _WarmRecognizer:
+    __slots__ = ("recognizer", "callback", "connection", "created")
+
+    def __init__(self, recognizer, callback, connection):
+        self.recognizer = recognizer
+        self.callback = callback
+        self.connection = connection
+        self.created = time.monotonic()
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+
+class RecognizerFactory:
+    """
+    Crea reconocedores por idioma reutilizando la configuración y,
+    si existen, las conexiones abiertas de antemano con `warm_up`.
+    """
+
+    def __init__(self, speech_key, service_region, warm_ttl=WARM_CONNECTION_TTL, pool_size=WARM_POOL_SIZE):
+        self.speech_key = speech_key
+        self.service_region = service_region
+        self.warm_ttl = warm_ttl
+        self.pool_size = pool_size
+        self._configs = {}
+        self._warm = {}
+        # Claves (idioma, formato) con una reposición en curso
+        self._replenishing = set()
+        self._lock = threading.Lock()
+
+    def get_speech_config(self, language):
+        """Devuelve el SpeechConfig del idioma (se construye una sola vez)"""
+        with self._lock:
+            speech_config = self._configs.get(language)
+            if speech_config is None:
+                with span("speech_config"):
+                    speech_config = speechsdk.SpeechConfig(
+                        subscription=self.speech_key,
+                        region=self.service_region
+                    )
+                    speech_config.speech_recognition_language = language
+                self._configs[language] = speech_config
+            return speech_config
+
+    def _build(self, language, fmt):
+        with span("recognizer_build"):
+            return self._create(language, fmt)
+
+    def _create(self, language, fmt):
+        # `fmt` es (sample_rate, bits, canales) para PCM o el nombre de un contenedor comprimido
+        if fmt in COMPRESSED_STREAM_FORMATS:
+            stream_format = speechsdk.audio.AudioStreamFormat(
+                compressed_stream_format=COMPRESSED_STREAM_FORMATS[fmt]
+            )
+        else:
+            sample_rate, bits, channels = fmt
+            stream_format = speechsdk.audio.AudioStreamFormat(
+                samples_per_second=sample_rate,
+                bits_per_sample=bits,
+                channels=channels
+            )
+        callback = MemoryAudioCallback()
+        stream = speechsdk.audio.PullAudioInputStream(callback, stream_format)
+        recognizer = speechsdk.SpeechRecognizer(
+            speech_config=self.get_speech_config(language),
+            audio_config=speechsdk.audio.AudioConfig(stream=stream)
+        )
+        return recognizer, callback
+
+    def warm_up(self, language, fmt=DEFAULT_STREAM_FORMAT):
+        """
+        Deja preparados reconocedores con la conexión ya abierta para el idioma.
+        Es idempotente: si ya hay conexiones vigentes no hace nada.
+        """
+        key = (language, fmt)
+        now = time.monotonic()
+
+        with self._lock:
+            pool = self._warm.setdefault(key, [])
+            stale = [w for w in pool if now - w.created > self.warm_ttl]
+            pool[:] = [w for w in pool if now - w.created <= self.warm_ttl]
+            missing = self.pool_size - len(pool)
+
+        for warm in stale:
+            warm.close()
+
+        for _ in range(missing):
+            recognizer, callback = self._build(language, fmt)
+            connection = speechsdk.Connection.from_recognizer(recognizer)
+            # open() no bloquea: el handshake continúa en segundo plano
+            connection.open(False)
+            warm = _WarmRecognizer(recognizer, callback, connection)
+            with self._lock:
+                pool = self._warm.setdefault(key, [])
+                if len(pool) < self.pool_size:
+                    pool.append(warm)
+                    warm = None
+            if warm is not None:
+                # Otro hilo ya completó el pool mientras conectábamos
+                warm.close()
+
+    def acquire(self, language, fmt, continuous=False):
+        """
+        Devuelve (recognizer, callback) listo para usar una sola vez.
+        Usa un reconocedor caliente si lo hay (descartando los que superan
+        `warm_ttl`, cuya conexión el servicio ya habrá cerrado) y repone el
+        hueco consumido. Las conexiones calientes se abren para `recognize_once`,
+        así que el modo continuo siempre usa un reconocedor nuevo.
+        """
+        if continuous:
+            return self._build(language, fmt)
+
+        key = (language, fmt)
+        now = time.monotonic()
+        warm, stale = None, []
+        with self._lock:
+            pool = self._warm.get(key) or []
+            while pool and warm is None:
+                candidate = pool.pop()
+                if now - candidate.created <= self.warm_ttl:
+                    warm = candidate
+                else:
+                    stale.append(candidate)
+
+        for candidate in stale:
+            candidate.close()
+        if warm is not None or stale:
+            # Reponer en segundo plano para no retrasar esta evaluación
+            self._replenish(language, fmt)
+
+        if warm is None:
+            return self._build(language, fmt)
+        return warm.recognizer, warm.callback
+
+    def _replenish(self, language, fmt):
+        """`warm_up` en un hilo, como mucho uno a la vez por idioma y formato"""
+        key = (language, fmt)
+        with self._lock:
+            if key in self._replenishing:
+                return
+            self._replenishing.add(key)
+
+        def run():
+            try:
+                self.warm_up(language, fmt)
+            except Exception:
+                # Precalentar es una optimización: se volverá a intentar en el siguiente acquire
+                pass
+            finally:
+                with self._lock:
+                    self._replenishing.discard(key)
+
+        threading.Thread(target=run, name="speech-replenish", daemon=True).start()
@@ -0,0 +1,296 @@
+"""
+router.py
+---------
+Reparto de evaluaciones entre varios recursos de Speech (clave/región).
+
+Con una sola clave el techo de throughput es la cuota de ese recurso.
+`RouterBackend` es un `SpeechBackend` que delega en varios backends
+("endpoints") y para cada petición elige uno:
+
+- "least_outstanding" (por defecto): el que tiene menos peticiones en curso;
+  a igualdad, el de menor latencia media.
+- "latency": el de menor (peticiones en curso + 1) x latencia media (EWMA),
+  para mandar menos tráfico a regiones lentas.
+
+Salud: tras `failure_threshold` fallos del endpoint seguidos (429, 503,
+conexión, credenciales del recurso... o un error de red) queda fuera
+`cooldown` segundos; después vuelve a recibir tráfico y un nuevo fallo lo
+saca otra vez. Si una petición falla por el endpoint se reintenta al momento
+en el siguiente (failover); si están todos fuera se usa el que antes vuelve.
+Los errores de la propia petición (audio no válido, sin voz, frase
+rechazada...) se devuelven tal cual: fallarían igual en cualquier endpoint.
+
+Configuración: AZURE_SPEECH_ENDPOINTS=región:clave,región:clave (o una por
+línea en secrets.toml). Para probar sin Azure, SPEECH_BACKEND=fake con
+SPEECH_FAKE_ENDPOINTS=latencia[:tasa_error],... crea varios backends locales.
+"""
+
+import threading
+import time
+
+from app.services.backends import SpeechBackend
+from app.services.metrics import Counter, Gauge, register
+from app.services.scheduler import TRANSIENT_ERROR_CODES
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN = 30.0
+# Peso de la última muestra en la latencia media (EWMA)
+LATENCY_ALPHA = 0.2
+
+STRATEGIES = ("least_outstanding", "latency")
+
+# Cancelaciones que dependen del endpoint y no de la petición: las transitorias
+# y las de credenciales o permisos de ese recurso
+ENDPOINT_ERROR_CODES = TRANSIENT_ERROR_CODES | {"AuthenticationFailure", "Forbidden"}
+
+# Excepciones de red; cualquier otra (audio mal formado, error del SDK con esta
+# petición...) es de la petición y no saca al endpoint del reparto
+ENDPOINT_EXCEPTIONS = (OSError,)
+
+ENDPOINT_REQUESTS = register(Counter(
+    "pronunciation_endpoint_requests_total", "Peticiones por endpoint y resultado", ("endpoint", "outcome")
+))
+ENDPOINT_OUTSTANDING = register(Gauge(
+    "pronunciation_endpoint_outstanding", "Peticiones en curso por endpoint", ("endpoint",)
+))
+ENDPOINT_HEALTHY = register(Gauge(
+    "pronunciation_endpoint_healthy", "1 si el endpoint recibe tráfico, 0 si está fuera por errores", ("endpoint",)
+))
+ENDPOINT_LATENCY = register(Gauge(
+    "pronunciation_endpoint_latency_seconds", "Latencia media (EWMA) por endpoint", ("endpoint",)
+))
+FAILOVERS = register(Counter(
+    "pronunciation_endpoint_failovers_total", "Peticiones reenviadas a otro endpoint tras un fallo", ("endpoint",)
+))
+
+
+def is_endpoint_failure(result=None, error=None):
+    """True si el fallo se debe al endpoint (y otro podría atender la petición)"""
+    if error is not None:
+        return isinstance(error, ENDPOINT_EXCEPTIONS)
+    return (
+        not result.get("success")
+        and result.get("cancellation_reason") == "Error"
+        and result.get("error_code") in ENDPOINT_ERROR_CODES
+    )
+
+
+def parse_endpoints(text):
+    """'westeurope:clave1,eastus:clave2' (comas o saltos de línea) -> [(región, clave)]"""
+    endpoints = []
+    for item in (text or "").replace("\n", ",").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        region, sep, key = item.partition(":")
+        if not sep or not region.strip() or not key.strip():
+            raise ValueError(f"Endpoint de Speech no válido (se espera región:clave): {region.strip()}:...")
+        endpoints.append((region.strip(), key.strip()))
+    return endpoints
+
+
+def parse_fake_endpoints(text):
+    """'0.2,0.8:0.5' -> [(latencia, tasa_error)] para SPEECH_FAKE_ENDPOINTS"""
+    specs = []
+    for item in (text or "").split(","):
+        item = item.strip()
+        if item:
+            latency, _, error_rate = item.partition(":")
+            specs.append((float(latency), float(error_rate or 0)))
+    return specs
+
+
+class Endpoint:
+    """Un backend con su estado de salud y sus contadores"""
+
+    def __init__(self, name, backend):
+        self.name = name
+        self.backend = backend
+        self.outstanding = 0
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None
+        self.down_until = 0.0
+        self.last_error = None
+        ENDPOINT_HEALTHY.set(1, endpoint=name)
+
+    def healthy(self, now):
+        return now >= self.down_until
+
+    def expected_latency(self):
+        return self.latency if self.latency is not None else 0.0
+
+
+class RouterBackend(SpeechBackend):
+
+    def __init__(self, endpoints, strategy="least_outstanding", failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 cooldown=DEFAULT_COOLDOWN, name=None):
+        if not endpoints:
+            raise ValueError("Se necesita al menos un endpoint")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Estrategia de reparto no soportada: {strategy}")
+        self.endpoints = list(endpoints)
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.name = name or self.endpoints[0].backend.name
+        # `SpeechScheduler` del evaluador: cada failover es otra petición al
+        # servicio y consume su propio token de la cuota (el primero ya lo cobra el planificador)
+        self.limiter = None
+        self._lock = threading.Lock()
+
+    def is_configured(self):
+        return any(e.backend.is_configured() for e in self.endpoints)
+
+    def warm_up(self, language):
+        for endpoint in self.endpoints:
+            try:
+                endpoint.backend.warm_up(language)
+            except Exception:
+                # Un recurso caído no debe impedir precalentar los demás
+                pass
+
+    def _choose(self, tried):
+        """Siguiente endpoint (no probado aún en esta petición); lo marca como ocupado"""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e not in tried]
+            if not candidates:
+                return None
+            healthy = [e for e in candidates if e.healthy(now)]
+            if healthy:
+                if self.strategy == "latency":
+                    endpoint = min(healthy, key=lambda e: (e.outstanding + 1) * e.expected_latency())
+                else:
+                    endpoint = min(healthy, key=lambda e: (e.outstanding, e.expected_latency()))
+            elif not tried:
+                # Todos fuera: mejor probar el que antes vuelve que fallar sin intentarlo
+                endpoint = min(candidates, key=lambda e: e.down_until)
+            else:
+                return None
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+        ENDPOINT_OUTSTANDING.inc(endpoint=endpoint.name)
+        return endpoint
+
+    def _release(self, endpoint):
+        """Endpoint elegido pero no usado: deshace lo que apuntó `_choose`"""
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.requests -= 1
+        ENDPOINT_OUTSTANDING.dec(endpoint=endpoint.name)
+
+    def _record(self, endpoint, elapsed, result=None, error=None):
+        """Actualiza salud y estadísticas; devuelve True si hay que probar otro endpoint"""
+        failed = is_endpoint_failure(result, error)
+        with self._lock:
+            endpoint.outstanding -= 1
+            # Una excepción de la petición no dice nada de la salud ni de la latencia del endpoint
+            if failed:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                endpoint.last_error = str(error) if error is not None else result.get("error")
+                if endpoint.consecutive_failures >= self.failure_threshold:
+                    endpoint.down_until = time.monotonic() + self.cooldown
+                    endpoint.consecutive_failures = 0
+            elif error is None:
+                endpoint.successes += 1
+                endpoint.consecutive_failures = 0
+                if endpoint.latency is None:
+                    endpoint.latency = elapsed
+                else:
+                    endpoint.latency += LATENCY_ALPHA * (elapsed - endpoint.latency)
+            healthy = endpoint.healthy(time.monotonic())
+        ENDPOINT_OUTSTANDING.dec(endpoint=endpoint.name)
+        ENDPOINT_HEALTHY.set(1 if healthy else 0, endpoint=endpoint.name)
+        if endpoint.latency is not None:
+            ENDPOINT_LATENCY.set(endpoint.latency, endpoint=endpoint.name)
+        if failed:
+            outcome = "failure"
+        else:
+            outcome = "request_error" if error is not None else "success"
+        ENDPOINT_REQUESTS.inc(endpoint=endpoint.name, outcome=outcome)
+        return failed
+
+    def assess(self, audio_bytes, info, reference_text, language, continuous=False):
+        tried = []
+        result = error = None
+        while True:
+            endpoint = self._choose(tried)
+            if endpoint is None:
+                break
+            if tried:
+                if self.limiter is not None and not self.limiter.take_token():
+                    # Sin cuota para otro intento: se devuelve el último fallo
+                    self._release(endpoint)
+                    break
+                FAILOVERS.inc(endpoint=tried[-1].name)
+            tried.append(endpoint)
+            start = time.monotonic()
+            try:
+                result = endpoint.backend.assess(audio_bytes, info, reference_text, language, continuous)
+            except Exception as e:
+                if not self._record(endpoint, time.monotonic() - start, error=e):
+                    # Error de la petición: fallaría igual en otro endpoint
+                    raise
+                result, error = None, e
+                continue
+            error = None
+            if not self._record(endpoint, time.monotonic() - start, result):
+                break
+        return self._tag(result, error, tried)
+
+    async def assess_async(self, audio_bytes, info, reference_text, language, continuous=False):
+        tried = []
+        result = error = None
+        while True:
+            endpoint = self._choose(tried)
+            if endpoint is None:
+                break
+            if tried:
+                if self.limiter is not None and not await self.limiter.take_token_async():
+                    self._release(endpoint)
+                    break
+                FAILOVERS.inc(endpoint=tried[-1].name)
+            tried.append(endpoint)
+            start = time.monotonic()
+            try:
+                result = await endpoint.backend.assess_async(audio_bytes, info, reference_text, language, continuous)
+            except Exception as e:
+                if not self._record(endpoint, time.monotonic() - start, error=e):
+                    # Error de la petición: fallaría igual en otro endpoint
+                    raise
+                result, error = None, e
+                continue
+            error = None
+            if not self._record(endpoint, time.monotonic() - start, result):
+                break
+        return self._tag(result, error, tried)
+
+    @staticmethod
+    def _tag(result, error, tried):
+        """Resultado del último endpoint probado (o su excepción, si no respondió)"""
+        if result is None:
+            raise error or RuntimeError("Ningún endpoint de Speech disponible")
+        result["endpoint"] = tried[-1].name
+        return result
+
+    def stats(self):
+        """Estadísticas por endpoint"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                e.name: {
+                    "requests": e.requests,
+                    "successes": e.successes,
+                    "failures": e.failures,
+                    "outstanding": e.outstanding,
+                    "latency": e.latency,
+                    "healthy": e.healthy(now),
+                    "down_for": max(0.0, e.down_until - now),
+                    "last_error": e.last_error,
+                }
+                for e in self.endpoints
+            }
@@ -0,0 +1,476 @@
+"""
+scheduler.py
+------------
+Planificador de llamadas al servicio de voz según la cuota del recurso.
+
+Cada llamada al backend pasa por `SpeechScheduler`:
+
+1. Circuit breaker: tras varios fallos transitorios seguidos el circuito se
+   abre y las peticiones se rechazan al momento (sin esperar ni llamar al
+   servicio) hasta que pasa el tiempo de reposo; entonces se deja pasar una
+   petición de prueba y, si sale bien, se cierra.
+2. Cola: espera un hueco de concurrencia (conexiones simultáneas del tier) y
+   un token del token bucket (peticiones por segundo). Si no lo consigue en
+   AZURE_SPEECH_QUEUE_TIMEOUT segundos, la petición se descarta. Hilos y
+   corrutinas esperan en la misma cola: cada hueco que se libera pasa
+   directamente a la petición de mayor prioridad y, a igualdad, a la que
+   lleva más tiempo esperando (las interactivas, PRIORITY_INTERACTIVE, antes
+   que los lotes).
+3. Reintentos: las cancelaciones transitorias (`CancellationReason.Error`
+   con códigos como TooManyRequests o ServiceUnavailable) se reintentan con
+   backoff exponencial con jitter; el resto de errores se devuelven tal cual.
+
+El planificador es del evaluador y `get_evaluator()` comparte un único
+evaluador por proceso, así que los límites se aplican a todo el proceso.
+Métricas: `pronunciation_scheduler_*` y `pronunciation_circuit_state`.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+from app.services.backends import error_result
+from app.services.metrics import Counter, Gauge, register, span
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_QUEUE_TIMEOUT = 30.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 8.0
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_RESET = 30.0
+
+# Prioridad de las evaluaciones de un usuario que espera la respuesta (por defecto, 0)
+PRIORITY_INTERACTIVE = 10
+
+# Códigos de `CancellationErrorCode` que merece la pena reintentar
+TRANSIENT_ERROR_CODES = frozenset({
+    "TooManyRequests", "ConnectionFailure", "ServiceTimeout", "ServiceError", "ServiceUnavailable",
+})
+
+QUEUED = register(Counter(
+    "pronunciation_scheduler_queued_total", "Peticiones que esperaron hueco o token antes de llamar al servicio"
+))
+WAITING = register(Gauge(
+    "pronunciation_scheduler_waiting", "Peticiones esperando ahora mismo hueco o token"
+))
+RETRIED = register(Counter(
+    "pronunciation_scheduler_retries_total", "Reintentos por código de error", ("code",)
+))
+SHED = register(Counter(
+    "pronunciation_scheduler_shed_total", "Peticiones descartadas sin llamar al servicio", ("reason",)
+))
+CIRCUIT_STATE = register(Gauge(
+    "pronunciation_circuit_state", "Estado del circuit breaker (0 cerrado, 1 semiabierto, 2 abierto)"
+))
+
+
+def is_transient(result):
+    """True si el resultado es una cancelación del servicio que conviene reintentar"""
+    return (
+        not result.get("success")
+        and result.get("cancellation_reason") == "Error"
+        and result.get("error_code") in TRANSIENT_ERROR_CODES
+    )
+
+
+def _mark_queued():
+    QUEUED.inc()
+    WAITING.inc()
+    return True
+
+
+class TokenBucket:
+    """`rate` peticiones por segundo con ráfagas de hasta `burst`; rate None = sin límite"""
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate or 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Toma un token si hay; si no, devuelve cuántos segundos faltan para el siguiente"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+
+class _Waiter:
+    __slots__ = ("wake", "granted", "cancelled")
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ConcurrencySlots:
+    """
+    Huecos de concurrencia con una única cola de espera para hilos y
+    corrutinas. `release` entrega el hueco directamente al primero de la cola
+    (mayor prioridad y, a igualdad, orden de llegada), así que nadie se cuela
+    ni hay que sondear.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.free = size
+        self._waiters = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            # Con peticiones esperando nunca quedan huecos libres (se les entregan al liberar)
+            if self.free > 0:
+                self.free -= 1
+                return True
+            return False
+
+    def _enqueue(self, waiter, priority):
+        """False si había un hueco libre (y se toma); si no, pone `waiter` en la cola"""
+        with self._lock:
+            if self.free > 0:
+                self.free -= 1
+                return False
+            heapq.heappush(self._waiters, (-priority, next(self._order), waiter))
+            return True
+
+    def _settle(self, waiter):
+        """Tras esperar: True si se le entregó un hueco; si no, sale de la cola"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            return False
+
+    def acquire(self, deadline, priority=0):
+        """Espera un hueco hasta `deadline` (time.monotonic); False si no llega a tiempo"""
+        event = threading.Event()
+        waiter = _Waiter(event.set)
+        if not self._enqueue(waiter, priority):
+            return True
+        event.wait(max(0.0, deadline - time.monotonic()))
+        return self._settle(waiter)
+
+    async def acquire_async(self, deadline, priority=0):
+        """Como `acquire`, esperando en el event loop"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = _Waiter(lambda: loop.call_soon_threadsafe(_resolve, future))
+        if not self._enqueue(waiter, priority):
+            return True
+        try:
+            await asyncio.wait_for(future, max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if self._settle(waiter):
+                self.release()
+            raise
+        return self._settle(waiter)
+
+    def release(self):
+        while True:
+            with self._lock:
+                waiter = None
+                while self._waiters:
+                    _, _, candidate = heapq.heappop(self._waiters)
+                    if not candidate.cancelled:
+                        waiter = candidate
+                        waiter.granted = True
+                        break
+                if waiter is None:
+                    self.free += 1
+                    return
+            try:
+                waiter.wake()
+                return
+            except RuntimeError:
+                # Su event loop ya está cerrado: el hueco pasa al siguiente
+                continue
+
+    def waiting(self):
+        with self._lock:
+            return sum(1 for _, _, w in self._waiters if not w.cancelled)
+
+
+class CircuitBreaker:
+    """Se abre tras `threshold` fallos transitorios seguidos durante `reset_timeout` segundos"""
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, threshold=DEFAULT_BREAKER_THRESHOLD, reset_timeout=DEFAULT_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True si la petición puede llamar al servicio"""
+        if not self.threshold:
+            return True
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened >= self.reset_timeout:
+                self._set(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                # Una sola petición de prueba mientras está semiabierto
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                self._set(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or (self.threshold and self.failures >= self.threshold):
+                self._opened = time.monotonic()
+                self._set(self.OPEN)
+
+    def abandon(self):
+        """La petición autorizada no llegó a dar resultado (descartada o excepción)"""
+        with self._lock:
+            self._probing = False
+
+    def _set(self, state):
+        self.state = state
+        CIRCUIT_STATE.set({self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[state])
+
+
+class RetryPolicy:
+    """Backoff exponencial con jitter completo: espera aleatoria en [0, base * 2^intento]"""
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BACKOFF_BASE, max_delay=DEFAULT_BACKOFF_MAX):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = random.Random()
+
+    def delay(self, attempt):
+        """Espera antes del reintento que sigue al intento `attempt` (1, 2, ...)"""
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class SpeechScheduler:
+
+    def __init__(self, rate=None, burst=None, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 queue_timeout=DEFAULT_QUEUE_TIMEOUT, retry=None, breaker=None):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = ConcurrencySlots(max_concurrency)
+
+    @classmethod
+    def from_env(cls, max_concurrency=None):
+        """Límites del tier según AZURE_SPEECH_RPS, AZURE_SPEECH_MAX_CONCURRENCY, etc."""
+        rate = os.getenv("AZURE_SPEECH_RPS")
+        burst = os.getenv("AZURE_SPEECH_BURST")
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("AZURE_SPEECH_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        return cls(
+            rate=float(rate) if rate else None,
+            burst=float(burst) if burst else None,
+            max_concurrency=max_concurrency,
+            queue_timeout=float(os.getenv("AZURE_SPEECH_QUEUE_TIMEOUT", DEFAULT_QUEUE_TIMEOUT)),
+            retry=RetryPolicy(
+                max_attempts=int(os.getenv("AZURE_SPEECH_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+                base_delay=float(os.getenv("AZURE_SPEECH_BACKOFF_BASE", DEFAULT_BACKOFF_BASE)),
+                max_delay=float(os.getenv("AZURE_SPEECH_BACKOFF_MAX", DEFAULT_BACKOFF_MAX)),
+            ),
+            breaker=CircuitBreaker(
+                threshold=int(os.getenv("AZURE_SPEECH_BREAKER_THRESHOLD", DEFAULT_BREAKER_THRESHOLD)),
+                reset_timeout=float(os.getenv("AZURE_SPEECH_BREAKER_RESET", DEFAULT_BREAKER_RESET)),
+            ),
+        )
+
+    def run(self, call, backend=None, priority=0):
+        """
+        Ejecuta `call()` (que devuelve el dict de resultado del backend) respetando
+        cuota, reintentos y circuit breaker. Devuelve (resultado, tiempos) con los
+        segundos acumulados de cola y de llamadas al backend. Con huecos ocupados
+        se atiende antes la `priority` más alta.
+        """
+        timings = {"queue": 0.0, "backend": 0.0}
+        for attempt in range(1, self.retry.max_attempts + 1):
+            if not self.breaker.allow():
+                return self._shed("circuit_open"), timings
+            with span("queue") as queued:
+                acquired = self._acquire(time.monotonic() + self.queue_timeout, priority)
+            timings["queue"] += queued.elapsed
+            if not acquired:
+                self.breaker.abandon()
+                return self._shed("queue_timeout"), timings
+            try:
+                with span("backend", backend=backend) as calling:
+                    result = call()
+            except Exception:
+                self.breaker.abandon()
+                raise
+            finally:
+                self._slots.release()
+            timings["backend"] += calling.elapsed
+
+            if not self._retry(result, attempt):
+                return self._done(result, attempt), timings
+            time.sleep(self.retry.delay(attempt))
+        return self._done(result, attempt), timings
+
+    async def run_async(self, call, backend=None, priority=0):
+        """Versión asíncrona de `run`: `call()` devuelve una corrutina"""
+        timings = {"queue": 0.0, "backend": 0.0}
+        for attempt in range(1, self.retry.max_attempts + 1):
+            if not self.breaker.allow():
+                return self._shed("circuit_open"), timings
+            with span("queue") as queued:
+                acquired = await self._acquire_async(time.monotonic() + self.queue_timeout, priority)
+            timings["queue"] += queued.elapsed
+            if not acquired:
+                self.breaker.abandon()
+                return self._shed("queue_timeout"), timings
+            try:
+                with span("backend", backend=backend) as calling:
+                    result = await call()
+            except Exception:
+                self.breaker.abandon()
+                raise
+            finally:
+                self._slots.release()
+            timings["backend"] += calling.elapsed
+
+            if not self._retry(result, attempt):
+                return self._done(result, attempt), timings
+            await asyncio.sleep(self.retry.delay(attempt))
+        return self._done(result, attempt), timings
+
+    def _acquire(self, deadline, priority=0):
+        """Hueco de concurrencia + token antes de `deadline`; False si no llega a tiempo"""
+        queued = False
+        try:
+            if not self._slots.try_acquire():
+                queued = _mark_queued()
+                if not self._slots.acquire(deadline, priority):
+                    return False
+            wait = self.bucket.take()
+            if wait and not queued:
+                queued = _mark_queued()
+            if not self._wait_token(wait, deadline):
+                self._slots.release()
+                return False
+            return True
+        finally:
+            if queued:
+                WAITING.dec()
+
+    async def _acquire_async(self, deadline, priority=0):
+        """Como `_acquire` pero esperando sin bloquear el event loop"""
+        queued = False
+        try:
+            if not self._slots.try_acquire():
+                queued = _mark_queued()
+                if not await self._slots.acquire_async(deadline, priority):
+                    return False
+            wait = self.bucket.take()
+            if wait and not queued:
+                queued = _mark_queued()
+            try:
+                got_token = await self._wait_token_async(wait, deadline)
+            except asyncio.CancelledError:
+                # Petición cancelada (cliente desconectado): el hueco no se puede perder
+                self._slots.release()
+                raise
+            if not got_token:
+                self._slots.release()
+                return False
+            return True
+        finally:
+            if queued:
+                WAITING.dec()
+
+    def _wait_token(self, wait, deadline):
+        """Espera `wait` segundos y vuelve a pedir token hasta conseguirlo; False si no llega antes de `deadline`"""
+        while wait:
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+            wait = self.bucket.take()
+        return True
+
+    async def _wait_token_async(self, wait, deadline):
+        while wait:
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+            wait = self.bucket.take()
+        return True
+
+    def take_token(self):
+        """
+        Token para un intento más dentro de un hueco ya concedido (el failover de
+        `RouterBackend` a otro recurso); False si no llega en `queue_timeout`.
+        """
+        return self._wait_token(self.bucket.take(), time.monotonic() + self.queue_timeout)
+
+    async def take_token_async(self):
+        return await self._wait_token_async(self.bucket.take(), time.monotonic() + self.queue_timeout)
+
+    def _retry(self, result, attempt):
+        """Registra el resultado en el breaker y decide si se reintenta"""
+        if not is_transient(result):
+            # Éxito o error propio de la petición (sin voz, audio no válido...): el servicio responde
+            self.breaker.record_success()
+            return False
+        self.breaker.record_failure()
+        if attempt >= self.retry.max_attempts or self.breaker.state == CircuitBreaker.OPEN:
+            return False
+        RETRIED.inc(code=result.get("error_code"))
+        return True
+
+    @staticmethod
+    def _done(result, attempts):
+        result["attempts"] = attempts
+        return result
+
+    @staticmethod
+    def _shed(reason):
+        SHED.inc(reason=reason)
+        if reason == "circuit_open":
+            message = "El servicio de voz no responde ahora mismo. Inténtalo de nuevo en unos segundos."
+            code = "CircuitOpen"
+        else:
+            message = "Hay demasiadas evaluaciones en curso. Inténtalo de nuevo en unos segundos."
+            code = "QueueTimeout"
+        result = error_result(f"❌ {message}", reason="Shed", code=code)
+        result["attempts"] = 0
+        return result
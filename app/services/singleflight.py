@@ -0,0 +1,75 @@
+"""
+singleflight.py
+---------------
+Deduplicación de llamadas concurrentes idénticas.
+
+Si llega una petición con la misma clave que otra que aún está en curso,
+espera el resultado de la primera en lugar de repetir el trabajo.
+Funciona igual desde hilos (Streamlit) y desde corrutinas (asyncio): todas
+comparten un `concurrent.futures.Future` por clave.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def _join(self, key):
+        """Devuelve (future, es_lider)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _finish(self, key):
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key, fn, *args, **kwargs):
+        """Ejecuta fn una sola vez por clave aunque se llame desde varios hilos a la vez"""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._finish(key)
+
+    async def do_async(self, key, coro_fn, *args, **kwargs):
+        """Igual que `do` para funciones asíncronas"""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await coro_fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._finish(key)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
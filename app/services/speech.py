@@ -1,32 +1,157 @@
-import json
+import asyncio
 import os
+import sys
+import threading
 
-import azure.cognitiveservices.speech as speechsdk
-import streamlit as st
-
-from dotenv import load_dotenv
 from app.utils.languages_phrases import LANGUAGE_OPTIONS
+from app.services.assessment import AssessmentResult
+from app.services.backends import create_backend, error_result
+from app.services.cache import EvaluationCache, make_key
+from app.services.metrics import CACHE_LOOKUPS, EVALUATIONS, SPEECH_ERRORS, span, start_metrics_server
+from app.services.profiling import profiled
+from app.services.router import RouterBackend, parse_endpoints
+from app.services.scheduler import SpeechScheduler
+from app.services.singleflight import SingleFlight
+from app.utils.wav import WAVE_FORMAT_PCM, WavFormatError, parse_wav_header
+
+# El SDK de Azure, numpy (preprocesado), streamlit (secrets.toml) y dotenv se
+# importan al usarlos por primera vez: así el proceso arranca y muestra la
+# primera página antes (ver benchmarks/cold_start.py)
+
+# recognize_once se detiene tras la primera frase (~30 s): por encima se usa modo continuo
+CONTINUOUS_MIN_DURATION = 25
+
+_credentials = None
+_credentials_lock = threading.Lock()
+
+
+# Donde busca Streamlit secrets.toml por defecto
+SECRETS_PATHS = (
+    os.path.join(".streamlit", "secrets.toml"),
+    os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml"),
+)
+
 
-# Cargar variables de entorno desde .env y .st
-load_dotenv()
+def _secret(name):
+    """Valor de secrets.toml o, si no existe ese archivo (o no hay streamlit), de la variable de entorno"""
+    if "streamlit" not in sys.modules and not any(os.path.exists(p) for p in SECRETS_PATHS):
+        # Fuera de Streamlit y sin secrets.toml no hace falta importarlo (API, lotes)
+        return os.getenv(name, "")
+    try:
+        import streamlit as st
+        return st.secrets.get(name, os.getenv(name, ""))
+    except (ImportError, FileNotFoundError):
+        # StreamlitSecretNotFoundError (sin secrets.toml) hereda de FileNotFoundError
+        return os.getenv(name, "")
+
+
+def load_credentials():
+    """
+    (clave, región, endpoints) de Azure Speech, resueltos una sola vez por
+    proceso: secrets.toml y, si no, variables de entorno (cargando antes .env).
+    `endpoints` es la lista de (región, clave) de AZURE_SPEECH_ENDPOINTS.
+    """
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            try:
+                from dotenv import load_dotenv
+                load_dotenv()
+            except ImportError:
+                pass
+            _credentials = (
+                _secret("AZURE_SPEECH_KEY"),
+                _secret("AZURE_SPEECH_REGION"),
+                parse_endpoints(_secret("AZURE_SPEECH_ENDPOINTS")),
+            )
+        return _credentials
 
 """
   Clase para evaluar la pronunciación usando Azure Cognitive Services (Speech SDK)
+  o el backend indicado en SPEECH_BACKEND (ver `app.services.backends`)
 """
 class PronunciationEvaluator:
 
-    def __init__(self):
-        self.speech_key = st.secrets.get("AZURE_SPEECH_KEY", os.getenv("AZURE_SPEECH_KEY", ""))
-        self.service_region = st.secrets.get("AZURE_SPEECH_REGION", os.getenv("AZURE_SPEECH_REGION", ""))
+    def __init__(self, max_concurrency=None, cache=None, preprocess=None, transport=None, backend=None,
+                 scheduler=None):
+        self.speech_key, self.service_region, self.endpoints = load_credentials()
+
+        # Cuota del servicio: peticiones simultáneas y por segundo, reintentos y circuit breaker
+        if scheduler is None:
+            scheduler = SpeechScheduler.from_env(max_concurrency)
+        self.scheduler = scheduler
+        self.max_concurrency = max_concurrency = scheduler.max_concurrency
+
+        # Paso de reconocimiento/evaluación (Azure o backend local de pruebas)
+        if backend is None:
+            backend = create_backend(
+                self.speech_key, self.service_region, max_workers=max_concurrency, transport=transport,
+                endpoints=self.endpoints
+            )
+        self.backend = backend
+        if isinstance(backend, RouterBackend) and backend.limiter is None:
+            # Los failovers entre recursos también cuentan para la cuota
+            backend.limiter = scheduler
         self.is_configured = self.validate_credentials()
 
+        # /metrics en METRICS_PORT (si está definida)
+        start_metrics_server()
+
+        # Caché persistente de resultados (compartida entre procesos)
+        self.cache = cache if cache is not None else EvaluationCache.from_env()
+
+        # Registro de evaluaciones en curso por hash de contenido (single-flight)
+        self._inflight = SingleFlight()
+
+        # Normalizar el audio (16 kHz mono 16 bits, sin silencios en los extremos) antes de enviarlo
+        if preprocess is None:
+            preprocess = os.getenv("AUDIO_PREPROCESS", "on").lower() not in ("0", "off", "false", "no")
+        self.preprocess = preprocess
+
+        # Idiomas ya precalentados (o en ello) por `warm_up_in_background`
+        self._warmed = set()
+        self._warmed_lock = threading.Lock()
+
+    def warm_up(self, languages=None):
+        """
+        Abre de antemano la conexión con el servicio para los idiomas indicados.
+        Sin argumentos usa AZURE_SPEECH_WARMUP_LANGUAGES o todos los idiomas soportados.
+        """
+        if not self.is_configured:
+            return
+
+        for language in self._warmup_languages(languages):
+            try:
+                self.backend.warm_up(language)
+            except Exception:
+                # El precalentamiento es una optimización: si falla se conecta al evaluar
+                pass
+
+    def warm_up_in_background(self, languages=None):
+        """
+        `warm_up` en un hilo y una sola vez por idioma: se puede llamar en cada
+        rerun de una página sin retrasar su render (importar el SDK y abrir la
+        conexión puede tardar segundos).
+        """
+        if not self.is_configured:
+            return
+        with self._warmed_lock:
+            pending = [l for l in self._warmup_languages(languages) if l not in self._warmed]
+            self._warmed.update(pending)
+        if pending:
+            threading.Thread(target=self.warm_up, args=(pending,), name="speech-warmup", daemon=True).start()
+
+    @staticmethod
+    def _warmup_languages(languages):
+        """Idiomas soportados de `languages` o, sin ellos, de AZURE_SPEECH_WARMUP_LANGUAGES (o todos)"""
+        if languages is None:
+            configured = os.getenv("AZURE_SPEECH_WARMUP_LANGUAGES", "")
+            languages = [l.strip() for l in configured.split(",") if l.strip()] or list(LANGUAGE_OPTIONS.values())
+        return [l for l in languages if l in LANGUAGE_OPTIONS.values()]
+
     def validate_credentials(self):
-        """Valida que las credenciales estén configuradas"""
-        if not self.speech_key or not self.service_region:
-            return False
-        if "tu_clave_aqui" in self.speech_key or "tu_region_aqui" in self.service_region:
-            return False
-        return True
+        """Valida que las credenciales estén configuradas (el backend local no las necesita)"""
+        return self.backend.is_configured()
 
     def get_configuration_status(self):
         """Devuelve el estado de configuración"""
@@ -35,118 +160,297 @@ class PronunciationEvaluator:
                 "status": "error",
                 "message": "⚠️ Credenciales de Azure no configuradas. Por favor, actualiza secrets.toml y .env con tus credenciales reales."
             }
+        if self.backend.name != "azure":
+            return {
+                "status": "success",
+                "message": f"✅ Usando el backend de voz `{self.backend.name}` (sin conexión con Azure)"
+            }
+        if isinstance(self.backend, RouterBackend):
+            return {
+                "status": "success",
+                "message": f"✅ Credenciales de Azure configuradas correctamente ({len(self.backend.endpoints)} recursos)"
+            }
         return {
             "status": "success",
             "message": "✅ Credenciales de Azure configuradas correctamente"
         }
+
+    def get_backend_stats(self):
+        """Peticiones, fallos, latencia y salud por recurso de Speech (None con un solo recurso)"""
+        if isinstance(self.backend, RouterBackend):
+            return self.backend.stats()
+        return None
     #                                                                 Valor por default
     def evaluate_pronunciation(self, audio_file_path, reference_text, language="en-US"):
         """
-        Evalúa la pronunciación usando Azure Pronunciation Assessment
+        Evalúa la pronunciación de un archivo WAV.
+        Envoltorio fino sobre `evaluate_pronunciation_bytes`.
         """
+        try:
+            with open(audio_file_path, "rb") as f:
+                audio_bytes = f.read()
+        except OSError as e:
+            return self._error_result(f"No se pudo leer el archivo de audio: {str(e)}")
 
-        # Verificar que las credenciales están configuradas
-        if not self.is_configured:
-            return {
-                "success": False,
-                "error": "❌ Credenciales de Azure no configuradas.v",
-                "sdk_result": None,
-                "json_result": None
-            }
+        return self.evaluate_pronunciation_bytes(audio_bytes, reference_text, language)
 
-        # Validar idioma
-        if language not in LANGUAGE_OPTIONS.values():
-            return {
-                "success": False,
-                "error": f"Idioma no soportado: {language}.",
-                "sdk_result": None,
-                "json_result": None
-            }
+    def evaluate_pronunciation_bytes(self, audio_bytes: bytes, reference_text, language="en-US", continuous=None,
+                                     priority=0):
+        """
+        Evalúa la pronunciación usando Azure Pronunciation Assessment.
+        El audio se entrega al SDK directamente desde memoria (sin archivos temporales).
+
+        `continuous`: True usa reconocimiento continuo (audios largos), False un único
+        `recognize_once`; None lo decide según la duración del audio.
+
+        Las peticiones idénticas (mismo audio, frase, idioma y modo) que lleguen mientras
+        otra está en curso esperan su resultado en lugar de volver a llamar a Azure.
+
+        `priority`: si hay que esperar hueco para llamar al servicio, se atiende
+        antes la prioridad más alta (ver `app.services.scheduler`).
+
+        El resultado incluye "timings": segundos por etapa (cache, preprocess,
+        queue, backend, store) y el total de esta llamada; las mismas etapas se
+        exportan como métricas (ver `app.services.metrics`). Con PROFILE=on una
+        fracción de las llamadas se perfila (ver `app.services.profiling`).
+        """
+        error = self._check_request(language)
+        if error:
+            return error
+
+        with profiled("evaluate"), span("evaluate", language=language) as evaluation:
+            with span("cache") as lookup:
+                key = make_key(audio_bytes, reference_text, language, continuous)
+                result = self._cache_lookup(key)
+            if result is None:
+                result = self._inflight.do(
+                    key, self._evaluate_uncached, audio_bytes, reference_text, language, continuous, key, priority
+                )
+        return self._finish(result, cache=lookup.elapsed, total=evaluation.elapsed)
 
+    async def evaluate_pronunciation_async(self, audio_bytes: bytes, reference_text, language="en-US", continuous=None,
+                                           priority=0):
+        """
+        Versión asíncrona de `evaluate_pronunciation_bytes` basada en `recognize_once_async`.
+        No bloquea el event loop: el hash del audio, la caché SQLite y el
+        preprocesado se ejecutan en hilos, el backend prepara el envío
+        (compresión, reconocedor) también en un hilo y el loop solo espera la
+        respuesta del servicio.
+        """
+        error = self._check_request(language)
+        if error:
+            return error
+
+        with span("evaluate", language=language) as evaluation:
+            with span("cache") as lookup:
+                key = await asyncio.to_thread(make_key, audio_bytes, reference_text, language, continuous)
+                result = await asyncio.to_thread(self._cache_lookup, key)
+            if result is None:
+                result = await self._inflight.do_async(
+                    key, self._evaluate_uncached_async, audio_bytes, reference_text, language, continuous, key,
+                    priority
+                )
+        return self._finish(result, cache=lookup.elapsed, total=evaluation.elapsed)
+
+    def _prepare(self, audio_bytes, continuous):
+        """Audio normalizado, informe del preprocesado, formato y modo de reconocimiento"""
+        audio_bytes, preprocessing = self._preprocess(audio_bytes)
+        info = self._read_audio_info(audio_bytes)
+        return audio_bytes, preprocessing, info, self._use_continuous(info, continuous)
+
+    def _evaluate_uncached(self, audio_bytes, reference_text, language, continuous, key, priority=0):
         try:
-            # Configuración de audio
-            audio_config = speechsdk.audio.AudioConfig(filename=audio_file_path)
+            with span("preprocess") as preparing:
+                audio_bytes, preprocessing, info, continuous = self._prepare(audio_bytes, continuous)
 
-            # Configuración de speech
-            speech_config = speechsdk.SpeechConfig(
-                subscription=self.speech_key,
-                region=self.service_region
-            )
-            speech_config.speech_recognition_language = language
-
-            # Configuración de evaluación de pronunciación
-            pronunciation_config = speechsdk.PronunciationAssessmentConfig(
-                reference_text=reference_text,
-                grading_system=speechsdk.PronunciationAssessmentGradingSystem.HundredMark,
-                granularity=speechsdk.PronunciationAssessmentGranularity.Phoneme,
-                enable_miscue=True
+            # Realizar reconocimiento (según la cuota del servicio, con reintentos)
+            result, calls = self.scheduler.run(
+                lambda: self.backend.assess(audio_bytes, info, reference_text, language, continuous),
+                backend=self.backend.name,
+                priority=priority
             )
 
-            # Crear reconocedor
-            speech_recognizer = speechsdk.SpeechRecognizer(
-                speech_config=speech_config,
-                audio_config=audio_config
-            )
+            with span("store") as storing:
+                self._cache_store(key, result, reference_text, language)
+        except Exception as e:
+            return self._error_result(f"Error durante la evaluación: {str(e)}")
+
+        result["preprocessing"] = preprocessing
+        result["timings"] = {"preprocess": preparing.elapsed, **calls, "store": storing.elapsed}
+        return result
 
-            # Aplicar configuración de pronunciación
-            pronunciation_config.apply_to(speech_recognizer)
-
-            # Realizar reconocimiento
-            result = speech_recognizer.recognize_once()
-
-            # Verificar resultado
-            if result.reason != speechsdk.ResultReason.RecognizedSpeech:
-                error_msg = "No se pudo reconocer el habla. "
-                if result.reason == speechsdk.ResultReason.NoMatch:
-                    error_msg += "El audio no tiene sentido."
-                elif result.reason == speechsdk.ResultReason.Canceled:
-                    cancellation_details = result.cancellation_details
-                    error_msg += f"Cancelado: {cancellation_details.reason}"
-                    if cancellation_details.reason == speechsdk.CancellationReason.Error:
-                        error_msg += f" - Error: {cancellation_details.error_details}"
-                return {"success": False, "error": error_msg}
-
-            # Resultados como JSON
-            json_result = result.properties.get(speechsdk.PropertyId.SpeechServiceResponse_JsonResult)
-
-            if json_result:
-                json_data = json.loads(json_result)
-                return {
-                    "success": True,
-                    "error": None,
-                    "sdk_result": result,
-                    "json_result": json_data
-
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": "No se obtuvieron resultados JSON",
-                    "sdk_result": result,
-                    "json_result": None
-                }
+    async def _evaluate_uncached_async(self, audio_bytes, reference_text, language, continuous, key, priority=0):
+        try:
+            # Decodificar, remuestrear y recortar con NumPy bloquea: fuera del event loop
+            with span("preprocess") as preparing:
+                audio_bytes, preprocessing, info, continuous = await asyncio.to_thread(
+                    self._prepare, audio_bytes, continuous
+                )
+
+            result, calls = await self.scheduler.run_async(
+                lambda: self.backend.assess_async(audio_bytes, info, reference_text, language, continuous),
+                backend=self.backend.name,
+                priority=priority
+            )
 
+            with span("store") as storing:
+                await asyncio.to_thread(self._cache_store, key, result, reference_text, language)
         except Exception as e:
-            return {
-                "success": False,
-                "error": f"Error durante la evaluación: {str(e)}",
-                "sdk_result": None,
-                "json_result": None
+            return self._error_result(f"Error durante la evaluación: {str(e)}")
 
-            }
+        result["preprocessing"] = preprocessing
+        result["timings"] = {"preprocess": preparing.elapsed, **calls, "store": storing.elapsed}
+        return result
+
+    async def evaluate_many_async(self, requests):
+        """
+        Evalúa varias grabaciones a la vez.
+        `requests` es un iterable de tuplas (audio_bytes, reference_text, language).
+        Devuelve los resultados en el mismo orden.
+        """
+        return await asyncio.gather(
+            *(self.evaluate_pronunciation_async(*request) for request in requests)
+        )
+
+    def _finish(self, result, **stages):
+        """
+        Copia del resultado con los tiempos de esta llamada (las que se unieron a
+        otra idéntica comparten sus etapas) y registro de métricas.
+        """
+        result = dict(result)
+        result["timings"] = {**(result.get("timings") or {}), **stages}
+
+        if result.get("cached"):
+            outcome = "cached"
+        elif result.get("success"):
+            outcome = "success"
+        else:
+            outcome = "error"
+            SPEECH_ERRORS.inc(
+                reason=result.get("cancellation_reason") or "Exception",
+                code=result.get("error_code") or ""
+            )
+        EVALUATIONS.inc(backend=self.backend.name, outcome=outcome)
+        return result
+
+    def _cache_lookup(self, key):
+        """Devuelve el resultado si la evaluación ya está en caché; None si no"""
+        if self.cache is None:
+            return None
+        try:
+            json_result = self.cache.get(key)
+        except Exception:
+            # La caché nunca debe impedir evaluar
+            CACHE_LOOKUPS.inc(result="error")
+            return None
+        if json_result is None:
+            CACHE_LOOKUPS.inc(result="miss")
+            return None
+        CACHE_LOOKUPS.inc(result="hit")
+        return {
+            "success": True,
+            "error": None,
+            "sdk_result": None,
+            "json_result": json_result,
+            "assessment": AssessmentResult.from_json(json_result),
+            "cached": True
+        }
+
+    def _cache_store(self, key, result, reference_text, language):
+        if self.cache is None or not result.get("success"):
+            return
+        try:
+            self.cache.set(key, result["json_result"], reference_text, language)
+        except Exception:
+            pass
 
-    def evaluate_pronunciation_bytes(self, audio_bytes: bytes, reference_text, language="en-US"):
+    def invalidate_cache(self, audio_bytes=None, reference_text=None, language=None):
         """
-        Evalúa la pronunciación usando bytes de audio en lugar de archivo.
+        Invalida resultados en caché: una evaluación concreta (audio + frase + idioma)
+        o todas las de una frase y/o idioma. Sin argumentos vacía la caché.
         """
-        import tempfile
+        if self.cache is None:
+            return 0
+        if audio_bytes is not None:
+            # La evaluación puede estar guardada con cualquiera de los modos de reconocimiento
+            return sum(
+                self.cache.invalidate(key=make_key(audio_bytes, reference_text or "", language or "", continuous))
+                for continuous in (None, True, False)
+            )
+        return self.cache.invalidate(language=language, phrase=reference_text)
+
+    def get_cache_stats(self):
+        """Aciertos, fallos y ocupación de la caché de evaluaciones"""
+        if self.cache is None:
+            return None
+        return self.cache.stats()
+
+    def get_inflight_stats(self):
+        """Peticiones en curso y cuántas se han unido a otra idéntica en lugar de llamar a Azure"""
+        return {
+            "in_flight": self._inflight.in_flight(),
+            "coalesced": self._inflight.coalesced
+        }
+
+    def _check_request(self, language):
+        """Devuelve un resultado de error si la petición no se puede atender"""
+
+        # Verificar que las credenciales están configuradas
+        if not self.is_configured:
+            return self._error_result("❌ Credenciales de Azure no configuradas.v")
+
+        # Validar idioma
+        if language not in LANGUAGE_OPTIONS.values():
+            return self._error_result(f"Idioma no soportado: {language}.")
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-            tmp_file.write(audio_bytes)
-            tmp_path = tmp_file.name
+        return None
 
+    def _preprocess(self, audio_bytes):
+        """
+        Devuelve (audio, informe) con el audio normalizado para Azure.
+        Si no se puede normalizar se envía el original y el informe es None.
+        """
+        if not self.preprocess:
+            return audio_bytes, None
+        from app.utils.audio import normalize_audio
         try:
-            return self.evaluate_pronunciation(tmp_path, reference_text, language)
-        finally:
-            os.unlink(tmp_path)
+            return normalize_audio(audio_bytes)
+        except ValueError:
+            return audio_bytes, None
+
+    @staticmethod
+    def _read_audio_info(audio_bytes):
+        """Formato del audio a partir de la cabecera WAV (sin copiar el buffer)"""
+        info = parse_wav_header(audio_bytes)
+        if info["format_tag"] != WAVE_FORMAT_PCM:
+            raise WavFormatError("solo se admite audio PCM sin comprimir")
+        return info
+
+    @staticmethod
+    def _use_continuous(info, continuous):
+        if continuous is None:
+            return info["duration"] > CONTINUOUS_MIN_DURATION
+        return continuous
+
+    @staticmethod
+    def _error_result(error, sdk_result=None):
+        return error_result(error, sdk_result)
+
+
+_evaluator = None
+_evaluator_lock = threading.Lock()
+
 
+def get_evaluator(warm_up=True):
+    """
+    Evaluador compartido por todo el proceso (página principal, páginas, API...).
+    El precalentamiento de las conexiones se hace en segundo plano para no
+    retrasar la primera página.
+    """
+    global _evaluator
+    with _evaluator_lock:
+        if _evaluator is None:
+            _evaluator = PronunciationEvaluator()
+            if warm_up:
+                _evaluator.warm_up_in_background()
+        return _evaluator
@@ -0,0 +1,199 @@
+"""
+transport.py
+------------
+Envío comprimido del audio al servicio de Speech.
+
+El SDK acepta contenedores OGG/Opus y FLAC en el input stream
+(`AudioStreamFormat(compressed_stream_format=...)`) y los decodifica con
+GStreamer antes de subirlos. Comprimir solo compensa cuando el audio es lo
+bastante largo o pesado: `TransportPolicy` decide según duración y tamaño.
+
+`LoopbackReceiver` hace de receptor local: lee el stream igual que el SDK
+(a trozos desde el callback) y decodifica el contenedor, de modo que el
+codificador se puede probar sin credenciales ni red:
+
+    python -m app.services.transport grabacion.wav --codec opus --uplink-kbps 256
+"""
+
+import os
+import re
+import time
+
+from app.services.audio_store import decode_audio, encode_audio
+from app.services.recognizers import COMPRESSED_STREAM_FORMATS, MemoryAudioCallback
+from app.utils.wav import build_wav, parse_wav_header, pcm_view
+
+# Por debajo de estos valores se envía PCM: codificar costaría más que lo que se ahorra
+DEFAULT_MIN_DURATION = 10.0
+DEFAULT_MIN_BYTES = 256 * 1024
+
+# Tamaño de cada lectura del receptor (100 ms de PCM a 16 kHz, como el SDK)
+RECEIVER_CHUNK_SIZE = 3200
+
+# Errores con los que puede fallar un envío comprimido (excepción del SDK o
+# cancelación con BadRequest); la petición se repite en PCM
+COMPRESSED_ERROR_CODES = ("RuntimeError", "BadRequest")
+
+# Mensajes de error que se deben al códec o al contenedor (falta GStreamer, OGG o
+# FLAC que no se puede decodificar): solo entonces se deja de comprimir
+_CODEC_ERROR = re.compile(r"gstreamer|codec|container|compressed|ogg|opus|flac|decod", re.IGNORECASE)
+
+
+def is_codec_error(message):
+    """True si el error del envío comprimido se debe al formato del audio"""
+    return bool(_CODEC_ERROR.search(message or ""))
+
+
+class TransportPolicy:
+    """Decide si una grabación se envía comprimida y con qué codec"""
+
+    def __init__(self, codec=None, min_duration=DEFAULT_MIN_DURATION, min_bytes=DEFAULT_MIN_BYTES):
+        if codec is not None and codec not in COMPRESSED_STREAM_FORMATS:
+            raise ValueError(f"Codec de transporte no soportado: {codec}")
+        self.codec = codec
+        self.min_duration = min_duration
+        self.min_bytes = min_bytes
+        self.disabled_reason = None
+
+    @classmethod
+    def from_env(cls):
+        """Política según AZURE_SPEECH_TRANSPORT (off/opus/flac) y sus umbrales"""
+        codec = os.getenv("AZURE_SPEECH_TRANSPORT", "off").lower()
+        return cls(
+            codec=None if codec in ("", "off", "pcm") else codec,
+            min_duration=float(os.getenv("AZURE_SPEECH_TRANSPORT_MIN_SECONDS", DEFAULT_MIN_DURATION)),
+            min_bytes=int(os.getenv("AZURE_SPEECH_TRANSPORT_MIN_BYTES", DEFAULT_MIN_BYTES))
+        )
+
+    def disable(self, reason):
+        """Deja de comprimir (p. ej. si el SDK no encuentra GStreamer)"""
+        self.codec = None
+        self.disabled_reason = reason
+
+    def fallback(self, result, codec):
+        """
+        True si el envío comprimido (`codec`) falló y la petición debe repetirse
+        en PCM. Solo si el error es del códec o del contenedor se deja de
+        comprimir en todo el proceso; cualquier otro (frase de referencia no
+        válida, idioma, error puntual del SDK) afecta solo a esta petición.
+        """
+        if codec is None or result["success"] or result.get("error_code") not in COMPRESSED_ERROR_CODES:
+            return False
+        if is_codec_error(result["error"]):
+            self.disable(result["error"])
+        return True
+
+    def choose(self, info):
+        """Codec con el que enviar el audio descrito por `info` (cabecera WAV), o None para PCM"""
+        if self.codec is None:
+            return None
+        if info["duration"] >= self.min_duration or info["data_size"] >= self.min_bytes:
+            return self.codec
+        return None
+
+
+def encode_for_transport(audio_bytes, codec):
+    """
+    Codifica el WAV en el contenedor indicado.
+    Devuelve None si no se puede (sin soundfile, frecuencia no soportada por
+    Opus...) o si el resultado no es más pequeño que el PCM.
+    """
+    data, used = encode_audio(audio_bytes, codec)
+    if used != codec or len(data) >= parse_wav_header(audio_bytes)["data_size"]:
+        return None
+    return data
+
+
+class LoopbackReceiver:
+    """
+    Receptor local que sustituye al servicio: consume el stream a trozos
+    desde el callback, como hace el SDK, y decodifica lo recibido.
+    """
+
+    def __init__(self, chunk_size=RECEIVER_CHUNK_SIZE, uplink_kbps=None):
+        self.chunk_size = chunk_size
+        self.uplink_kbps = uplink_kbps
+
+    def receive(self, callback, codec=None, pcm_format=None):
+        """
+        Lee hasta el final del stream. `codec` es el contenedor enviado o None
+        para PCM, en cuyo caso `pcm_format` es (sample_rate, bits, canales).
+
+        Devuelve {"bytes", "reads", "audio" (WAV), "duration", "upload_seconds"}.
+        """
+        buffer = memoryview(bytearray(self.chunk_size))
+        received = bytearray()
+        reads = 0
+        while True:
+            size = callback.read(buffer)
+            if size <= 0:
+                break
+            received += buffer[:size]
+            reads += 1
+
+        if codec is None:
+            sample_rate, bits, channels = pcm_format
+            audio = build_wav(received, sample_rate, bits, channels)
+        else:
+            audio = decode_audio(bytes(received), codec)
+
+        upload_seconds = None
+        if self.uplink_kbps:
+            upload_seconds = len(received) * 8 / (self.uplink_kbps * 1000.0)
+
+        return {
+            "bytes": len(received),
+            "reads": reads,
+            "audio": audio,
+            "duration": parse_wav_header(audio)["duration"],
+            "upload_seconds": upload_seconds
+        }
+
+
+def loopback(audio_bytes, codec, uplink_kbps=None):
+    """
+    Envía el audio al receptor local con el mismo callback que usa el evaluador.
+    Devuelve el informe de `LoopbackReceiver.receive` más el tiempo de codificación.
+    """
+    info = parse_wav_header(audio_bytes)
+    start = time.perf_counter()
+    payload = encode_for_transport(audio_bytes, codec) if codec else None
+    encode_seconds = time.perf_counter() - start
+
+    callback = MemoryAudioCallback()
+    receiver = LoopbackReceiver(uplink_kbps=uplink_kbps)
+    if payload is None:
+        callback.attach(pcm_view(audio_bytes, info))
+        report = receiver.receive(callback, pcm_format=(info["sample_rate"], info["bits_per_sample"], info["channels"]))
+        report["codec"] = None
+    else:
+        callback.attach(memoryview(payload))
+        report = receiver.receive(callback, codec=codec)
+        report["codec"] = codec
+    report["encode_seconds"] = encode_seconds
+    return report
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Prueba local del envío comprimido de audio")
+    parser.add_argument("audio", help="Archivo WAV")
+    parser.add_argument("--codec", choices=sorted(COMPRESSED_STREAM_FORMATS), default="opus")
+    parser.add_argument("--uplink-kbps", type=float, default=256.0, help="Ancho de banda de subida simulado")
+    args = parser.parse_args()
+
+    with open(args.audio, "rb") as f:
+        audio_bytes = f.read()
+
+    for codec in (None, args.codec):
+        report = loopback(audio_bytes, codec, uplink_kbps=args.uplink_kbps)
+        print(
+            f"{report['codec'] or 'pcm':>5}: {report['bytes']:>9} bytes  "
+            f"subida {report['upload_seconds']:.2f} s  codificación {report['encode_seconds'] * 1000:.0f} ms  "
+            f"duración recibida {report['duration']:.2f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+audio.py
+--------
+Normalización del audio antes de enviarlo a Azure.
+
+- Convierte cualquier WAV PCM (8/16/24/32 bits o coma flotante, mono o
+  multicanal, cualquier frecuencia) a 16 kHz, mono, 16 bits.
+- Recorta el silencio inicial y final con un detector de voz por energía,
+  dejando un pequeño margen para no cortar el ataque de la primera palabra.
+  Las pausas internas se conservan: forman parte de la fluidez evaluada.
+
+Todo se hace con operaciones vectorizadas de NumPy. Si el audio ya está en
+el formato de destino y no hay silencio que recortar se devuelve tal cual.
+"""
+
+import numpy as np
+
+from app.utils.wav import WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, WavFormatError, build_wav, parse_wav_header, pcm_view
+
+TARGET_SAMPLE_RATE = 16000
+
+# Detector de voz: ventanas de 20 ms; es voz lo que esté a menos de
+# VAD_DYNAMIC_RANGE dB de la ventana más fuerte y por encima de VAD_FLOOR_DB
+VAD_FRAME_MS = 20
+VAD_DYNAMIC_RANGE = 35.0
+VAD_FLOOR_DB = -55.0
+
+# Margen que se conserva antes y después de la voz detectada
+VAD_PADDING_MS = 200
+
+# Coeficientes del filtro antialiasing (ventana de Blackman)
+_FILTER_TAPS = 63
+
+
+def _decode(info, data):
+    """Muestras como float32 en [-1, 1] con forma (frames, canales)"""
+    channels = info["channels"]
+    bits = info["bits_per_sample"]
+    frames = info["frames"]
+    data = data[:frames * info["block_align"]]
+
+    if info["format_tag"] == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        samples = np.frombuffer(data, dtype="<f4" if bits == 32 else "<f8").astype(np.float32)
+    elif info["format_tag"] != WAVE_FORMAT_PCM:
+        raise WavFormatError("formato de audio no soportado")
+    elif bits == 8:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif bits == 16:
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    elif bits == 24:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        value = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        value = np.where(value & 0x800000, value - 0x1000000, value)
+        samples = value.astype(np.float32) / 8388608.0
+    elif bits == 32:
+        samples = np.frombuffer(data, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise WavFormatError(f"profundidad de bits no soportada: {bits}")
+
+    return samples.reshape(-1, channels)
+
+
+def _lowpass(samples, cutoff):
+    """Filtro FIR paso bajo (sinc enventanado); `cutoff` relativo a la frecuencia de muestreo"""
+    n = np.arange(_FILTER_TAPS) - (_FILTER_TAPS - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.blackman(_FILTER_TAPS)
+    taps /= taps.sum()
+    return np.convolve(samples, taps.astype(np.float32), mode="same")
+
+
+def resample(samples, sample_rate, target_rate=TARGET_SAMPLE_RATE):
+    """Cambia la frecuencia de muestreo de una señal mono (interpolación lineal vectorizada)"""
+    if sample_rate == target_rate or samples.size == 0:
+        return samples
+    if target_rate < sample_rate:
+        # Eliminar lo que no cabe por debajo de la nueva frecuencia de Nyquist
+        samples = _lowpass(samples, 0.45 * target_rate / sample_rate)
+    length = int(round(samples.size * target_rate / sample_rate))
+    positions = np.arange(length, dtype=np.float64) * (sample_rate / target_rate)
+    return np.interp(positions, np.arange(samples.size), samples).astype(np.float32)
+
+
+def speech_bounds(samples, sample_rate):
+    """
+    (inicio, fin) en muestras de la zona con voz según la energía por ventana.
+    Si no se detecta voz devuelve la señal completa.
+    """
+    frame = max(1, sample_rate * VAD_FRAME_MS // 1000)
+    count = samples.size // frame
+    if count == 0:
+        return 0, samples.size
+
+    frames = samples[:count * frame].reshape(count, frame)
+    energy = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+    db = 20 * np.log10(np.maximum(energy, 1e-10))
+    threshold = max(db.max() - VAD_DYNAMIC_RANGE, VAD_FLOOR_DB)
+
+    voiced = np.flatnonzero(db >= threshold)
+    if voiced.size == 0:
+        return 0, samples.size
+
+    padding = sample_rate * VAD_PADDING_MS // 1000
+    start = max(0, voiced[0] * frame - padding)
+    end = min(samples.size, (voiced[-1] + 1) * frame + padding)
+    return start, end
+
+
+def normalize_audio(audio_bytes, trim_silence=True, target_rate=TARGET_SAMPLE_RATE):
+    """
+    Devuelve (wav_bytes, informe) con el audio en 16 kHz mono 16 bits.
+
+    El informe indica qué se ha hecho y cuánto se ha ahorrado:
+    {
+        "original_bytes": int, "bytes": int, "bytes_saved": int,
+        "original_duration": float, "duration": float, "seconds_saved": float,
+        "resampled": bool, "downmixed": bool, "trimmed": bool
+    }
+    """
+    info = parse_wav_header(audio_bytes)
+    samples = _decode(info, pcm_view(audio_bytes, info))
+
+    downmixed = info["channels"] > 1
+    mono = samples.mean(axis=1) if downmixed else samples[:, 0]
+
+    resampled = info["sample_rate"] != target_rate
+    mono = resample(mono, info["sample_rate"], target_rate)
+
+    trimmed = False
+    if trim_silence:
+        start, end = speech_bounds(mono, target_rate)
+        trimmed = bool(start > 0 or end < mono.size)
+        mono = mono[start:end]
+
+    already_target = (
+        info["format_tag"] == WAVE_FORMAT_PCM and info["bits_per_sample"] == 16
+        and not downmixed and not resampled and not trimmed
+    )
+    if already_target:
+        wav_bytes = audio_bytes
+    else:
+        pcm = np.clip(np.round(mono * 32768.0), -32768, 32767).astype("<i2")
+        wav_bytes = build_wav(pcm, target_rate)
+
+    original_bytes = memoryview(audio_bytes).nbytes
+    duration = (info["duration"] if already_target else mono.size / float(target_rate))
+    return wav_bytes, {
+        "original_bytes": original_bytes,
+        "bytes": len(wav_bytes),
+        "bytes_saved": original_bytes - len(wav_bytes),
+        "original_duration": info["duration"],
+        "duration": duration,
+        "seconds_saved": info["duration"] - duration,
+        "resampled": resampled,
+        "downmixed": downmixed,
+        "trimmed": trimmed
+    }
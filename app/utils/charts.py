@@ -0,0 +1,113 @@
+"""
+charts.py
+---------
+Gráficos de puntuaciones de las páginas de resultados e historial.
+
+- Modo "image" (por defecto): PNG dibujado con matplotlib una sola vez por
+  combinación de puntuaciones y guardado en una caché LRU; en cada rerun solo
+  se envía la imagen ya rasterizada.
+- Modo "native": gráfico Vega-Lite que dibuja el navegador, sin importar
+  matplotlib en ningún momento.
+
+El modo se elige con CHART_MODE y el tamaño de la caché con CHART_CACHE_SIZE.
+"""
+
+import io
+import os
+from functools import lru_cache
+
+import streamlit as st
+
+from app.services.metrics import span
+
+SCORE_LABELS = ("General", "Precisión", "Fluidez", "Completitud")
+SCORE_COLORS = ("#667eea", "#ff6b6b", "#48dbfb", "#1dd1a1")
+
+# (ancho, alto) en pulgadas de cada tamaño de gráfico
+CHART_SIZES = {
+    "large": (10, 4),
+    "small": (6, 2),
+}
+
+CHART_MODE = os.getenv("CHART_MODE", "image").lower()
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", 256))
+
+
+def chart_key(scores):
+    """Clave de caché: las puntuaciones se muestran con un decimal"""
+    return tuple(round(float(s), 1) for s in scores)
+
+
+@lru_cache(maxsize=CHART_CACHE_SIZE)
+def _render_png(scores, size, title):
+    with span("chart_render"):
+        return _draw_png(scores, size, title)
+
+
+def _draw_png(scores, size, title):
+    # Figure + lienzo Agg directamente: sin pyplot ni su estado global
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=CHART_SIZES[size])
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.bar(SCORE_LABELS, scores, color=SCORE_COLORS)
+    ax.set_ylim(0, 100)
+    if title:
+        ax.set_title(title, fontsize=9)
+    for idx, val in enumerate(scores):
+        ax.text(idx, val + 1, f"{val:.1f}", ha='center', va='bottom', fontsize=9)
+
+    out = io.BytesIO()
+    fig.savefig(out, format="png", bbox_inches="tight")
+    return out.getvalue()
+
+
+def render_scores_png(scores, size="large", title=None):
+    """PNG del gráfico de puntuaciones (cacheado por puntuaciones, tamaño y título)"""
+    return _render_png(chart_key(scores), size, title)
+
+
+def _vega_spec(size, title):
+    # El ancho lo pone el contenedor (como el PNG, que se muestra con width="stretch")
+    _, height = CHART_SIZES[size]
+    bars = {
+        "mark": "bar",
+        "encoding": {
+            "x": {"field": "label", "type": "nominal", "sort": None, "title": None, "axis": {"labelAngle": 0}},
+            "y": {"field": "score", "type": "quantitative", "scale": {"domain": [0, 100]}, "title": None},
+            "color": {
+                "field": "label", "type": "nominal", "legend": None,
+                "scale": {"domain": list(SCORE_LABELS), "range": list(SCORE_COLORS)}
+            }
+        }
+    }
+    text = {
+        "mark": {"type": "text", "dy": -6},
+        "encoding": {
+            "x": {"field": "label", "type": "nominal", "sort": None},
+            "y": {"field": "score", "type": "quantitative"},
+            "text": {"field": "score", "type": "quantitative", "format": ".1f"}
+        }
+    }
+    spec = {"height": height * 40, "layer": [bars, text]}
+    if title:
+        spec["title"] = title
+    return spec
+
+
+def show_score_chart(scores, size="large", title=None):
+    """Muestra el gráfico de puntuaciones según CHART_MODE"""
+    scores = chart_key(scores)
+    if CHART_MODE == "native":
+        data = [{"label": label, "score": score} for label, score in zip(SCORE_LABELS, scores)]
+        st.vega_lite_chart({"values": data}, _vega_spec(size, title), width="stretch")
+    else:
+        st.image(render_scores_png(scores, size, title), width="stretch")
+
+
+def get_chart_cache_stats():
+    """Aciertos/fallos de la caché de imágenes"""
+    info = _render_png.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
@@ -0,0 +1,52 @@
+"""
+session.py
+----------
+Utilidades de sesión compartidas por las páginas de Streamlit.
+
+El usuario se identifica con un id anónimo que viaja en la URL (`?uid=...`),
+de modo que su historial se recupera desde cualquier réplica o tras un reinicio.
+"""
+
+import uuid
+
+import streamlit as st
+
+from app.services.audio_store import get_audio_store
+from app.services.history import get_history_store
+
+
+def get_user_id():
+    """Id anónimo del usuario: se lee de la URL o se genera y se añade a ella"""
+    user_id = st.session_state.get("user_id") or st.query_params.get("uid")
+    if not user_id:
+        user_id = uuid.uuid4().hex
+    st.session_state.user_id = user_id
+    if st.query_params.get("uid") != user_id:
+        st.query_params["uid"] = user_id
+    return user_id
+
+
+def save_to_history(phrase, language, assessment, audio_bytes=None):
+    """
+    Guarda una evaluación en el historial del usuario y la marca como la última.
+    El audio se guarda una sola vez, comprimido, en el almacén de audio.
+    """
+    try:
+        audio_ref = get_audio_store().put(audio_bytes) if audio_bytes else None
+        entry = get_history_store().add(get_user_id(), phrase, language, assessment, audio_ref)
+    except Exception as e:
+        st.error(f"Error al guardar en historial: {str(e)}")
+        return None
+
+    # Mostrar la nueva evaluación (no un elemento antiguo del historial)
+    st.session_state.selected_history_item = None
+    return entry
+
+
+def render_audio(audio_ref):
+    """Muestra el reproductor de una grabación guardada (se envía comprimida al navegador)"""
+    if not audio_ref:
+        return
+    data, mime = get_audio_store().get(audio_ref)
+    if data is not None:
+        st.audio(data, format=mime)
@@ -1,73 +1,91 @@
 import os
-import tempfile
-import wave
-import contextlib
+import mmap
+
+from app.utils.wav import WAVE_FORMAT_PCM, WavFormatError, parse_wav_header
 
 """
-Valida que el archivo de audio sea válido y devuelve errores específicos.
+Valida que el audio sea un WAV válido y devuelve errores específicos.
+
+Solo se lee la cabecera (chunks RIFF/fmt/data) directamente desde memoria,
+sin copiar el audio ni escribirlo en disco.
 
 Return un dict:
 {
     "valid": bool,
-    "error": str | None
+    "error": str | None,
+    "duration": float | None,
+    "sample_rate": int | None,
+    "channels": int | None,
+    "bits_per_sample": int | None
 }
 """
 
-def validate_audio_file(file_path):
+MAX_AUDIO_SIZE = 100 * 1024 * 1024
+MIN_DURATION = 0.5
 
-    if not os.path.exists(file_path):
-        return {"valid": False, "error": "Archivo no encontrado"}
 
-    if not file_path.lower().endswith('.wav'):
-        return {"valid": False, "error": "El archivo no es .wav"}
-
-    file_size = os.path.getsize(file_path)
-    if file_size == 0:
-        return {"valid": False, "error": "Archivo vacío"}
-
-    if file_size > 100 * 1024 * 1024:
-        return {"valid": False, "error": "Archivo demasiado grande (>100 MB)"}
+def _invalid(error):
+    return {
+        "valid": False,
+        "error": error,
+        "duration": None,
+        "sample_rate": None,
+        "channels": None,
+        "bits_per_sample": None
+    }
 
-    try:
-        with contextlib.closing(wave.open(file_path, 'r')) as f:
-            frames = f.getnframes()
-            rate = f.getframerate()
-            duration = frames / float(rate) if rate > 0 else 0
 
-            if duration <= 0.5:
-                return {"valid": False, "error": f"Duración demasiado corta ({duration:.2f}s), debe ser >0.5s"}
+def validate_audio_bytes(audio_bytes) -> dict:
+    """
+    Valida un audio WAV en memoria (bytes, bytearray, memoryview o mmap).
+    """
+    size = len(audio_bytes) if audio_bytes is not None else 0
+    if size == 0:
+        return _invalid("Archivo vacío")
 
-    except wave.Error as e:
-        return {"valid": False, "error": f"Error leyendo WAV: {str(e)}"}
+    if size > MAX_AUDIO_SIZE:
+        return _invalid("Archivo demasiado grande (>100 MB)")
 
-    return {"valid": True, "error": None}
+    try:
+        info = parse_wav_header(audio_bytes)
+    except WavFormatError as e:
+        return _invalid(f"Error leyendo WAV: {str(e)}")
+    except Exception as e:
+        return _invalid(f"Error al validar audio: {str(e)}")
+
+    if info["format_tag"] != WAVE_FORMAT_PCM:
+        return _invalid(f"Error leyendo WAV: formato no soportado ({info['format_tag']}), debe ser PCM")
+
+    duration = info["duration"]
+    if duration <= MIN_DURATION:
+        return _invalid(f"Duración demasiado corta ({duration:.2f}s), debe ser >{MIN_DURATION}s")
+
+    return {
+        "valid": True,
+        "error": None,
+        "duration": duration,
+        "sample_rate": info["sample_rate"],
+        "channels": info["channels"],
+        "bits_per_sample": info["bits_per_sample"]
+    }
 
 
-def validate_audio_bytes(audio_bytes: bytes) -> dict:
+def validate_audio_file(file_path):
     """
-    Valida un audio en bytes usando la función `validate_audio_file`.
-
-    Retorna un dict con:
-    {
-        "valid": True/False,
-        "error": "mensaje de error si no es válido"
-    }
+    Valida un archivo WAV en disco usando `validate_audio_bytes` sobre un mmap.
     """
-    tmp_file_path = None
-    try:
-        # Crear archivo temporal
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-            tmp_file.write(audio_bytes)
-            tmp_file_path = tmp_file.name
+    if not os.path.exists(file_path):
+        return _invalid("Archivo no encontrado")
 
-        # Validar usando tu función existente
-        result = validate_audio_file(tmp_file_path)
-        return result
+    if not file_path.lower().endswith('.wav'):
+        return _invalid("El archivo no es .wav")
 
-    except Exception as e:
-        return {"valid": False, "error": f"Error al validar audio: {str(e)}"}
+    file_size = os.path.getsize(file_path)
+    if file_size == 0:
+        return _invalid("Archivo vacío")
+
+    if file_size > MAX_AUDIO_SIZE:
+        return _invalid("Archivo demasiado grande (>100 MB)")
 
-    finally:
-        # Eliminar temporal
-        if tmp_file_path and os.path.exists(tmp_file_path):
-            os.unlink(tmp_file_path)
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return validate_audio_bytes(mapped)
@@ -0,0 +1,125 @@
+"""
+wav.py
+------
+Lectura de cabeceras WAV (RIFF) directamente desde memoria.
+
+Permite conocer el formato del audio y localizar el bloque de muestras PCM
+sin escribir el buffer en disco ni copiarlo: todo se hace sobre un `memoryview`.
+"""
+
+import struct
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Tamaños que algunos grabadores escriben cuando no conocen la longitud final
+_UNKNOWN_SIZES = (0, 0xFFFFFFFF)
+
+
+class WavFormatError(ValueError):
+    """El buffer no es un WAV que podamos interpretar"""
+
+
+def parse_wav_header(buffer):
+    """
+    Analiza los chunks RIFF/fmt/data de un WAV en memoria.
+
+    Acepta bytes, bytearray o memoryview y no copia el contenido.
+    Devuelve un dict con el formato y la posición del bloque de datos:
+    {
+        "format_tag": int,
+        "channels": int,
+        "sample_rate": int,
+        "bits_per_sample": int,
+        "block_align": int,
+        "data_offset": int,
+        "data_size": int,
+        "frames": int,
+        "duration": float
+    }
+    """
+    view = memoryview(buffer).cast("B")
+    total = view.nbytes
+
+    if total < 12 or view[0:4] != b"RIFF" or view[8:12] != b"WAVE":
+        raise WavFormatError("falta la cabecera RIFF/WAVE")
+
+    fmt = None
+    data_offset = None
+    data_size = 0
+    pos = 12
+
+    while pos + 8 <= total:
+        chunk_id = view[pos:pos + 4].tobytes()
+        chunk_size = struct.unpack_from("<I", view, pos + 4)[0]
+        body = pos + 8
+
+        if chunk_id == b"fmt ":
+            if chunk_size < 16 or body + 16 > total:
+                raise WavFormatError("chunk fmt incompleto")
+            format_tag, channels, sample_rate, _, block_align, bits = struct.unpack_from("<HHIIHH", view, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26 and body + 26 <= total:
+                # El subformato real son los dos primeros bytes del GUID
+                format_tag = struct.unpack_from("<H", view, body + 24)[0]
+            fmt = {
+                "format_tag": format_tag,
+                "channels": channels,
+                "sample_rate": sample_rate,
+                "bits_per_sample": bits,
+                "block_align": block_align,
+            }
+
+        elif chunk_id == b"data":
+            data_offset = body
+            available = total - body
+            data_size = available if chunk_size in _UNKNOWN_SIZES else min(chunk_size, available)
+            break
+
+        # Los chunks se alinean a tamaño par
+        pos = body + chunk_size + (chunk_size & 1)
+
+    if fmt is None:
+        raise WavFormatError("no se encontró el chunk fmt")
+    if data_offset is None:
+        raise WavFormatError("no se encontró el chunk data")
+    if fmt["channels"] == 0 or fmt["block_align"] == 0:
+        raise WavFormatError("número de canales o alineación de bloque no válidos")
+
+    frames = data_size // fmt["block_align"]
+    duration = frames / float(fmt["sample_rate"]) if fmt["sample_rate"] > 0 else 0.0
+
+    return {
+        **fmt,
+        "data_offset": data_offset,
+        "data_size": data_size,
+        "frames": frames,
+        "duration": duration,
+    }
+
+
+def pcm_view(buffer, info=None):
+    """
+    Devuelve un memoryview sobre las muestras PCM del WAV (sin cabecera y sin copiar).
+    """
+    if info is None:
+        info = parse_wav_header(buffer)
+    view = memoryview(buffer).cast("B")
+    return view[info["data_offset"]:info["data_offset"] + info["data_size"]]
+
+
+def build_wav(pcm, sample_rate, bits_per_sample=16, channels=1):
+    """Construye un WAV PCM mínimo (cabecera de 44 bytes + datos)"""
+    pcm = memoryview(pcm).cast("B")
+    block_align = channels * bits_per_sample // 8
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + pcm.nbytes, b"WAVE",
+        b"fmt ", 16, WAVE_FORMAT_PCM, channels, sample_rate,
+        sample_rate * block_align, block_align, bits_per_sample,
+        b"data", pcm.nbytes
+    )
+    out = bytearray(len(header) + pcm.nbytes)
+    out[:len(header)] = header
+    out[len(header):] = pcm
+    return bytes(out)
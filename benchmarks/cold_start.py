@@ -0,0 +1,169 @@
+"""
+cold_start.py
+-------------
+Tiempo de arranque en frío: cada caso se ejecuta en un intérprete nuevo, como
+una réplica recién creada por el autoescalado.
+
+Para cada caso se mide el proceso completo (intérprete incluido) y el tiempo
+del propio caso dentro del proceso:
+
+- import.speech / import.pages: importar el evaluador y los módulos que usan
+  las páginas (el SDK de Azure, numpy y matplotlib no deberían aparecer).
+- import.azure_sdk: lo que cuesta el SDK cuando por fin se usa.
+- evaluator.ready: `get_evaluator()` hasta tener el estado de configuración.
+- first_evaluation: primera evaluación con el backend `fake` (sin red).
+- first_page.<página>: primer render completo de la página con el
+  `AppTest` de Streamlit.
+
+Uso (desde la raíz del repositorio):
+
+    python -m benchmarks.cold_start
+    python -m benchmarks.cold_start --repeat 10 --json arranque.json
+    python -m benchmarks.cold_start --importtime app.services.speech --top 15
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos pesados que no deberían cargarse solo por arrancar
+HEAVY_MODULES = ("azure.cognitiveservices.speech", "numpy", "matplotlib", "soundfile")
+
+CASES = {
+    "import.speech": "import app.services.speech",
+    "import.pages": (
+        "import streamlit, app.services.speech, app.services.history, app.utils.charts, "
+        "app.utils.session, app.utils.validation"
+    ),
+    "import.azure_sdk": "import app.services.azure_backend",
+    "evaluator.ready": (
+        "from app.services.speech import get_evaluator\n"
+        "get_evaluator(warm_up=False).get_configuration_status()"
+    ),
+    "first_evaluation": (
+        "import os\n"
+        "os.environ['SPEECH_BACKEND'] = 'fake'\n"
+        "os.environ['SPEECH_FAKE_LATENCY'] = '0'\n"
+        "os.environ['EVALUATION_CACHE'] = 'off'\n"
+        "from benchmarks.run import synth_wav\n"
+        "audio = synth_wav(4)\n"
+        "from app.services.speech import get_evaluator\n"
+        "assert get_evaluator(warm_up=False).evaluate_pronunciation_bytes(audio, 'Hello world', 'en-US')['success']"
+    ),
+}
+
+PAGES = ("main.py", "pages/2_resultados.py", "pages/3_historial.py")
+
+for _page in PAGES:
+    CASES[f"first_page.{os.path.splitext(os.path.basename(_page))[0]}"] = (
+        "from streamlit.testing.v1 import AppTest\n"
+        f"AppTest.from_file({_page!r}, default_timeout=60).run()"
+    )
+
+# Se ejecuta en el proceso hijo: mide el caso y lista los módulos pesados cargados
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print("@@" + json.dumps({{"elapsed": elapsed, "heavy": heavy}}))
+"""
+
+
+def run_case(code, env=None):
+    """(segundos del proceso completo, segundos del caso, módulos pesados cargados)"""
+    child = CHILD.format(code=code, heavy=HEAVY_MODULES)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", child], cwd=ROOT, env=env, capture_output=True, text=True, timeout=300
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "error")
+    line = next(l for l in proc.stdout.splitlines() if l.startswith("@@"))
+    data = json.loads(line[2:])
+    return wall, data["elapsed"], data["heavy"]
+
+
+def measure(code, repeat, env=None):
+    walls, inner, heavy = [], [], []
+    for _ in range(repeat):
+        wall, elapsed, heavy = run_case(code, env)
+        walls.append(wall)
+        inner.append(elapsed)
+    return {
+        "process_median": statistics.median(walls),
+        "process_max": max(walls),
+        "case_median": statistics.median(inner),
+        "case_max": max(inner),
+        "heavy_modules": heavy,
+    }
+
+
+def import_profile(module, top):
+    """Módulos más lentos de importar (según `python -X importtime`)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, timeout=300
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    rows.sort(reverse=True)
+    print(f"{'acumulado ms':>13}{'propio ms':>11}  módulo")
+    for cumulative_us, self_us, name in rows[:top]:
+        print(f"{cumulative_us / 1000:13.1f}{self_us / 1000:11.1f}  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de arranque en frío")
+    parser.add_argument("--repeat", type=int, default=5, help="Procesos nuevos por caso")
+    parser.add_argument("--filter", action="append", help="Ejecutar solo los casos que contengan este texto")
+    parser.add_argument("--json", help="Guardar los resultados en este JSON")
+    parser.add_argument("--importtime", metavar="MODULO", help="Desglose de importación de un módulo")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.importtime:
+        import_profile(args.importtime, args.top)
+        return
+
+    # Sin puerto de métricas ni perfilado: se mide solo el arranque
+    env = {k: v for k, v in os.environ.items() if k not in ("METRICS_PORT", "PROFILE")}
+    baseline = measure("pass", args.repeat, env)["process_median"]
+    print(f"Intérprete vacío: {baseline * 1000:.0f} ms\n")
+    print(f"{'caso':<28}{'proceso ms':>12}{'caso ms':>10}{'máx ms':>10}  módulos pesados")
+
+    results = {"interpreter": baseline, "cases": {}}
+    for name, code in CASES.items():
+        if args.filter and not any(f in name for f in args.filter):
+            continue
+        try:
+            r = measure(code, args.repeat, env)
+        except RuntimeError as e:
+            print(f"{name:<28}  error: {e}")
+            continue
+        results["cases"][name] = r
+        print(
+            f"{name:<28}{r['process_median'] * 1000:12.0f}{r['case_median'] * 1000:10.0f}"
+            f"{r['case_max'] * 1000:10.0f}  {', '.join(r['heavy_modules']) or '-'}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
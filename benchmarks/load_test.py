@@ -0,0 +1,292 @@
+"""
+load_test.py
+------------
+Prueba de carga: N sesiones de usuario simultáneas contra `PronunciationEvaluator`.
+
+Cada sesión repite el flujo de la página de grabación: validar el WAV,
+evaluarlo y, si sale bien, guardarlo en el historial (almacén de audio
+incluido). Entre una evaluación y la siguiente "piensa" un tiempo aleatorio
+(exponencial con la media indicada). El servicio de voz es el backend local
+`fake`, con latencia, jitter, errores y throttling configurables.
+
+Informe: throughput, tasa de éxito y p50/p95/p99 por etapa
+(validate, cache, preprocess, queue, backend, store, history, total).
+Con varios niveles en --sessions se ve en qué punto deja de escalar.
+
+Uso (desde la raíz del repositorio):
+
+    python -m benchmarks.load_test --sessions 1,10,50,100 --duration 20
+    python -m benchmarks.load_test --sessions 50 --mix en-US:0.6,es-ES:0.4 --think-time 2 --latency 0.8
+    python -m benchmarks.load_test --sessions 200 --mode async --json informe.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.run import synth_wav
+
+STAGES = ("validate", "cache", "preprocess", "queue", "backend", "store", "history", "total")
+
+
+def percentile(sorted_values, q):
+    """Percentil q (0-100) de una lista ya ordenada (interpolación lineal)"""
+    if not sorted_values:
+        return None
+    pos = (len(sorted_values) - 1) * q / 100.0
+    low = int(pos)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (pos - low)
+
+
+def parse_mix(text):
+    """'en-US:0.6,es-ES:0.4' -> ([idiomas], [pesos])"""
+    languages, weights = [], []
+    for item in text.split(","):
+        language, _, weight = item.partition(":")
+        languages.append(language.strip())
+        weights.append(float(weight) if weight else 1.0)
+    return languages, weights
+
+
+class Recorder:
+    """Acumula los tiempos por etapa de todas las sesiones"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.ok = 0
+        self.failed = 0
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, timings, success, error_kind=None):
+        with self._lock:
+            for stage, value in timings.items():
+                self.samples[stage].append(value)
+            if success:
+                self.ok += 1
+            else:
+                self.failed += 1
+                self.errors[error_kind or "other"] += 1
+
+    def report(self, elapsed):
+        stages = {}
+        for stage in STAGES:
+            values = sorted(self.samples.get(stage, ()))
+            if values:
+                stages[stage] = {
+                    "count": len(values),
+                    "p50": percentile(values, 50),
+                    "p95": percentile(values, 95),
+                    "p99": percentile(values, 99),
+                    "max": values[-1],
+                }
+        total = self.ok + self.failed
+        return {
+            "requests": total,
+            "ok": self.ok,
+            "failed": self.failed,
+            "errors": dict(self.errors),
+            "elapsed": elapsed,
+            "throughput": total / elapsed if elapsed else 0.0,
+            "stages": stages,
+        }
+
+
+def _error_kind(result):
+    if result.get("cancellation_reason") == "Shed":
+        # Descartada por el planificador (circuito abierto o demasiada cola)
+        return "shed"
+    if result.get("error_code") == "TooManyRequests":
+        return "throttled"
+    if "Cancelado" in (result.get("error") or ""):
+        return "canceled"
+    return "other"
+
+
+class Workload:
+    """Genera las peticiones de las sesiones: idioma, frase y grabación"""
+
+    def __init__(self, mix, seconds, repeat_rate, seed=None):
+        from app.utils.languages_phrases import EXAMPLE_PHRASES
+
+        self.languages, self.weights = mix
+        self.phrases = EXAMPLE_PHRASES
+        self.repeat_rate = repeat_rate
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counter = 0
+        # Grabación base (como las del navegador: 16 kHz mono); cada petición la varía
+        self.base = synth_wav(seconds, seed=seed or 0)
+
+    def next(self):
+        with self._lock:
+            language = self.rng.choices(self.languages, self.weights)[0]
+            phrase = self.rng.choice(self.phrases[language])
+            repeat = self.rng.random() < self.repeat_rate
+            self._counter += 1
+            counter = self._counter
+        if repeat:
+            # Misma grabación que otra petición: ejercita caché y single-flight
+            return self.base, phrase, language
+        audio = bytearray(self.base)
+        audio[-4:] = counter.to_bytes(4, "little")
+        return bytes(audio), phrase, language
+
+
+def page_flow(evaluator, workload, recorder, user_id, store_history):
+    """Una evaluación tal como la hace `pages/1_grabar_audio.py`"""
+    from app.services.audio_store import get_audio_store
+    from app.services.history import get_history_store
+    from app.utils.validation import validate_audio_bytes
+
+    audio, phrase, language = workload.next()
+    start = time.perf_counter()
+    validation = validate_audio_bytes(audio)
+    validate_time = time.perf_counter() - start
+    if not validation["valid"]:
+        recorder.add({"validate": validate_time}, False, "invalid")
+        return
+
+    result = evaluator.evaluate_pronunciation_bytes(audio, phrase, language)
+    timings = dict(result.get("timings") or {})
+    timings["validate"] = validate_time
+
+    if result["success"] and store_history:
+        mark = time.perf_counter()
+        ref = get_audio_store().put(audio)
+        get_history_store().add(user_id, phrase, language, result["assessment"], ref)
+        timings["history"] = time.perf_counter() - mark
+
+    timings["total"] = time.perf_counter() - start
+    recorder.add(timings, result["success"], _error_kind(result))
+
+
+def run_threads(evaluator, workload, sessions, duration, think_time, store_history, seed=None):
+    """Cada sesión es un hilo, como las sesiones de Streamlit"""
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+
+    def session(index):
+        rng = random.Random(None if seed is None else seed + index)
+        # Arranque escalonado para no empezar todas a la vez
+        time.sleep(rng.uniform(0, think_time))
+        while time.monotonic() < deadline:
+            page_flow(evaluator, workload, recorder, f"load-{index}", store_history)
+            if think_time:
+                time.sleep(rng.expovariate(1.0 / think_time))
+
+    threads = [threading.Thread(target=session, args=(i,), daemon=True) for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.report(time.perf_counter() - start)
+
+
+def run_async(evaluator, workload, sessions, duration, think_time, seed=None):
+    """Cada sesión es una corrutina sobre `evaluate_pronunciation_async` (API/lotes)"""
+    recorder = Recorder()
+
+    async def session(index, deadline):
+        rng = random.Random(None if seed is None else seed + index)
+        await asyncio.sleep(rng.uniform(0, think_time))
+        while time.monotonic() < deadline:
+            audio, phrase, language = workload.next()
+            result = await evaluator.evaluate_pronunciation_async(audio, phrase, language)
+            recorder.add(dict(result.get("timings") or {}), result["success"], _error_kind(result))
+            if think_time:
+                await asyncio.sleep(rng.expovariate(1.0 / think_time))
+
+    async def main():
+        deadline = time.monotonic() + duration
+        await asyncio.gather(*(session(i, deadline) for i in range(sessions)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return recorder.report(time.perf_counter() - start)
+
+
+def print_report(sessions, report):
+    print(
+        f"\n== {sessions} sesiones: {report['requests']} peticiones en {report['elapsed']:.1f} s "
+        f"({report['throughput']:.1f}/s), {report['ok']} ok, {report['failed']} fallidas {report['errors'] or ''}"
+    )
+    print(f"   {'etapa':<11}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, values in report["stages"].items():
+        print(
+            f"   {stage:<11}{values['p50'] * 1000:10.1f}{values['p95'] * 1000:10.1f}"
+            f"{values['p99'] * 1000:10.1f}{values['max'] * 1000:10.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga con sesiones simuladas")
+    parser.add_argument("--sessions", default="10", help="Sesiones simultáneas; varias separadas por comas (1,10,50)")
+    parser.add_argument("--duration", type=float, default=15.0, help="Segundos por nivel de carga")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Media (s) entre evaluaciones de una sesión")
+    parser.add_argument("--mix", default="en-US:0.4,es-ES:0.3,de-DE:0.15,fr-FR:0.15", help="Idiomas y pesos")
+    parser.add_argument("--audio-seconds", type=float, default=4.0, help="Duración de cada grabación")
+    parser.add_argument("--repeat-rate", type=float, default=0.0, help="Fracción de grabaciones repetidas")
+    parser.add_argument("--mode", choices=("threads", "async"), default="threads")
+    parser.add_argument("--concurrency", type=int, default=None, help="AZURE_SPEECH_MAX_CONCURRENCY del evaluador")
+    parser.add_argument("--cache", action="store_true", help="Usar la caché de evaluaciones (por defecto desactivada)")
+    parser.add_argument("--no-history", action="store_true", help="No guardar en historial tras evaluar")
+    parser.add_argument("--latency", type=float, default=0.5, help="Latencia del backend fake (s)")
+    parser.add_argument("--jitter", type=float, default=0.15)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", help="Guardar el informe en este JSON")
+    args = parser.parse_args()
+
+    if not args.cache:
+        os.environ["EVALUATION_CACHE"] = "off"
+
+    from app.services.backends import FakeSpeechBackend
+    from app.services.speech import PronunciationEvaluator
+    from app.utils.languages_phrases import LANGUAGE_OPTIONS
+
+    mix = parse_mix(args.mix)
+    unknown = [l for l in mix[0] if l not in LANGUAGE_OPTIONS.values()]
+    if unknown:
+        parser.error(f"idiomas no soportados: {', '.join(unknown)}")
+
+    reports = {}
+    for sessions in (int(s) for s in args.sessions.split(",")):
+        backend = FakeSpeechBackend(
+            latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+            throttle_rate=args.throttle_rate, seed=args.seed
+        )
+        evaluator = PronunciationEvaluator(max_concurrency=args.concurrency, backend=backend)
+        workload = Workload(mix, args.audio_seconds, args.repeat_rate, seed=args.seed)
+
+        if args.mode == "async":
+            report = run_async(evaluator, workload, sessions, args.duration, args.think_time, args.seed)
+        else:
+            report = run_threads(
+                evaluator, workload, sessions, args.duration, args.think_time, not args.no_history, args.seed
+            )
+        report["inflight"] = evaluator.get_inflight_stats()
+        reports[sessions] = report
+        print_report(sessions, report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "levels": reports}, f, indent=2)
+        print(f"\nInforme guardado en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
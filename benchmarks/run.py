@@ -0,0 +1,407 @@
+"""
+run.py
+------
+Benchmarks de los caminos críticos de la aplicación.
+
+- Validación de WAV (`validate_audio_bytes` / `validate_audio_file`).
+- Evaluación completa con `evaluate_pronunciation_bytes` sobre el backend
+  local `fake` sin latencia: mide solo el coste propio (preprocesado,
+  cabecera, deduplicación, modelo de resultado), sin red ni cuota.
+- Parseo del JSON de Azure a `AssessmentResult`.
+- Inserción en el historial (memoria, SQLite y clave-valor).
+- Gráficos de puntuaciones (PNG en frío y desde la caché).
+
+Entradas: los WAV de `docs/wav` y audios sintéticos largos y pesados.
+
+Uso (desde la raíz del repositorio):
+
+    python -m benchmarks.run                                 # ejecutar y mostrar
+    python -m benchmarks.run --against HEAD~1                # comparar con otro commit, medido ahora
+    python -m benchmarks.run --save benchmarks/baselines/local.json
+    python -m benchmarks.run --compare benchmarks/baselines/local.json
+    python -m benchmarks.run --filter validation
+
+Las medianas absolutas cambian de una ejecución a otra (frecuencia de la CPU,
+caché de disco, otros procesos) bastante más de lo que cambia el código. Por
+eso las comparaciones repiten la medida (--repeat, 3 por defecto al comparar)
+y se quedan con la mejor mediana de cada benchmark:
+
+- --against REF (recomendado como control): mide REF en un `git worktree` y
+  el árbol actual en la misma ejecución, alternando procesos nuevos, y compara
+  ambos con una tolerancia del 25 %.
+- --compare ARCHIVO: compara con una referencia guardada antes; como no se
+  midió a la vez, la tolerancia por defecto es del 50 % y solo detecta
+  empeoramientos grandes.
+
+Con cualquiera de las dos el proceso termina con código 1 si algún benchmark
+es más lento que la referencia por encima de la tolerancia.
+"""
+
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.utils.wav import build_wav
+
+SAMPLE_FILES = {
+    "aleman": os.path.join(ROOT, "docs", "wav", "audio_aleman.wav"),
+    "espanol": os.path.join(ROOT, "docs", "wav", "audio_español.wav"),
+}
+
+# Tiempo mínimo de medida por benchmark (s) y rondas mínimas
+MIN_TIME = 0.5
+MIN_ROUNDS = 5
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Registra una función que prepara el caso y devuelve la función a medir"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def synth_wav(seconds, sample_rate=16000, channels=1, seed=0):
+    """Voz sintética (tonos modulados con silencio al principio y al final), PCM 16 bits"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    envelope = (np.sin(2 * np.pi * 3 * t) > 0) & (t > 1.0) & (t < seconds - 1.0)
+    signal = 0.4 * np.sin(2 * np.pi * 180 * t) * np.sin(2 * np.pi * 0.7 * t) * envelope
+    signal += rng.normal(0, 1e-3, t.size)
+    frames = np.repeat(signal[:, None], channels, axis=1)
+    pcm = np.clip(frames * 32767, -32768, 32767).astype("<i2")
+    return build_wav(pcm, sample_rate, 16, channels)
+
+
+def load_inputs():
+    inputs = {}
+    for name, path in SAMPLE_FILES.items():
+        with open(path, "rb") as f:
+            inputs[name] = f.read()
+    # Largo: 3 minutos a 16 kHz mono (reconocimiento continuo)
+    inputs["long"] = synth_wav(180)
+    # Pesado: 60 s a 48 kHz estéreo (~11 MB)
+    inputs["large"] = synth_wav(60, sample_rate=48000, channels=2)
+    return inputs
+
+
+INPUTS = {}
+
+# Archivos temporales de los benchmarks (se borran al terminar)
+WORK_DIR = tempfile.mkdtemp(prefix="benchmarks-")
+atexit.register(shutil.rmtree, WORK_DIR, True)
+
+
+def _input(name):
+    if not INPUTS:
+        INPUTS.update(load_inputs())
+    return INPUTS[name]
+
+
+# ------------------------------------------------------------------ validación
+
+for _name in ("aleman", "espanol", "long", "large"):
+    @benchmark(f"validation.bytes.{_name}")
+    def _bench_validate_bytes(_name=_name):
+        from app.utils.validation import validate_audio_bytes
+        audio = _input(_name)
+        return lambda: validate_audio_bytes(audio)
+
+    @benchmark(f"validation.file.{_name}")
+    def _bench_validate_file(_name=_name):
+        from app.utils.validation import validate_audio_file
+        path = os.path.join(WORK_DIR, f"{_name}.wav")
+        with open(path, "wb") as f:
+            f.write(_input(_name))
+        return lambda: validate_audio_file(path)
+
+
+# ------------------------------------------------------------------ evaluación
+
+def _evaluator():
+    os.environ["EVALUATION_CACHE"] = "off"
+    from app.services.backends import FakeSpeechBackend
+    from app.services.speech import PronunciationEvaluator
+    return PronunciationEvaluator(backend=FakeSpeechBackend(latency=0, jitter=0))
+
+
+for _name in ("aleman", "espanol", "long", "large"):
+    @benchmark(f"evaluate.bytes.{_name}")
+    def _bench_evaluate(_name=_name):
+        evaluator = _evaluator()
+        audio = _input(_name)
+        phrase = "The quick brown fox jumps over the lazy dog"
+        return lambda: evaluator.evaluate_pronunciation_bytes(audio, phrase, "en-US")
+
+
+@benchmark("preprocess.normalize.large")
+def _bench_normalize():
+    from app.utils.audio import normalize_audio
+    audio = _input("large")
+    return lambda: normalize_audio(audio)
+
+
+# ------------------------------------------------------------------ resultados
+
+def _sample_json(words):
+    from app.services.backends import fake_assessment_json
+    from app.utils.wav import parse_wav_header
+    audio = _input("long")
+    phrase = " ".join(f"word{i}" for i in range(words))
+    return fake_assessment_json(audio, parse_wav_header(audio), phrase, "en-US")
+
+
+for _words in (10, 500):
+    @benchmark(f"parse.assessment.{_words}_words")
+    def _bench_parse(_words=_words):
+        from app.services.assessment import AssessmentResult
+        data = _sample_json(_words)
+        return lambda: AssessmentResult.from_json(data)
+
+    @benchmark(f"parse.assessment_with_phonemes.{_words}_words")
+    def _bench_parse_phonemes(_words=_words):
+        from app.services.assessment import AssessmentResult
+        data = _sample_json(_words)
+
+        def run():
+            result = AssessmentResult.from_json(data)
+            for word in result.words:
+                word.phonemes
+        return run
+
+
+# ------------------------------------------------------------------ historial
+
+def _history_case(store):
+    from app.services.assessment import AssessmentResult
+    assessment = AssessmentResult.from_json(_sample_json(10))
+    counter = iter(range(10 ** 9))
+    return lambda: store.add(f"user{next(counter) % 50}", "phrase", "en-US", assessment, "ref")
+
+
+@benchmark("history.add.memory")
+def _bench_history_memory():
+    from app.services.history import InMemoryHistoryStore
+    return _history_case(InMemoryHistoryStore())
+
+
+@benchmark("history.add.sqlite")
+def _bench_history_sqlite():
+    from app.services.history import SQLiteHistoryStore
+    path = os.path.join(WORK_DIR, "history.sqlite3")
+    return _history_case(SQLiteHistoryStore(path))
+
+
+@benchmark("history.add.kv")
+def _bench_history_kv():
+    from app.services.history import KeyValueHistoryStore
+    return _history_case(KeyValueHistoryStore())
+
+
+# ------------------------------------------------------------------ gráficos
+
+@benchmark("charts.png.cold")
+def _bench_chart_cold():
+    from app.utils.charts import _render_png, render_scores_png
+
+    def run():
+        _render_png.cache_clear()
+        render_scores_png((81.2, 75.0, 90.4, 100.0), "large")
+    return run
+
+
+@benchmark("charts.png.cached")
+def _bench_chart_cached():
+    from app.utils.charts import render_scores_png
+    render_scores_png((81.2, 75.0, 90.4, 100.0), "small", "Resumen de puntuaciones")
+    return lambda: render_scores_png((81.2, 75.0, 90.4, 100.0), "small", "Resumen de puntuaciones")
+
+
+# ------------------------------------------------------------------ ejecución
+
+def measure(fn, min_time=MIN_TIME, min_rounds=MIN_ROUNDS):
+    """Tiempos por llamada (s): repite hasta `min_time` y al menos `min_rounds` veces"""
+    fn()  # calentamiento
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < min_rounds or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "rounds": len(samples),
+        "min": samples[0],
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _print_result(name, r):
+    print(f"{name:<48} median {r['median'] * 1000:10.3f} ms   p95 {r['p95'] * 1000:10.3f} ms   ({r['rounds']} rondas)")
+
+
+def run(selected=None, min_time=MIN_TIME):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if selected and not any(s in name for s in selected):
+            continue
+        results[name] = measure(setup(), min_time=min_time)
+        _print_result(name, results[name])
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+        },
+        "results": results,
+    }
+
+
+def best_of(runs):
+    """Une varias ejecuciones quedándose, por benchmark, con la de menor mediana"""
+    merged = {"meta": dict(runs[0]["meta"], repeat=len(runs)), "results": {}}
+    for current in runs:
+        for name, result in current["results"].items():
+            best = merged["results"].get(name)
+            if best is None or result["median"] < best["median"]:
+                merged["results"][name] = result
+    return merged
+
+
+@contextlib.contextmanager
+def checkout(ref):
+    """Árbol de trabajo temporal (`git worktree`) con el commit `ref`"""
+    path = os.path.join(WORK_DIR, "ref")
+    subprocess.run(["git", "worktree", "add", "--detach", path, ref], cwd=ROOT, check=True, capture_output=True)
+    try:
+        yield path
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", path], cwd=ROOT, capture_output=True)
+
+
+def run_tree(path, selected, min_time, index):
+    """Ejecuta los benchmarks del árbol `path` en un proceso nuevo y devuelve sus resultados"""
+    out = os.path.join(WORK_DIR, f"{os.path.basename(path)}-{index}.json")
+    command = [sys.executable, "-m", "benchmarks.run", "--save", out, "--min-time", str(min_time)]
+    for s in selected or ():
+        command += ["--filter", s]
+    # Sin puerto de métricas ni perfilado: solo se mide el código
+    env = {k: v for k, v in os.environ.items() if k not in ("METRICS_PORT", "PROFILE", "PYTHONPATH")}
+    subprocess.run(command, cwd=path, env=env, check=True, stdout=subprocess.DEVNULL)
+    with open(out, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_against(ref, selected, min_time, repeat):
+    """
+    (actual, referencia) medidos en la misma ejecución, alternando procesos
+    nuevos de cada árbol para que el ruido afecte por igual a los dos
+    """
+    current_runs, reference_runs = [], []
+    with checkout(ref) as path:
+        for i in range(repeat):
+            print(f"Ronda {i + 1}/{repeat}: {ref} y árbol actual...")
+            reference_runs.append(run_tree(path, selected, min_time, i))
+            current_runs.append(run_tree(ROOT, selected, min_time, i))
+    baseline = best_of(reference_runs)
+    baseline["meta"]["commit"] = ref
+    return best_of(current_runs), baseline
+
+
+def compare(current, baseline, tolerance):
+    """Imprime la comparación y devuelve los nombres que han empeorado"""
+    regressions = []
+    print(f"\nComparación con la referencia ({baseline['meta'].get('commit')}, tolerancia {tolerance:.0%}):")
+    for name, result in current["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            print(f"  {name:<48} (nuevo)")
+            continue
+        ratio = result["median"] / reference["median"] if reference["median"] else float("inf")
+        mark = "REGRESIÓN" if ratio > 1 + tolerance else ("mejora" if ratio < 1 - tolerance else "")
+        print(f"  {name:<48} x{ratio:6.2f}  {mark}")
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de la evaluación de pronunciación")
+    parser.add_argument("--save", help="Guardar los resultados en este JSON")
+    parser.add_argument("--compare", help="JSON de referencia con el que comparar")
+    parser.add_argument("--against", metavar="REF", help="Commit de git que se mide ahora mismo como referencia")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="Empeoramiento admitido (por defecto 0.25 con --against y 0.5 con --compare)")
+    parser.add_argument("--repeat", type=int, default=None,
+                        help="Ejecuciones de las que se toma la mejor mediana (por defecto 3 al comparar, si no 1)")
+    parser.add_argument("--filter", action="append", help="Ejecutar solo los benchmarks que contengan este texto")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="Segundos de medida por benchmark")
+    args = parser.parse_args()
+    if args.against and args.compare:
+        parser.error("--against y --compare son excluyentes")
+
+    comparing = bool(args.against or args.compare)
+    repeat = max(1, args.repeat if args.repeat is not None else (3 if comparing else 1))
+    tolerance = args.tolerance if args.tolerance is not None else (0.25 if args.against else 0.5)
+
+    if args.against:
+        current, baseline = run_against(args.against, args.filter, args.min_time, repeat)
+        print()
+        for name, result in current["results"].items():
+            _print_result(name, result)
+    else:
+        runs = []
+        for i in range(repeat):
+            if repeat > 1:
+                print(f"\nRonda {i + 1}/{repeat}")
+            runs.append(run(args.filter, min_time=args.min_time))
+        current = best_of(runs)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+        print(f"\nResultados guardados en {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if comparing:
+        regressions = compare(current, baseline, tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) por encima de la tolerancia")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import streamlit as st
-from app.services.speech import PronunciationEvaluator
+from app.services.speech import get_evaluator
 
 st.set_page_config(
     page_title="🗣️ Tutor de Pronunciación",
@@ -9,7 +9,8 @@ st.set_page_config(
 
 st.title("🗣️ Tutor de Pronunciación Multilingüe")
 
-evaluator = PronunciationEvaluator()
+# Evaluador compartido por todo el proceso (las conexiones se abren en segundo plano)
+evaluator = get_evaluator()
 config_status = evaluator.get_configuration_status()
 
 if config_status["status"] == "error":
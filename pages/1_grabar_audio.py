@@ -1,12 +1,11 @@
-import time
-
 import streamlit as st
-import tempfile
-import os
-import hashlib
 
-from app.services.speech import PronunciationEvaluator
-from app.utils.validation import validate_audio_file
+from app.services.jobs import FINISHED, PRIORITY_INTERACTIVE, get_job_queue
+from app.services.metrics import span
+from app.services.profiling import profile_page
+from app.services.speech import get_evaluator
+from app.utils.session import get_user_id, save_to_history
+from app.utils.validation import validate_audio_bytes
 from app.utils.languages_phrases import LANGUAGE_OPTIONS,EXAMPLE_PHRASES
 from audio_recorder_streamlit import audio_recorder
 
@@ -14,48 +13,84 @@ from audio_recorder_streamlit import audio_recorder
 Grabacion de audio
 """
 
-# Iniciar evaluador de pronunciación
-@st.cache_resource
-def get_evaluator():
-    return PronunciationEvaluator()
-
+# Evaluador de pronunciación compartido con el resto de páginas
 evaluator = get_evaluator()
-@st.cache_data(ttl=300)
-def cached_evaluate(audio_bytes: bytes, phrase: str, language_code: str):
-    """
-    Evalúa la pronunciación y cachea solo los datos serializables (JSON).
-    """
-    # Crear hash único
-    h = hashlib.sha256()
-    h.update(audio_bytes)
-    h.update(phrase.encode('utf-8'))
-    h.update(language_code.encode('utf-8'))
-
-    # Llamar al evaluador
-    result = evaluator.evaluate_pronunciation_bytes(audio_bytes, phrase, language_code)
-
-    # Retornar solo datos serializables
-    return {
-        "success": result.get("success"),
-        "error": result.get("error"),
-        "json_result": result.get("json_result")  # Esto es un dict serializable
-    }
 
+# Cada cuántos segundos se consulta el estado de la evaluación en curso
+JOB_POLL_INTERVAL = 1.0
 
-# Validación de audio en bytes
-def validate_audio_bytes(audio_bytes: bytes):
+
+def submit_evaluation(audio_bytes: bytes, phrase: str, language_code: str, effect):
     """
-    Valida audio convirtiéndolo temporalmente a archivo WAV
+    Encola la evaluación en segundo plano (ver `app.services.jobs`) para no
+    bloquear el rerun mientras responde el servicio; el resultado lo recoge
+    `show_pending_evaluation`. El evaluador consulta antes su caché persistente.
     """
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-        tmp_file.write(audio_bytes)
-        tmp_path = tmp_file.name
-    try:
-        return validate_audio_file(tmp_path)
-    finally:
-        # Borrar temporal
-        import os
-        os.unlink(tmp_path)
+    with span("page_submit"):
+        job_id = get_job_queue().submit(
+            audio_bytes, phrase, language_code, priority=PRIORITY_INTERACTIVE, user_id=get_user_id()
+        )
+    st.session_state.pending_job = {
+        "id": job_id,
+        "phrase": phrase,
+        "language": language_code,
+        "audio_bytes": audio_bytes,
+        "effect": effect
+    }
+    st.session_state.job_outcome = None
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_pending_evaluation():
+    """Se refresca solo este fragmento hasta que la evaluación termina"""
+    pending = st.session_state.get("pending_job")
+    if not pending:
+        return
+
+    job = get_job_queue().get(pending["id"])
+    if job is not None and job["status"] not in FINISHED:
+        if job["status"] == "queued" and job.get("position"):
+            st.info(f"⏳ Evaluación en cola ({job['position']} por delante)...")
+        else:
+            st.info("⏳ Analizando pronunciación...")
+        return
+
+    if job is not None and job["success"]:
+        save_to_history(pending["phrase"], pending["language"], job["assessment"], pending["audio_bytes"])
+        outcome = {"success": True, "preprocessing": job["preprocessing"], "effect": pending["effect"]}
+    else:
+        outcome = {"success": False, "error": job["error"] if job else "La evaluación ya no existe"}
+
+    # Rerun completo: deja de consultar y muestra el resultado en la página
+    st.session_state.pending_job = None
+    st.session_state.job_outcome = outcome
+    st.rerun()
+
+
+def show_job_outcome():
+    """Resultado de la última evaluación terminada (se muestra una vez)"""
+    outcome = st.session_state.get("job_outcome")
+    if not outcome:
+        return
+    st.session_state.job_outcome = None
+    if outcome["success"]:
+        st.success("¡Evaluación completada!")
+        show_preprocessing(outcome["preprocessing"])
+        if outcome["effect"] == "balloons":
+            st.balloons()
+        else:
+            st.snow()
+    else:
+        st.error(f"❌ Error: {outcome.get('error') or 'Error desconocido'}")
+
+
+def show_preprocessing(report):
+    """Indica cuánto audio se ha ahorrado al normalizarlo antes de enviarlo"""
+    if report and (report["bytes_saved"] > 0 or report["seconds_saved"] > 0):
+        st.caption(
+            f"Audio optimizado antes del envío: {report['seconds_saved']:.1f} s de silencio recortados, "
+            f"{report['bytes_saved'] / 1024:.0f} KB menos"
+        )
 
 
 def main():
@@ -66,6 +101,9 @@ def main():
     selected_language = st.selectbox("Idioma para practicar:", list(LANGUAGE_OPTIONS.keys()))
     language_code = LANGUAGE_OPTIONS[selected_language]
 
+    # Abrir ya la conexión con Azure para este idioma, en segundo plano y una sola vez
+    evaluator.warm_up_in_background([language_code])
+
     # Selección de frase
     st.subheader("Selecciona una frase genérica para practicar")
     selected_phrase = st.selectbox("Frase modelo:", EXAMPLE_PHRASES[language_code])
@@ -118,52 +156,16 @@ def main():
 
             with col2:
                 if st.button("Evaluar Pronunciación", use_container_width=True, key="record_eval"):
-                    validation = validate_audio_bytes(st.session_state.audio_bytes)
+                    with span("validate"):
+                        validation = validate_audio_bytes(st.session_state.audio_bytes)
                     if validation["valid"]:
-                        with st.spinner("Analizando pronunciación..."):
-                            try:
-                                result = cached_evaluate(st.session_state.audio_bytes,
-                                                         selected_phrase,
-                                                         language_code)
-                                if result["success"]:
-                                    st.session_state.last_assessment = {
-                                        "phrase": selected_phrase,
-                                        "language": language_code,
-                                        "result": result,
-                                        "audio_bytes": st.session_state.audio_bytes
-                                    }
-                                    st.success("¡Evaluación completada!")
-                                    st.balloons()
-
-                                    if "pronunciation_history" not in st.session_state:
-                                        st.session_state.pronunciation_history = []
-
-                                    json_result = result.get("json_result", {})
-                                    nbest = json_result.get("NBest", [{}])[0]
-                                    pron = nbest.get("PronunciationAssessment", {})
-
-                                    entry = {
-                                        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                                        "phrase": selected_phrase,
-                                        "language": language_code,
-                                        "pron_score": round(pron.get("PronScore", 0), 1),
-                                        "accuracy_score": round(pron.get("AccuracyScore", 0), 1),
-                                        "fluency_score": round(pron.get("FluencyScore", 0), 1),
-                                        "completeness_score": round(pron.get("CompletenessScore", 0), 1),
-                                        "audio_bytes": audio_bytes,
-                                        "result": result
-                                    }
-
-                                    # Insertar al inicio
-                                    st.session_state.pronunciation_history.insert(0, entry)
-
-                                    # Limitar a 10 elementos
-                                    if len(st.session_state.pronunciation_history) > 10:
-                                        st.session_state.pronunciation_history.pop()
-                                else:
-                                    st.error(f"❌ Error: {result.get('error', 'Error desconocido')}")
-                            except Exception as e:
-                                st.error(f"❌ Error durante la evaluación: {str(e)}")
+                        try:
+                            submit_evaluation(st.session_state.audio_bytes,
+                                              selected_phrase,
+                                              language_code,
+                                              "balloons")
+                        except Exception as e:
+                            st.error(f"❌ Error durante la evaluación: {str(e)}")
                     else:
                         st.error(f"❌ {validation['error']}")
 
@@ -174,59 +176,26 @@ def main():
 
         if uploaded_file is not None:
             audio_bytes = uploaded_file.read()
-            validation = validate_audio_bytes(audio_bytes)
+            with span("validate"):
+                validation = validate_audio_bytes(audio_bytes)
 
             if validation["valid"]:
                 st.success("Archivo válido ✅")
                 st.audio(audio_bytes, format="audio/wav")
 
                 if st.button("Evaluar Pronunciación", use_container_width=True, key="upload_eval"):
-                    with st.spinner("Analizando tu pronunciación..."):
-                        try:
-                            result = cached_evaluate(audio_bytes, selected_phrase, language_code)
-                            if result["success"]:
-                                st.session_state.last_assessment = {
-                                    "phrase": selected_phrase,
-                                    "language": language_code,
-                                    "result": result,
-                                    "audio_bytes": audio_bytes
-                                }
-                                st.success("¡Evaluación completada!")
-                                st.snow()
-
-                                if "pronunciation_history" not in st.session_state:
-                                    st.session_state.pronunciation_history = []
-
-                                json_result = result.get("json_result", {})
-                                nbest = json_result.get("NBest", [{}])[0]
-                                pron = nbest.get("PronunciationAssessment", {})
-
-                                entry = {
-                                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                                    "phrase": selected_phrase,
-                                    "language": language_code,
-                                    "pron_score": round(pron.get("PronScore", 0), 1),
-                                    "accuracy_score": round(pron.get("AccuracyScore", 0), 1),
-                                    "fluency_score": round(pron.get("FluencyScore", 0), 1),
-                                    "completeness_score": round(pron.get("CompletenessScore", 0), 1),
-                                    "audio_bytes": audio_bytes,
-                                    "result": result
-                                }
-
-                                # Insertar al inicio
-                                st.session_state.pronunciation_history.insert(0, entry)
-
-                                # Limitar a 10 elementos
-                                if len(st.session_state.pronunciation_history) > 10:
-                                    st.session_state.pronunciation_history.pop()
-
-                            else:
-                                st.error(f"❌ Error: {result.get('error', 'Error desconocido')}")
-                        except Exception as e:
-                            st.error(f"❌ Error durante la evaluación: {str(e)}")
+                    try:
+                        submit_evaluation(audio_bytes, selected_phrase, language_code, "snow")
+                    except Exception as e:
+                        st.error(f"❌ Error durante la evaluación: {str(e)}")
             else:
                 st.error(f"❌ {validation['error']}")
 
+    # Evaluación en curso (se refresca sola) y resultado de la última
+    if st.session_state.get("pending_job"):
+        show_pending_evaluation()
+    show_job_outcome()
+
     st.markdown("\n---")
 
     # Navegación
@@ -244,4 +213,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    with profile_page("grabar_audio"):
+        main()
@@ -1,102 +1,44 @@
 import streamlit as st
-import matplotlib.pyplot as plt
-import time
+
+from app.services.history import get_history_store
+from app.services.metrics import span
+from app.services.profiling import profile_page
+from app.utils.charts import show_score_chart
+from app.utils.session import get_user_id, render_audio
 
 """
 Resultados de Pronunciación
 """
 
-if "pronunciation_history" not in st.session_state:
-    st.session_state.pronunciation_history = []
-
 if "selected_history_item" not in st.session_state:
     st.session_state.selected_history_item = None
 
-MAX_HISTORY = 10
-
-def save_to_history(assessment):
-    """Guarda una evaluación en el historial"""
-    try:
-        result = assessment["result"]
-
-        # Guardar audio_bytes si existe, para grabaciones custom
-        audio_bytes = assessment.get("audio_bytes")
-
-        json_result = result.get("json_result", {})
-        nbest = json_result.get("NBest", [{}])[0]
-        pronunciation = nbest.get("PronunciationAssessment", {})
-
-        entry = {
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "phrase": assessment.get("phrase", ""),
-            "language": assessment.get("language", ""),
-            "pron_score": round(float(pronunciation.get('PronScore', 0)), 1),
-            "accuracy_score": round(float(pronunciation.get('AccuracyScore', 0)), 1),
-            "fluency_score": round(float(pronunciation.get('FluencyScore', 0)), 1),
-            "completeness_score": round(float(pronunciation.get('CompletenessScore', 0)), 1),
-            "audio_bytes": audio_bytes,  # << aquí guardas el audio en bytes
-            "result": result
-        }
-
-        st.session_state.pronunciation_history.insert(0, entry)
-        if len(st.session_state.pronunciation_history) > MAX_HISTORY:
-            st.session_state.pronunciation_history.pop()
-
-    except Exception as e:
-        st.error(f"Error al guardar en historial: {str(e)}")
-
-def display_assessment_results(result, phrase, language):
-    """Muestra los resultados de una evaluación"""
-    if not result["success"]:
-        st.error(f"❌ Error en los resultados: {result.get('error', 'Error desconocido')}")
-        return False
-
-    json_result = result.get("json_result", {})
-    if not json_result:
+def display_assessment_results(assessment, phrase, language):
+    """Muestra los resultados de una evaluación (`AssessmentResult`)"""
+    if assessment is None:
         st.error("❌ No se obtuvieron resultados válidos de la evaluación.")
         return False
 
-    nbest = json_result.get("NBest", [{}])[0]
-    pronunciation = nbest.get("PronunciationAssessment", {})
-
     st.subheader("Puntuaciones Generales")
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("🎯 Score General", f"{pronunciation.get('PronScore', 0):.1f}/100")
+        st.metric("🎯 Score General", f"{assessment.pron_score:.1f}/100")
     with col2:
-        st.metric("🎯 Precisión", f"{pronunciation.get('AccuracyScore', 0):.1f}/100")
+        st.metric("🎯 Precisión", f"{assessment.accuracy_score:.1f}/100")
     with col3:
-        st.metric("⚡ Fluidez", f"{pronunciation.get('FluencyScore', 0):.1f}/100")
+        st.metric("⚡ Fluidez", f"{assessment.fluency_score:.1f}/100")
     with col4:
-        st.metric("✅ Completitud", f"{pronunciation.get('CompletenessScore', 0):.1f}/100")
+        st.metric("✅ Completitud", f"{assessment.completeness_score:.1f}/100")
 
     st.subheader("📈 Análisis Visual")
-    fig, ax = plt.subplots(figsize=(10, 4))
-    scores = [
-        pronunciation.get("PronScore", 0),
-        pronunciation.get("AccuracyScore", 0),
-        pronunciation.get("FluencyScore", 0),
-        pronunciation.get("CompletenessScore", 0)
-    ]
-    labels = ['General', 'Precisión', 'Fluidez', 'Completitud']
-    colors = ['#667eea', '#ff6b6b', '#48dbfb', '#1dd1a1']
-    bars = ax.bar(labels, scores, color=colors)
-    ax.set_ylim(0, 100)
-    for bar in bars:
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width() / 2., height + 1, f'{height:.1f}', ha='center', va='bottom', fontsize=9)
-    st.pyplot(fig)
-    plt.close()
+    show_score_chart(assessment.scores())
 
     # Análisis Detallado por palabra
     st.subheader("Análisis Detallado por Palabra")
-    words = nbest.get("Words", [])
-    if words:
-        for word in words:
-            word_text = word.get("Word", "")
-            word_assessment = word.get("PronunciationAssessment", {})
-            accuracy = word_assessment.get("AccuracyScore", 0)
-            error_type = word_assessment.get("ErrorType", "None")
+    if assessment.words:
+        for word in assessment.words:
+            accuracy = word.accuracy_score
+            error_type = word.error_type
             if accuracy >= 85:
                 emoji = "✅"
                 status = "Excelente"
@@ -107,16 +49,20 @@ def display_assessment_results(result, phrase, language):
                 emoji = "❌"
                 status = "Necesita mejora"
 
-            with st.expander(f"{emoji} **{word_text}** - {accuracy:.1f}/100 ({status})"):
+            with st.expander(f"{emoji} **{word.word}** - {accuracy:.1f}/100 ({status})"):
                 st.markdown(f"**Precisión:** {accuracy:.1f}/100")
                 st.markdown(f"**Tipo de error:** {error_type if error_type != 'None' else 'Ninguno'}")
+                if word.phonemes:
+                    st.markdown("**Fonemas:** " + " · ".join(
+                        f"`{p.phoneme}` {p.accuracy_score:.0f}" for p in word.phonemes
+                    ))
 
     # 💡 Sugerencias
     st.subheader("Sugerencias para Mejorar")
     suggestions = []
-    accuracy_score = pronunciation.get("AccuracyScore", 0)
-    fluency_score = pronunciation.get("FluencyScore", 0)
-    completeness_score = pronunciation.get("CompletenessScore", 0)
+    accuracy_score = assessment.accuracy_score
+    fluency_score = assessment.fluency_score
+    completeness_score = assessment.completeness_score
 
     if accuracy_score < 70:
         suggestions.append("🎯 Mejora tu precisión: Algunos sonidos no se pronunciaron claramente...")
@@ -145,42 +91,33 @@ def display_assessment_results(result, phrase, language):
 def main():
     st.title("Resultados de Pronunciación")
 
+    store = get_history_store()
+    user_id = get_user_id()
+
+    # Ítem seleccionado desde el historial o, si no, la evaluación más reciente
+    assessment = None
+    if st.session_state.get("selected_history_item") is not None:
+        assessment = store.get(user_id, st.session_state.selected_history_item)
+    if assessment is None:
+        assessment = store.latest(user_id)
+
     # 🔑 Verificar que haya una evaluación reciente o un ítem seleccionado del historial
-    if not st.session_state.get("last_assessment") and not st.session_state.pronunciation_history:
+    if assessment is None:
         st.info("⚠️ No hay resultados aún. Por favor, graba y evalúa una frase primero.")
         if st.button("🎙️ Practicar una frase", use_container_width=True):
             st.switch_page("pages/1_grabar_audio.py")
 
         st.stop()  # Detiene la ejecución aquí
 
-    assessment = st.session_state.get("last_assessment")
-
-    # Solo guardar si venimos de una nueva evaluación, no del historial
-    if "selected_history_item" not in st.session_state or st.session_state.selected_history_item is None:
-        if not st.session_state.pronunciation_history or \
-                (st.session_state.pronunciation_history[0].get("audio_bytes") != assessment.get("audio_bytes")):
-            save_to_history(assessment)
-
-    if st.session_state.get("selected_history_item") is not None:
-        assessment = st.session_state.pronunciation_history[st.session_state.selected_history_item]
-    else:
-        assessment = st.session_state.last_assessment
-        # Aquí solo guardar si es nueva evaluación
-        if not st.session_state.pronunciation_history or \
-                (st.session_state.pronunciation_history[0].get("audio_bytes") != assessment.get("audio_bytes")):
-            save_to_history(assessment)
-
     phrase = assessment["phrase"]
     language = assessment["language"]
-    result = assessment["result"]
 
     st.markdown(f"**Frase:** `{phrase}`")
     st.markdown(f"**Idioma:** `{language}`")
 
-    display_assessment_results(result, phrase, language)
-    audio_bytes = assessment.get("audio_bytes")
-    if audio_bytes:
-        st.audio(audio_bytes, format="audio/wav")
+    with span("display_results"):
+        display_assessment_results(assessment.get("assessment"), phrase, language)
+    render_audio(assessment.get("audio_ref"))
 
     # Navegación
     st.markdown("---")
@@ -197,5 +134,6 @@ def main():
             st.switch_page("main.py")
 
 if __name__ == "__main__":
-    main()
+    with profile_page("resultados"):
+        main()
 
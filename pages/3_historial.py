@@ -1,5 +1,9 @@
 import streamlit as st
-import matplotlib.pyplot as plt
+
+from app.services.history import get_history_store
+from app.services.profiling import profile_page
+from app.utils.charts import show_score_chart
+from app.utils.session import get_user_id, render_audio
 
 
 """
@@ -15,71 +19,74 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Inicializar historial si no existe
-if "pronunciation_history" not in st.session_state:
-    st.session_state.pronunciation_history = []
-
-history = st.session_state.pronunciation_history
-
-if not history:
-    st.info("No hay evaluaciones guardadas. Ve a **Grabar Audio**.")
-    if st.button("🎙️ Ir a Grabar Audio", use_container_width=True):
-        st.switch_page("pages/1_grabar_audio.py")
-    st.stop()
-
-# Crear tabs para cada evaluación
-tab_labels = [
-    f"{i+1}. {e['timestamp'].split()[1]} - {e['pron_score']}/100"
-    for i, e in enumerate(history)
-]
-tabs = st.tabs(tab_labels)
-
-for i, (tab, entry) in enumerate(zip(tabs, history)):
-    with tab:
+# Evaluaciones por página: solo se leen del almacén las de la página actual
+PAGE_SIZE = 20
+
+
+def main():
+    store = get_history_store()
+    user_id = get_user_id()
+    total = store.count(user_id)
+
+    if not total:
+        st.info("No hay evaluaciones guardadas. Ve a **Grabar Audio**.")
+        if st.button("🎙️ Ir a Grabar Audio", use_container_width=True):
+            st.switch_page("pages/1_grabar_audio.py")
+        st.stop()
+
+    page_count = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    page = 1
+    if page_count > 1:
+        page = int(st.number_input("Página", min_value=1, max_value=page_count, value=1, step=1))
+    offset = (page - 1) * PAGE_SIZE
+    history = store.list(user_id, limit=PAGE_SIZE, offset=offset)
+    st.caption(f"{total} evaluaciones · página {page} de {page_count}")
+
+    col_list, col_detail = st.columns([1, 2])
+
+    # Lista compacta de la página; el detalle se dibuja solo para la seleccionada
+    with col_list:
+        i = st.radio(
+            "Evaluaciones",
+            range(len(history)),
+            format_func=lambda i: f"{offset + i + 1}. {history[i]['timestamp']} - {history[i]['assessment'].pron_score:.1f}/100",
+            key=f"history_entry_{page}"
+        )
+
+    entry = history[i or 0]
+    with col_detail:
         st.markdown(f"### Fecha: `{entry.get('timestamp','')}`")
         st.markdown(f"**Frase:** `{entry.get('phrase','')}`")
         st.markdown(f"**Idioma:** `{entry.get('language','')}`")
-        st.markdown(f"**Score General:** `{entry.get('pron_score',0)}/100`")
-
-        scores = [
-            entry.get('pron_score', 0),
-            entry.get('accuracy_score', 0),
-            entry.get('fluency_score', 0),
-            entry.get('completeness_score', 0)
-        ]
-        labels = ['General', 'Precisión', 'Fluidez', 'Completitud']
-
-        # Gráfico de puntuaciones
-        fig, ax = plt.subplots(figsize=(6, 2))
-        ax.bar(labels, scores, color=['#667eea', '#ff6b6b', '#48dbfb', '#1dd1a1'])
-        ax.set_ylim(0, 100)
-        ax.set_title('Resumen de puntuaciones', fontsize=9)
-        for idx, val in enumerate(scores):
-            ax.text(idx, val + 1, f"{val:.1f}", ha='center', va='bottom', fontsize=9)
-        st.pyplot(fig)
-        plt.close()
-
-        # Reproducir audio (bytes) si existe
-        audio_bytes = entry.get("audio_bytes")
-        if audio_bytes:
-            st.audio(audio_bytes, format="audio/wav")
-
-        if st.button("Ver resultados de esta evaluación concreta", key=f"to_result_{i}"):
-            st.session_state.last_assessment = entry
-            st.session_state.selected_history_item = i
+        assessment = entry["assessment"]
+        st.markdown(f"**Score General:** `{assessment.pron_score:.1f}/100`")
+
+        # Gráfico de puntuaciones (cacheado por puntuaciones)
+        show_score_chart(assessment.scores(), size="small", title="Resumen de puntuaciones")
+
+        # Reproducir audio (comprimido) si existe
+        render_audio(entry.get("audio_ref"))
+
+        if st.button("Ver resultados de esta evaluación concreta", key=f"to_result_{entry['id']}"):
+            st.session_state.selected_history_item = entry["id"]
 
             st.switch_page("pages/2_resultados.py")
 
             st.rerun()
 
 
-st.markdown("---")
+    st.markdown("---")
+
+    # Navegación
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("🎙️ Practicar Otra Frase", use_container_width=True):
+            st.switch_page("pages/1_grabar_audio.py")
+    with col2:
+        if st.button("🏠 Volver al Inicio", use_container_width=True):
+            st.switch_page("main.py")
+
 
-# Navegación
-col1, col2, col3 = st.columns(3)
-with col1:
-    if st.button("🎙️ Practicar Otra Frase", use_container_width=True):
-        st.switch_page("pages/1_grabar_audio.py")
-with col2:
-    if st.button("🏠 Volver al Inicio", use_container_width=True):
-        st.switch_page("main.py")
+if __name__ == "__main__":
+    with profile_page("historial"):
+        main()
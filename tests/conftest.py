@@ -0,0 +1,47 @@
+"""
+Utilidades comunes de las pruebas: audios sintéticos y un evaluador sobre el
+backend local (`FakeSpeechBackend`), sin Azure ni red.
+"""
+
+import math
+import os
+import struct
+import sys
+
+import pytest
+
+# `app` es un paquete de espacio de nombres en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.backends import FakeSpeechBackend  # noqa: E402
+from app.services.scheduler import SpeechScheduler  # noqa: E402
+from app.services.speech import PronunciationEvaluator  # noqa: E402
+from app.utils.wav import build_wav  # noqa: E402
+
+
+def make_wav(seconds=1.0, frequency=440.0, sample_rate=16000):
+    """WAV PCM 16 bits mono con un tono (frecuencias distintas dan audios distintos)"""
+    samples = int(seconds * sample_rate)
+    pcm = struct.pack(
+        f"<{samples}h",
+        *(int(8000 * math.sin(2 * math.pi * frequency * i / sample_rate)) for i in range(samples))
+    )
+    return build_wav(pcm, sample_rate, 16, 1)
+
+
+@pytest.fixture
+def wav():
+    return make_wav()
+
+
+@pytest.fixture
+def fake_backend():
+    return FakeSpeechBackend(latency=0.0, jitter=0.0, seed=1)
+
+
+@pytest.fixture
+def evaluator(fake_backend):
+    """Evaluador sin caché ni preprocesado sobre el backend local"""
+    return PronunciationEvaluator(
+        backend=fake_backend, cache=None, preprocess=False, scheduler=SpeechScheduler(max_concurrency=4)
+    )
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from tornado.testing import AsyncHTTPTestCase
+
+from app.api.server import is_loopback, main, make_app, user_token
+from app.services.history import InMemoryHistoryStore
+
+from conftest import make_wav
+
+TOKEN = "secreto"
+
+
+@pytest.fixture
+def _evaluator(request, evaluator):
+    request.instance.evaluator = evaluator
+
+
+@pytest.mark.usefixtures("_evaluator")
+class ApiTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.history = InMemoryHistoryStore()
+        return make_app(evaluator=self.evaluator, history=self.history, api_token=TOKEN)
+
+    def call(self, method, path, token=TOKEN, body=None):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = self.fetch(path, method=method, headers=headers, body=body, raise_error=False)
+        return response.code, json.loads(response.body) if response.body else None
+
+    def evaluate(self, token, query="phrase=hello&user_id=alumno01"):
+        return self.call("POST", f"/v1/evaluate?{query}", token, make_wav())
+
+    def test_requires_token(self):
+        assert self.call("GET", "/v1/history/alumno01", token=None)[0] == 401
+        assert self.call("GET", "/v1/history/alumno01", token="otro")[0] == 401
+        assert self.call("GET", "/health", token=None)[0] == 200
+
+    def test_admin_token_reaches_every_user(self):
+        status, body = self.evaluate(TOKEN)
+        assert status == 200 and body["history_id"]
+        status, body = self.call("GET", "/v1/history/alumno01")
+        assert status == 200 and body["total"] == 1
+
+    def test_user_token_is_scoped_to_its_user(self):
+        own = user_token(TOKEN, "alumno01")
+        assert self.evaluate(own)[0] == 200
+        assert self.call("GET", "/v1/history/alumno01", own)[1]["total"] == 1
+
+        other = user_token(TOKEN, "alumno02")
+        assert self.call("GET", "/v1/history/alumno01", other)[0] == 403
+        assert self.call("GET", "/v1/history/alumno01/1", other)[0] == 403
+        assert self.call("DELETE", "/v1/history/alumno01", other)[0] == 403
+        assert self.evaluate(other)[0] == 403
+        assert self.history.count("alumno01") == 1
+
+    def test_user_token_saves_to_its_own_history(self):
+        status, body = self.evaluate(user_token(TOKEN, "alumno02"), query="phrase=hello")
+        assert status == 200
+        assert self.history.get("alumno02", body["history_id"]) is not None
+
+    def test_forged_user_token_is_rejected(self):
+        forged = "alumno01." + user_token(TOKEN, "alumno02").rpartition(".")[2]
+        assert self.call("GET", "/v1/history/alumno01", forged)[0] == 401
+
+
+def test_refuses_public_address_without_token(monkeypatch):
+    monkeypatch.delenv("API_TOKEN", raising=False)
+    with pytest.raises(SystemExit):
+        main(["--address", "0.0.0.0"])
+
+
+def test_loopback_addresses():
+    assert is_loopback("127.0.0.1") and is_loopback("::1") and is_loopback("localhost")
+    assert not is_loopback("0.0.0.0") and not is_loopback("10.0.0.5")
+
+
+@pytest.mark.usefixtures("_evaluator")
+class MultipartTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return make_app(evaluator=self.evaluator, history=InMemoryHistoryStore(), api_token="")
+
+    def test_multipart_form(self):
+        boundary = "limite"
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"phrase\"\r\n\r\nhello world\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"audio\"; filename=\"a.wav\"\r\n"
+            "Content-Type: audio/wav\r\n\r\n"
+        ).encode() + make_wav() + f"\r\n--{boundary}--\r\n".encode()
+        response = self.fetch(
+            "/v1/evaluate", method="POST", body=body,
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        )
+        payload = json.loads(response.body)
+        assert response.code == 200, payload
+        assert payload["phrase"] == "hello world"
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.backends import FakeSpeechBackend, LazySpeechBackend
+from app.utils.wav import parse_wav_header
+
+
+async def max_loop_lag(coroutine, interval=0.01):
+    """Mayor retraso del event loop mientras se ejecuta `coroutine`"""
+    lags = []
+
+    async def ticker():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - start - interval)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    try:
+        result = await coroutine
+        # Deja que el ticker mida el último intervalo
+        await asyncio.sleep(3 * interval)
+    finally:
+        task.cancel()
+    return result, max(lags, default=0.0)
+
+
+def test_lazy_backend_is_created_off_the_event_loop(wav):
+    def factory():
+        # Como importar el SDK de Azure
+        time.sleep(0.3)
+        return FakeSpeechBackend(latency=0.0, jitter=0.0)
+
+    backend = LazySpeechBackend("fake", factory)
+    info = parse_wav_header(wav)
+    result, lag = asyncio.run(max_loop_lag(backend.assess_async(wav, info, "hello", "en-US")))
+
+    assert result["success"]
+    assert lag < 0.15
+
+
+def test_azure_prepares_recognizer_off_the_event_loop(wav, monkeypatch):
+    pytest.importorskip("azure.cognitiveservices.speech")
+    from app.services.azure_backend import AzureSpeechBackend
+
+    backend = AzureSpeechBackend("clave", "westeurope")
+    loop_thread = threading.get_ident()
+    prepared_in = []
+
+    class Recognizer:
+        def recognize_once_async(self):
+            raise RuntimeError("sin conexión")
+
+    def prepare(*args):
+        prepared_in.append(threading.get_ident())
+        return Recognizer(), {"codec": None, "bytes": 0}
+
+    monkeypatch.setattr(backend, "_prepare_recognizer", prepare)
+    with pytest.raises(RuntimeError):
+        asyncio.run(backend.assess_async(wav, parse_wav_header(wav), "hello", "en-US"))
+    assert prepared_in and prepared_in[0] != loop_thread
+
+
+def test_incomplete_backends_fail_at_construction():
+    from app.services.audio_store import AudioStore
+    from app.services.backends import SpeechBackend
+    from app.services.history import HistoryStore
+
+    class NoAssess(SpeechBackend):
+        name = "incompleto"
+
+    class NoClear(HistoryStore):
+        def add(self, *args, **kwargs): ...
+        def list(self, *args, **kwargs): ...
+        def get(self, *args, **kwargs): ...
+        def count(self, *args, **kwargs): ...
+
+    class NoRead(AudioStore):
+        def _contains(self, ref): ...
+        def _write(self, ref, codec, data): ...
+        def _delete(self, ref): ...
+
+    for incomplete in (NoAssess, NoClear, NoRead):
+        with pytest.raises(TypeError):
+            incomplete()
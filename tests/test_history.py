@@ -0,0 +1,66 @@
+import pytest
+
+from app.services.assessment import AssessmentResult
+from app.services.backends import fake_assessment_json
+from app.services.history import InMemoryHistoryStore, KeyValueHistoryStore, SQLiteHistoryStore
+from app.utils.wav import parse_wav_header
+
+
+@pytest.fixture
+def assessment(wav):
+    return AssessmentResult.from_json(fake_assessment_json(wav, parse_wav_header(wav), "hello", "en-US"))
+
+
+@pytest.fixture(params=["memory", "sqlite", "kv"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteHistoryStore(str(tmp_path / "history.sqlite3"), max_entries=3)
+    if request.param == "kv":
+        return KeyValueHistoryStore(max_entries=3)
+    return InMemoryHistoryStore(max_entries=3)
+
+
+def test_list_is_newest_first_and_trimmed(store, assessment):
+    ids = [store.add("u1", f"frase {i}", "en-US", assessment)["id"] for i in range(5)]
+    store.add("u2", "otra", "es-ES", assessment)
+
+    assert [e["id"] for e in store.list("u1")] == ids[:1:-1]
+    assert store.count("u1") == 3
+    assert store.count("u2", language="es-ES") == 1
+    assert store.latest("u1")["phrase"] == "frase 4"
+
+
+def test_clear_only_removes_that_user(store, assessment):
+    store.add("u1", "hola", "es-ES", assessment)
+    store.add("u2", "hola", "es-ES", assessment)
+    store.clear("u1")
+
+    assert store.list("u1") == []
+    assert store.count("u2") == 1
+
+
+def test_memory_store_evicts_least_recently_used_users(assessment):
+    store = InMemoryHistoryStore(max_entries=10, max_total=4)
+    for user in ("u1", "u2", "u3"):
+        store.add(user, "hola", "es-ES", assessment)
+        store.add(user, "adiós", "es-ES", assessment)
+    # Al escribir u3 se supera el total y se descarta u1, el menos reciente
+    assert store.count("u1") == 0
+    # Leer u2 lo marca como usado: al escribir u4 se descarta u3
+    store.list("u2")
+    store.add("u4", "hola", "es-ES", assessment)
+
+    assert store.count("u2") == 2 and store.count("u4") == 1 and store.count("u3") == 0
+    assert store.total == 3
+
+
+def test_memory_store_returns_copies(assessment):
+    store = InMemoryHistoryStore()
+    entry = store.add("u1", "hola", "es-ES", assessment)
+    entry["phrase"] = "cambiada"
+    store.list("u1")[0]["phrase"] = "cambiada"
+    store.list("u1").clear()
+    store.get("u1", entry["id"])["phrase"] = "cambiada"
+
+    assert store.get("u1", entry["id"])["phrase"] == "hola"
+    assert store.count("u1") == 1
@@ -0,0 +1,137 @@
+import os
+import socket
+import time
+
+import pytest
+
+from app.services.audio_store import MemoryAudioStore
+from app.services.jobs import FINISHED, JobQueue, JobWorkerPool, default_audio_path
+
+from conftest import make_wav
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+def wait_finished(queue, job_id, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in FINISHED:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"El trabajo {job_id} no ha terminado")
+
+
+def test_claim_takes_highest_priority_then_oldest(queue_path, wav):
+    queue = JobQueue(queue_path)
+    low = queue.submit(wav, "hello", "en-US", priority=0)
+    first = queue.submit(wav, "hello", "en-US", priority=10)
+    second = queue.submit(wav, "hello", "en-US", priority=10)
+
+    assert [queue.claim()["id"] for _ in range(3)] == [first, second, low]
+    assert queue.claim() is None
+
+
+def test_queued_position(queue_path, wav):
+    queue = JobQueue(queue_path)
+    queue.submit(wav, "hello", "en-US")
+    job_id = queue.submit(wav, "hello", "en-US")
+    urgent = queue.submit(wav, "hello", "en-US", priority=10)
+
+    assert queue.get(job_id)["position"] == 2
+    assert queue.get(urgent)["position"] == 0
+
+
+def test_worker_completes_job(queue_path, wav, evaluator):
+    queue = JobQueue(queue_path)
+    job_id = queue.submit(wav, "hello world", "en-US")
+    JobWorkerPool(queue, evaluator).run_job(queue.claim())
+
+    job = queue.get(job_id)
+    assert job["status"] == "done"
+    assert job["success"]
+    assert [w.word for w in job["assessment"].words] == ["hello", "world"]
+
+
+def test_complete_after_timeout_is_discarded(queue_path, wav, evaluator):
+    queue = JobQueue(queue_path)
+    job_id = queue.submit(wav, "hello", "en-US", timeout=0.05)
+    job = queue.claim()
+    time.sleep(0.1)
+
+    assert queue.get(job_id)["status"] == "timeout"
+    assert not queue.complete(job_id, evaluator.evaluate_pronunciation_bytes(wav, "hello"))
+    assert queue.get(job_id)["status"] == "timeout"
+    assert queue.audio(job) is None
+
+
+def test_expired_job_is_not_claimed(queue_path, wav):
+    queue = JobQueue(queue_path)
+    job_id = queue.submit(wav, "hello", "en-US", timeout=0.01)
+    time.sleep(0.05)
+
+    assert queue.claim() is None
+    assert queue.expire() == 1
+    assert queue.get(job_id)["status"] == "timeout"
+
+
+def test_orphan_of_dead_process_is_requeued(queue_path, wav):
+    queue = JobQueue(queue_path)
+    job_id = queue.submit(wav, "hello", "en-US")
+    # Mismo host y PID pero otro proceso (p. ej. el contenedor antes de reiniciarse)
+    queue.claim(worker=f"{socket.gethostname()}:{os.getpid()}:0000")
+    assert queue.get(job_id)["status"] == "running"
+
+    queue.expire()
+    assert queue.get(job_id)["status"] == "queued"
+    assert queue.claim()["id"] == job_id
+
+
+def test_running_job_of_this_process_is_not_requeued(queue_path, wav):
+    queue = JobQueue(queue_path)
+    job_id = queue.submit(wav, "hello", "en-US")
+    queue.claim()
+
+    queue.expire()
+    assert queue.get(job_id)["status"] == "running"
+
+
+def test_job_survives_restart(queue_path, evaluator):
+    audio = make_wav(frequency=523.0)
+    job_id = JobQueue(queue_path).submit(audio, "hello world", "en-US")
+
+    # Nueva cola sobre el mismo archivo, como tras reiniciar el proceso
+    queue = JobQueue(queue_path)
+    pool = JobWorkerPool(queue, evaluator, workers=1).start()
+    try:
+        job = wait_finished(queue, job_id)
+    finally:
+        pool.stop(timeout=5)
+
+    assert job["status"] == "done", job["error"]
+    expected = evaluator.evaluate_pronunciation_bytes(audio, "hello world", "en-US")
+    assert job["assessment"].pron_score == expected["assessment"].pron_score
+
+
+def test_audio_is_kept_verbatim_until_finished(queue_path, wav):
+    queue = JobQueue(queue_path)
+    first = queue.submit(wav, "hello", "en-US")
+    second = queue.submit(wav, "hello", "en-US")
+
+    job = queue.claim()
+    assert queue.audio(job) == wav
+    assert os.listdir(default_audio_path(queue_path))
+
+    queue.fail(first, "error")
+    # El otro trabajo usa el mismo audio
+    assert queue.audio(queue.claim()) == wav
+    queue.fail(second, "error")
+    assert queue.audio(job) is None
+
+
+def test_memory_audio_store_is_rejected(queue_path):
+    with pytest.raises(ValueError):
+        JobQueue(queue_path, audio_store=MemoryAudioStore())
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+recognizers = pytest.importorskip("app.services.recognizers")
+
+
+class Connection:
+
+    def __init__(self):
+        self.closed = False
+
+    def open(self, for_continuous_recognition):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class StubFactory(recognizers.RecognizerFactory):
+    """Reconocedores y conexiones de mentira: cuenta cuántos se crean"""
+
+    def __init__(self, **kwargs):
+        super().__init__("clave", "westeurope", **kwargs)
+        self.built = 0
+        self.connections = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def _build(self, language, fmt):
+        self.gate.wait(5)
+        self.built += 1
+        return object(), recognizers.MemoryAudioCallback()
+
+
+@pytest.fixture(autouse=True)
+def stub_connections(monkeypatch):
+    def from_recognizer(recognizer):
+        return Connection()
+
+    monkeypatch.setattr(recognizers.speechsdk.Connection, "from_recognizer", staticmethod(from_recognizer))
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_acquire_uses_warm_recognizer_and_replenishes():
+    factory = StubFactory()
+    factory.warm_up("en-US")
+    warm = factory._warm[("en-US", recognizers.DEFAULT_STREAM_FORMAT)][0]
+
+    recognizer, _ = factory.acquire("en-US", recognizers.DEFAULT_STREAM_FORMAT)
+    assert recognizer is warm.recognizer
+    wait_until(lambda: factory._warm[("en-US", recognizers.DEFAULT_STREAM_FORMAT)])
+    assert factory.built == 2
+
+
+def test_acquire_skips_expired_connections():
+    factory = StubFactory(warm_ttl=0.05)
+    factory.warm_up("en-US")
+    stale = factory._warm[("en-US", recognizers.DEFAULT_STREAM_FORMAT)][0]
+    time.sleep(0.1)
+
+    recognizer, _ = factory.acquire("en-US", recognizers.DEFAULT_STREAM_FORMAT)
+    assert recognizer is not stale.recognizer
+    assert stale.connection.closed
+
+
+def test_replenishment_is_coalesced_per_key():
+    factory = StubFactory(pool_size=1)
+    key = ("en-US", recognizers.DEFAULT_STREAM_FORMAT)
+    factory.warm_up("en-US")
+    factory.gate.clear()
+
+    # El primer acquire lanza la reposición, que se queda bloqueada en _build
+    factory.acquire(*key)
+    for _ in range(5):
+        factory._warm[key].append(recognizers._WarmRecognizer(object(), None, Connection()))
+        factory.acquire(*key)
+    assert factory._replenishing == {key}
+
+    factory.gate.set()
+    wait_until(lambda: not factory._replenishing)
+    # 1 del warm_up inicial + una sola reposición
+    assert factory.built == 2
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.backends import FakeSpeechBackend, error_result
+from app.services.router import Endpoint, RouterBackend
+from app.utils.wav import parse_wav_header
+
+
+class RejectingBackend(FakeSpeechBackend):
+    """Falla siempre por la petición: excepción del SDK o resultado NoMatch"""
+
+    def __init__(self, raises=True):
+        super().__init__(latency=0.0, jitter=0.0)
+        self.raises = raises
+
+    def assess(self, audio_bytes, info, reference_text, language, continuous=False):
+        self.calls += 1
+        if self.raises:
+            raise RuntimeError("Stream de audio no válido")
+        return error_result("No se pudo reconocer el habla.", reason="NoMatch")
+
+    async def assess_async(self, audio_bytes, info, reference_text, language, continuous=False):
+        return self.assess(audio_bytes, info, reference_text, language, continuous)
+
+
+def fake(latency=0.0, error_rate=0.0, throttle_rate=0.0):
+    return FakeSpeechBackend(latency=latency, jitter=0.0, error_rate=error_rate, throttle_rate=throttle_rate, seed=1)
+
+
+def router(*backends, **kwargs):
+    return RouterBackend([Endpoint(f"e{i}", b) for i, b in enumerate(backends)], **kwargs)
+
+
+@pytest.fixture
+def request_args(wav):
+    return wav, parse_wav_header(wav), "hello", "en-US"
+
+
+def test_least_outstanding_spreads_concurrent_requests(request_args):
+    backends = [fake(latency=0.05) for _ in range(3)]
+    routed = router(*backends)
+
+    async def burst():
+        return await asyncio.gather(*(routed.assess_async(*request_args) for _ in range(6)))
+
+    results = asyncio.run(burst())
+    assert all(r["success"] for r in results)
+    assert [b.calls for b in backends] == [2, 2, 2]
+
+
+def test_latency_strategy_prefers_fast_endpoint(request_args):
+    slow, quick = fake(latency=0.05), fake(latency=0.0)
+    routed = router(slow, quick, strategy="latency")
+    for _ in range(2):
+        # Primero se mide cada endpoint una vez
+        routed.assess(*request_args)
+    quick_before = quick.calls
+    for _ in range(5):
+        assert routed.assess(*request_args)["endpoint"] == "e1"
+    assert quick.calls == quick_before + 5
+
+
+def test_failover_and_cooldown(request_args):
+    broken, healthy = fake(throttle_rate=1.0), fake()
+    routed = router(broken, healthy, failure_threshold=2, cooldown=0.2)
+
+    for _ in range(2):
+        # least_outstanding: a igualdad prueba primero e0, que falla, y pasa a e1
+        result = routed.assess(*request_args)
+        assert result["success"] and result["endpoint"] == "e1"
+    assert broken.calls == 2
+    assert not routed.stats()["e0"]["healthy"]
+
+    # Fuera del reparto: no se prueba durante el reposo
+    routed.assess(*request_args)
+    assert broken.calls == 2
+
+    time.sleep(0.25)
+    routed.assess(*request_args)
+    assert broken.calls == 3
+
+
+def test_all_endpoints_failing_returns_last_error(request_args):
+    routed = router(fake(error_rate=1.0), fake(error_rate=1.0))
+    result = routed.assess(*request_args)
+
+    assert not result["success"]
+    assert result["error_code"] == "ConnectionFailure"
+    assert routed.stats()["e0"]["failures"] == routed.stats()["e1"]["failures"] == 1
+
+
+@pytest.mark.parametrize("raises", [True, False])
+def test_request_error_does_not_fail_over(request_args, raises):
+    rejecting, other = RejectingBackend(raises=raises), fake()
+    routed = router(rejecting, other, failure_threshold=1)
+
+    if raises:
+        with pytest.raises(RuntimeError):
+            routed.assess(*request_args)
+    else:
+        assert routed.assess(*request_args)["cancellation_reason"] == "NoMatch"
+
+    assert other.calls == 0
+    stats = routed.stats()["e0"]
+    assert stats["healthy"] and stats["failures"] == 0 and stats["outstanding"] == 0
+
+
+def test_request_error_does_not_fail_over_async(request_args):
+    rejecting, other = RejectingBackend(), fake()
+    routed = router(rejecting, other, failure_threshold=1)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(routed.assess_async(*request_args))
+    assert other.calls == 0
+    assert routed.stats()["e0"]["healthy"]
+
+
+def test_network_error_fails_over(request_args):
+    class Unreachable(FakeSpeechBackend):
+        def assess(self, *args, **kwargs):
+            raise ConnectionResetError("conexión cerrada")
+
+    routed = router(Unreachable(), fake())
+    assert routed.assess(*request_args)["endpoint"] == "e1"
+    assert routed.stats()["e0"]["failures"] == 1
@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.backends import FakeSpeechBackend
+from app.services.router import Endpoint, RouterBackend
+from app.services.scheduler import CircuitBreaker, ConcurrencySlots, RetryPolicy, SpeechScheduler
+from app.services.speech import PronunciationEvaluator
+from app.utils.wav import parse_wav_header
+
+
+def start_waiter(slots, order, name, priority=0, timeout=5.0):
+    def run():
+        if slots.acquire(time.monotonic() + timeout, priority):
+            order.append(name)
+
+    waiting = slots.waiting()
+    thread = threading.Thread(target=run)
+    thread.start()
+    # Llegan a la cola en el orden en que se lanzan
+    deadline = time.monotonic() + 2
+    while slots.waiting() == waiting and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return thread
+
+
+def drain(slots, order, count):
+    for expected in range(1, count + 1):
+        slots.release()
+        deadline = time.monotonic() + 2
+        while len(order) < expected and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+
+def test_waiters_are_served_in_arrival_order():
+    slots = ConcurrencySlots(1)
+    assert slots.try_acquire()
+    order = []
+    threads = [start_waiter(slots, order, name) for name in "abcd"]
+    drain(slots, order, 4)
+    for thread in threads:
+        thread.join()
+
+    assert order == list("abcd")
+
+
+def test_higher_priority_is_served_first():
+    slots = ConcurrencySlots(1)
+    assert slots.try_acquire()
+    order = []
+    threads = [
+        start_waiter(slots, order, "lote-1"),
+        start_waiter(slots, order, "lote-2"),
+        start_waiter(slots, order, "interactiva", priority=10),
+    ]
+    drain(slots, order, 3)
+    for thread in threads:
+        thread.join()
+
+    assert order == ["interactiva", "lote-1", "lote-2"]
+
+
+def test_timeout_leaves_the_queue_without_losing_slots():
+    slots = ConcurrencySlots(1)
+    assert slots.try_acquire()
+    assert not slots.acquire(time.monotonic() + 0.05)
+    slots.release()
+
+    assert slots.free == 1 and slots.waiting() == 0
+
+
+def test_coroutines_and_threads_share_the_queue():
+    slots = ConcurrencySlots(1)
+    assert slots.try_acquire()
+    order = []
+    thread = start_waiter(slots, order, "hilo")
+
+    async def coroutine():
+        acquire = asyncio.ensure_future(slots.acquire_async(time.monotonic() + 5))
+        while slots.waiting() < 2:
+            await asyncio.sleep(0.001)
+        released = time.monotonic()
+        # Primero el hilo, que llegó antes
+        await asyncio.to_thread(slots.release)
+        await asyncio.to_thread(thread.join)
+        slots.release()
+        assert await acquire
+        order.append("corrutina")
+        return time.monotonic() - released
+
+    elapsed = asyncio.run(coroutine())
+    assert order == ["hilo", "corrutina"]
+    # Se despierta al liberar, sin sondeos
+    assert elapsed < 0.05
+
+
+def test_cancelled_coroutine_does_not_keep_the_slot():
+    slots = ConcurrencySlots(1)
+    assert slots.try_acquire()
+
+    async def cancel():
+        task = asyncio.ensure_future(slots.acquire_async(time.monotonic() + 5))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+    slots.release()
+    assert slots.free == 1
+
+
+def test_scheduler_retries_transient_errors(wav):
+    backend = FakeSpeechBackend(latency=0.0, jitter=0.0, throttle_rate=1.0)
+    scheduler = SpeechScheduler(retry=RetryPolicy(max_attempts=3, base_delay=0.0), breaker=CircuitBreaker(threshold=0))
+    info = parse_wav_header(wav)
+    result, _ = scheduler.run(lambda: backend.assess(wav, info, "hello", "en-US"))
+
+    assert result["error_code"] == "TooManyRequests"
+    assert result["attempts"] == 3 and backend.calls == 3
+
+
+class CountingLimiter:
+
+    def __init__(self, allow=True):
+        self.allow = allow
+        self.taken = 0
+
+    def take_token(self):
+        self.taken += 1
+        return self.allow
+
+    async def take_token_async(self):
+        return self.take_token()
+
+
+def routed(limiter):
+    backends = [FakeSpeechBackend(latency=0.0, jitter=0.0, error_rate=1.0) for _ in range(2)]
+    backends.append(FakeSpeechBackend(latency=0.0, jitter=0.0))
+    router = RouterBackend([Endpoint(f"e{i}", b) for i, b in enumerate(backends)])
+    router.limiter = limiter
+    return router, backends
+
+
+def test_each_failover_takes_a_token(wav):
+    limiter = CountingLimiter()
+    router, backends = routed(limiter)
+    result = router.assess(wav, parse_wav_header(wav), "hello", "en-US")
+
+    assert result["success"] and result["endpoint"] == "e2"
+    assert limiter.taken == 2
+
+
+def test_failover_stops_without_quota(wav):
+    limiter = CountingLimiter(allow=False)
+    router, backends = routed(limiter)
+    result = asyncio.run(router.assess_async(wav, parse_wav_header(wav), "hello", "en-US"))
+
+    assert result["error_code"] == "ConnectionFailure" and result["endpoint"] == "e0"
+    assert backends[1].calls == backends[2].calls == 0
+    assert all(s["outstanding"] == 0 for s in router.stats().values())
+
+
+def test_evaluator_charges_router_failovers_to_its_scheduler():
+    router = RouterBackend([Endpoint("e0", FakeSpeechBackend())])
+    evaluator = PronunciationEvaluator(backend=router, cache=None, preprocess=False)
+
+    assert router.limiter is evaluator.scheduler
+
+
+def test_token_bucket_limits_failovers(wav):
+    scheduler = SpeechScheduler(rate=1000, burst=1)
+    router, _ = routed(scheduler)
+    info = parse_wav_header(wav)
+
+    # Ráfaga de 1: los dos failovers tienen que esperar cada uno su token (1 ms a 1000/s)
+    start = time.monotonic()
+    result, _ = scheduler.run(lambda: router.assess(wav, info, "hello", "en-US"))
+    assert result["success"]
+    assert time.monotonic() - start >= 0.002
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("azure.cognitiveservices.speech")
+pytest.importorskip("soundfile")
+
+from app.services.backends import FakeSpeechBackend  # noqa: E402
+from app.services.transport import TransportPolicy, encode_for_transport, is_codec_error, loopback  # noqa: E402
+from app.utils.wav import parse_wav_header  # noqa: E402
+
+from conftest import make_wav  # noqa: E402
+
+GSTREAMER_ERROR = (
+    "No se pudo reconocer el habla. Cancelado: CancellationReason.Error"
+    " - Error: Failed to initialize GStreamer: compressed container not supported"
+)
+REFERENCE_ERROR = (
+    "No se pudo reconocer el habla. Cancelado: CancellationReason.Error"
+    " - Error: Invalid reference text"
+)
+
+
+@pytest.fixture
+def long_wav():
+    return make_wav(seconds=3.0)
+
+
+def backend(codec_error=None, code="BadRequest"):
+    policy = TransportPolicy("flac", min_duration=0, min_bytes=0)
+    return FakeSpeechBackend(
+        latency=0.0, jitter=0.0, transport=policy, codec_error=codec_error, codec_error_code=code
+    )
+
+
+def assess(fake, audio):
+    return fake.assess(audio, parse_wav_header(audio), "hello", "en-US")
+
+
+def test_compressed_send(long_wav):
+    fake = backend()
+    result = assess(fake, long_wav)
+
+    assert result["success"]
+    assert result["transport"]["codec"] == "flac"
+    assert result["transport"]["bytes"] < parse_wav_header(long_wav)["data_size"]
+
+
+@pytest.mark.parametrize("code", ["BadRequest", "RuntimeError"])
+def test_codec_failure_falls_back_to_pcm_and_disables_compression(long_wav, code):
+    fake = backend(GSTREAMER_ERROR, code)
+    result = assess(fake, long_wav)
+
+    assert result["success"]
+    assert result["transport"]["codec"] is None
+    assert fake.calls == 2
+    assert fake.transport.codec is None
+    assert fake.transport.disabled_reason == GSTREAMER_ERROR
+
+    # Las siguientes peticiones van directamente en PCM
+    assess(fake, long_wav)
+    assert fake.calls == 3
+
+
+def test_other_failure_retries_that_request_in_pcm_only(long_wav):
+    fake = backend(REFERENCE_ERROR)
+    result = assess(fake, long_wav)
+
+    assert result["success"]
+    assert result["transport"]["codec"] is None
+    assert fake.transport.codec == "flac"
+    assert fake.transport.disabled_reason is None
+
+
+def test_fallback_async(long_wav):
+    fake = backend(GSTREAMER_ERROR)
+    result = asyncio.run(fake.assess_async(long_wav, parse_wav_header(long_wav), "hello", "en-US"))
+
+    assert result["success"] and result["transport"]["codec"] is None
+    assert fake.transport.codec is None
+
+
+def test_throttling_is_not_a_transport_failure(long_wav):
+    fake = backend()
+    fake.throttle_rate = 1.0
+    result = assess(fake, long_wav)
+
+    assert result["error_code"] == "TooManyRequests"
+    assert result["transport"]["codec"] == "flac"
+    assert fake.calls == 1
+
+
+def test_codec_error_detection():
+    assert is_codec_error(GSTREAMER_ERROR)
+    assert not is_codec_error(REFERENCE_ERROR)
+    assert not is_codec_error(None)
+
+
+@pytest.mark.parametrize("codec", ["flac", "opus"])
+def test_loopback_receiver_decodes_what_was_sent(long_wav, codec):
+    report = loopback(long_wav, codec)
+
+    assert report["codec"] == codec
+    assert report["bytes"] == len(encode_for_transport(long_wav, codec))
+    assert report["duration"] == pytest.approx(3.0, abs=0.05)